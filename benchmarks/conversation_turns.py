@@ -0,0 +1,479 @@
+"""Drive conversation turns against a local fake Yandex Cloud gRPC server.
+
+Run from the repository root:
+
+    python benchmarks/conversation_turns.py
+    python benchmarks/conversation_turns.py --scenario voice --turns 200 --concurrency 4
+
+Each scenario is answered by fake_yandex.py with its own reply length,
+chunking, delays, tool calls and injected errors. Two modes are measured:
+
+- "sdk" streams completions with the bare SDK client and is the floor the
+  integration is measured against, like the "source" row of stream_deltas.py;
+- "entity" sets up the integration in a test Home Assistant instance and
+  sends every turn through conversation.async_converse, so StreamTransformer,
+  ContentConverter, the tool loop, admission and retries all take part. It
+  needs the packages of benchmarks/requirements.txt and is skipped without
+  them. Turns come from the origin of the scenario: a voice satellite
+  device, a logged in user or an automation.
+
+Time to first token comes from the SDK stream, or the integration's own
+"ttft" stage in entity mode. Event loop blocking is the lateness of a task
+ticking every few milliseconds. Allocations are measured in a separate,
+shorter pass with tracemalloc: peak and retained KiB of this process, the
+fake server runs in its own and isn't counted. Model calls are
+completions served by the fake server in all passes, counting retries and
+tool call rounds. Per-stage timings of the entity are printed from its
+latency histograms.
+
+To compare a change against a baseline, save results before it and compare
+after it; the script exits with an error if a metric got worse by more than
+the threshold:
+
+    git stash && python benchmarks/conversation_turns.py --save /tmp/before.json
+    git stash pop && python benchmarks/conversation_turns.py --compare /tmp/before.json
+
+Set --delay-scale 0 to take the fake network out and measure CPU overhead only.
+"""
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+import argparse
+import asyncio
+import gc
+import importlib.util
+import json
+import shutil
+import statistics
+import sys
+import tempfile
+import tracemalloc
+from collections.abc import Awaitable, Callable
+from contextlib import asynccontextmanager, nullcontext
+from dataclasses import dataclass, replace
+from functools import partial
+from pathlib import Path
+from time import monotonic
+from unittest.mock import patch
+
+from grpc.aio import AioRpcError
+from yandex_ai_studio_sdk import AsyncAIStudio
+
+from fake_yandex import FakeYandexServer, Scenario
+
+ROOT = Path(__file__).parents[1]
+PACKAGE = "custom_components.yandexgpt_conversation"
+DOMAIN = "yandexgpt_conversation"
+
+DATA = {"folder_id": "b1gexample", "api_key": "AQVNexample"}
+OPTIONS = {
+    "prompt": "Ты голосовой ассистент умного дома.",
+    "llm_hass_api": ["benchmark"],
+    "chat_model": "yandexgpt/latest",
+    "keepalive_interval": 0,
+}
+REQUEST = "Включи свет на кухне и расскажи рецепт омлета"
+BENCHMARK_TOOLS = 20
+
+# Name: fake server scenario, execution mode and origin of entity turns
+SCENARIOS = {
+    "voice": (Scenario(reply_chars=120, chunk_chars=16, first_token_delay=0.15, chunk_delay=0.01), "streaming",
+              "voice"),
+    "long": (Scenario(reply_chars=4000, chunk_chars=40, first_token_delay=0.3, chunk_delay=0.005), "streaming",
+             "interactive"),
+    "tools": (Scenario(reply_chars=120, chunk_chars=16, first_token_delay=0.15, chunk_delay=0.01,
+                       tool_calls=1), "streaming", "voice"),
+    "deferred": (Scenario(reply_chars=400, chunk_chars=20, first_token_delay=0.2, chunk_delay=0.005), "deferred",
+                 "automation"),
+    # Seeded so that errors come early, even in short runs
+    "flaky": (Scenario(reply_chars=120, chunk_chars=16, first_token_delay=0.15, chunk_delay=0.01,
+                       error_rate=0.2, error_after_chunks=2, seed=1), "streaming", "voice"),
+}
+WARMUP_TURNS = 3
+ALLOCATION_TURNS = 20
+DEFERRED_POLL_INTERVAL = 0.05
+LOOP_TICK = 0.005
+# Lateness of a tick below this is scheduling noise
+BLOCKED_THRESHOLD = 0.005
+# Metrics where more is better, the rest are better lower
+HIGHER_IS_BETTER = {"turns_per_s", "chars_per_s"}
+
+
+@dataclass
+class TurnResult:
+    latency: float
+    ttft: float | None
+    chars: int
+    failed: bool = False
+
+
+class LoopMonitor:
+    """Measure how long the event loop is blocked by lateness of a ticking task."""
+
+    def __init__(self) -> None:
+        self.blocked = 0.0
+        self.max_lag = 0.0
+        self._task: asyncio.Task | None = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(LOOP_TICK)
+            lag = loop.time() - start - LOOP_TICK
+            if lag > BLOCKED_THRESHOLD:
+                self.blocked += lag
+                self.max_lag = max(self.max_lag, lag)
+
+    def __enter__(self) -> "LoopMonitor":
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        assert self._task
+        self._task.cancel()
+
+
+async def run_turns(turn: Callable[[int], Awaitable[TurnResult]], turns: int, concurrency: int) -> list[TurnResult]:
+    """Run turns from concurrent workers, each gets the index of its worker."""
+    remaining = iter(range(turns))
+    results: list[TurnResult] = []
+
+    async def worker(index: int) -> None:
+        for _ in remaining:
+            results.append(await turn(index))
+
+    await asyncio.gather(*(worker(index) for index in range(concurrency)))
+    return results
+
+
+def percentile(samples: list[float], value: int) -> float:
+    if len(samples) < 2:
+        return samples[0] if samples else 0.0
+    return statistics.quantiles(samples, n=100, method="inclusive")[value - 1]
+
+
+async def measure(
+    turn: Callable[[int], Awaitable[TurnResult]],
+    turns: int,
+    concurrency: int,
+    first_tokens: list[float] | None = None,
+) -> dict[str, float]:
+    """Warm up, then time the turns and measure their allocations.
+
+    first_tokens is filled with time to first token by the caller when turns
+    can't tell it themselves.
+    """
+    await run_turns(turn, WARMUP_TURNS, 1)
+    if first_tokens is not None:
+        first_tokens.clear()
+
+    with LoopMonitor() as monitor:
+        started = monotonic()
+        results = await run_turns(turn, turns, concurrency)
+        elapsed = monotonic() - started
+    succeeded = [result for result in results if not result.failed]
+    if first_tokens is not None:
+        ttfts = list(first_tokens)
+    else:
+        ttfts = [result.ttft for result in succeeded if result.ttft is not None]
+
+    gc.collect()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    await run_turns(turn, min(turns, ALLOCATION_TURNS), concurrency)
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies = [result.latency for result in succeeded]
+    return {
+        "ttft_p50_ms": percentile(ttfts, 50) * 1e3,
+        "ttft_p95_ms": percentile(ttfts, 95) * 1e3,
+        "turn_p50_ms": percentile(latencies, 50) * 1e3,
+        "turn_p95_ms": percentile(latencies, 95) * 1e3,
+        "turns_per_s": len(succeeded) / elapsed,
+        "chars_per_s": sum(result.chars for result in succeeded) / elapsed,
+        "failed": len(results) - len(succeeded),
+        "blocked_ms": monitor.blocked * 1e3,
+        "max_lag_ms": monitor.max_lag * 1e3,
+        "peak_kib": (peak - before) / 1024,
+        "retained_kib": (retained - before) / 1024,
+    }
+
+
+async def measure_sdk(
+    server: FakeYandexServer, execution_mode: str, turns: int, concurrency: int
+) -> dict[str, float]:
+    """Measure completions of the bare SDK client."""
+    client = AsyncAIStudio(
+        folder_id=DATA["folder_id"], auth=DATA["api_key"], endpoint=None, service_map=server.service_map, verify=False)
+    model = client.models.completions("yandexgpt", model_version="latest").configure(temperature=0.3)
+    messages = [{"role": "system", "text": OPTIONS["prompt"]}, {"role": "user", "text": REQUEST}]
+
+    async def turn(_worker: int) -> TurnResult:
+        started = monotonic()
+        ttft = None
+        try:
+            if execution_mode == "deferred":
+                operation = await model.run_deferred(messages)
+                result = await operation.wait(poll_interval=DEFERRED_POLL_INTERVAL)
+                ttft = monotonic() - started
+            else:
+                async for result in model.run_stream(messages):
+                    if ttft is None:
+                        ttft = monotonic() - started
+        except AioRpcError:
+            return TurnResult(monotonic() - started, None, 0, failed=True)
+        return TurnResult(monotonic() - started, ttft, len(result.alternatives[0].text))
+
+    try:
+        return await measure(turn, turns, concurrency)
+    finally:
+        for channel in list(client._client._channels.values()):
+            await channel.close()
+
+
+@asynccontextmanager
+async def home_assistant():
+    """Yield a test Home Assistant instance with the integration loadable."""
+    from homeassistant import loader
+    from homeassistant.setup import async_setup_component
+    from pytest_homeassistant_custom_component.common import \
+        async_test_home_assistant
+
+    sys.path.insert(0, str(ROOT))
+    # The test config has its own custom_components package, which would shadow the repository's
+    importlib.import_module("custom_components")
+    with tempfile.TemporaryDirectory() as config_dir:
+        async with async_test_home_assistant(config_dir=config_dir) as hass:
+            # Test instances don't load custom integrations unless asked to
+            hass.data.pop(loader.DATA_CUSTOM_COMPONENTS, None)
+            assert await async_setup_component(hass, "homeassistant", {})
+            register_benchmark_api(hass)
+            yield hass
+            await hass.async_stop(force=True)
+
+
+def register_benchmark_api(hass) -> None:
+    """Register an LLM API with tools answering instantly."""
+    import voluptuous as vol
+    from homeassistant.helpers import llm
+
+    class BenchmarkTool(llm.Tool):
+        parameters = vol.Schema({})
+
+        def __init__(self, index: int) -> None:
+            self.name = f"BenchmarkTool{index}"
+            self.description = f"Turns on device number {index} in the benchmark home"
+
+        async def async_call(self, hass, tool_input, llm_context):
+            return {"success": True, "result": {"name": self.name, "state": "on"}}
+
+    class BenchmarkAPI(llm.API):
+        async def async_get_api_instance(self, llm_context):
+            return llm.APIInstance(
+                api=self,
+                api_prompt="Call the tools to control the benchmark home.",
+                llm_context=llm_context,
+                tools=[BenchmarkTool(index) for index in range(BENCHMARK_TOOLS)],
+            )
+
+    llm.async_register_api(hass, BenchmarkAPI(hass=hass, id="benchmark", name="Benchmark"))
+
+
+async def measure_entity(
+    hass,
+    server: FakeYandexServer,
+    execution_mode: str,
+    origin: str,
+    turns: int,
+    concurrency: int,
+    history: int,
+    trace_turns: bool = False,
+) -> tuple[dict[str, float], dict[str, float]]:
+    """Measure turns of the conversation entity, return metrics and per-stage p50.
+
+    Every worker keeps its conversation going for history turns, then starts a new one.
+    With trace_turns, turns are also written as Chrome traces, failing if none show up.
+    """
+    from homeassistant.components import conversation
+    from homeassistant.core import Context
+    from homeassistant.helpers import device_registry as dr
+    from homeassistant.helpers import entity_registry as er
+    from homeassistant.helpers import intent
+    from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+    from custom_components.yandexgpt_conversation.metrics import TRACES_DIR
+
+    traces = Path(hass.config.path(TRACES_DIR))
+    shutil.rmtree(traces, ignore_errors=True)
+    options = {**OPTIONS, "execution_mode": execution_mode, "trace_turns": trace_turns}
+    entry = MockConfigEntry(domain=DOMAIN, data=DATA, options=options)
+    entry.add_to_hass(hass)
+    client_class = partial(AsyncAIStudio, endpoint=None, service_map=server.service_map, verify=False)
+    with patch(f"{PACKAGE}.client.AsyncAIStudio", client_class):
+        assert await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+    agent_id = er.async_get(hass).async_get_entity_id("conversation", DOMAIN, entry.entry_id)
+    metrics = entry.runtime_data.metrics
+    conversations: dict[int, tuple[str | None, int]] = {}
+
+    # The integration tells origins apart by the device or user behind a request
+    device_id = user_id = None
+    if origin == "voice":
+        device_id = dr.async_get(hass).async_get_or_create(
+            config_entry_id=entry.entry_id, identifiers={("benchmark", "satellite")}, name="Kitchen satellite").id
+    elif origin == "interactive":
+        user_id = (await hass.auth.async_create_user("Benchmark")).id
+
+    async def turn(worker: int) -> TurnResult:
+        conversation_id, length = conversations.get(worker, (None, 0))
+        if length >= history:
+            conversation_id, length = None, 0
+        started = monotonic()
+        result = await conversation.async_converse(
+            hass, REQUEST, conversation_id, Context(user_id=user_id), agent_id=agent_id, device_id=device_id)
+        latency = monotonic() - started
+        if result.response.response_type == intent.IntentResponseType.ERROR:
+            return TurnResult(latency, None, 0, failed=True)
+        conversations[worker] = (result.conversation_id, length + 1)
+        return TurnResult(latency, None, len(result.response.speech["plain"]["speech"]))
+
+    # Every completed turn records one time to first token, summed over tool call rounds
+    first_tokens: list[float] = []
+    ttft = metrics.histograms["ttft"]
+    recorded = ttft.count
+
+    def record_ttft() -> None:
+        nonlocal recorded
+        if ttft.count > recorded:
+            recorded = ttft.count
+            first_tokens.append(ttft.samples[-1])
+
+    remove_listener = metrics.async_add_listener(record_ttft)
+    try:
+        results = await measure(turn, turns, concurrency, first_tokens)
+        if trace_turns:
+            await hass.async_block_till_done()
+            written = sorted(traces.glob("*.json"))
+            if not written:
+                raise RuntimeError(f"Turns were traced, but nothing was written to {traces}")
+            # Must be a valid Chrome trace
+            assert json.loads(written[-1].read_text(encoding="utf-8"))["traceEvents"]
+    finally:
+        remove_listener()
+        await hass.config_entries.async_unload(entry.entry_id)
+    return results, {stage: histogram.percentile(50) or 0.0 for stage, histogram in metrics.histograms.items()}
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> bool:
+    """Print changes against the baseline, return True if something got worse than the threshold."""
+    regressed = False
+    print(f"\n{'scenario':<10}{'mode':<8}{'metric':<14}{'baseline':>12}{'now':>12}{'change':>9}")
+    for name, modes in results.items():
+        for mode, metrics in modes.items():
+            base = baseline.get(name, {}).get(mode)
+            if base is None:
+                continue
+            for metric, value in metrics.items():
+                if not base.get(metric):
+                    continue
+                change = (value - base[metric]) / base[metric]
+                worse = -change if metric in HIGHER_IS_BETTER else change
+                flag = "  worse" if worse > threshold else ""
+                regressed |= bool(flag)
+                print(f"{name:<10}{mode:<8}{metric:<14}{base[metric]:>12.1f}{value:>12.1f}{change:>+9.0%}{flag}")
+    return regressed
+
+
+def print_results(name: str, mode: str, metrics: dict[str, float]) -> None:
+    print(
+        f"{name:<10}{mode:<8}"
+        f"{metrics['ttft_p50_ms']:>8.1f}{metrics['ttft_p95_ms']:>8.1f}"
+        f"{metrics['turn_p50_ms']:>8.1f}{metrics['turn_p95_ms']:>8.1f}"
+        f"{metrics['turns_per_s']:>8.1f}{metrics['chars_per_s']:>10.0f}{metrics['failed']:>7.0f}"
+        f"{metrics['blocked_ms']:>9.1f}{metrics['max_lag_ms']:>8.1f}"
+        f"{metrics['peak_kib']:>9.0f}{metrics['retained_kib']:>9.0f}{metrics['completions']:>7.0f}"
+    )
+
+
+async def run(args: argparse.Namespace) -> dict:
+    entity = args.mode in ("entity", "all")
+    if entity and importlib.util.find_spec("pytest_homeassistant_custom_component") is None:
+        print("pytest-homeassistant-custom-component isn't installed, skipping the entity")
+        entity = False
+
+    overrides = {
+        key: value for key, value in (
+            ("reply_chars", args.reply_chars),
+            ("chunk_chars", args.chunk_chars),
+            ("tool_calls", args.tool_calls),
+            ("error_rate", args.error_rate),
+        ) if value is not None
+    }
+    results: dict[str, dict[str, dict[str, float]]] = {}
+    stages: dict[str, dict[str, float]] = {}
+
+    print(f"{'':<18}{'ttft, ms':>16}{'turn, ms':>16}{'turns':>8}{'chars':>10}{'':>7}"
+          f"{'loop, ms':>17}{'KiB':>18}{'model':>7}")
+    print(f"{'scenario':<10}{'mode':<8}{'p50':>8}{'p95':>8}{'p50':>8}{'p95':>8}{'/s':>8}{'/s':>10}{'failed':>7}"
+          f"{'blocked':>9}{'max':>8}{'peak':>9}{'retained':>9}{'calls':>7}")
+    with FakeYandexServer() as server:
+        async with (home_assistant() if entity else nullcontext()) as hass:
+            for name in args.scenario or SCENARIOS:
+                scenario, execution_mode, origin = SCENARIOS[name]
+                scenario = replace(scenario.scaled(args.delay_scale), **overrides)
+                results[name] = {}
+                if args.mode in ("sdk", "all"):
+                    server.use(scenario)
+                    results[name]["sdk"] = await measure_sdk(server, execution_mode, args.turns, args.concurrency)
+                    results[name]["sdk"]["completions"] = server.stats().completions
+                    print_results(name, "sdk", results[name]["sdk"])
+                if entity:
+                    server.use(scenario)
+                    results[name]["entity"], stages[name] = await measure_entity(
+                        hass, server, execution_mode, origin, args.turns, args.concurrency, args.history,
+                        args.trace_turns)
+                    results[name]["entity"]["completions"] = server.stats().completions
+                    print_results(name, "entity", results[name]["entity"])
+
+    if stages:
+        names = list(next(iter(stages.values())))
+        print(f"\n{'p50, ms':<10}" + "".join(f"{stage:>{len(stage) + 2}}" for stage in names))
+        for name, durations in stages.items():
+            print(f"{name:<10}" + "".join(f"{durations[stage] * 1e3:>{len(stage) + 2}.1f}" for stage in names))
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="run only these scenarios")
+    parser.add_argument("--mode", choices=("sdk", "entity", "all"), default="all")
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--history", type=int, default=5, help="turns per conversation in entity mode")
+    parser.add_argument(
+        "--trace-turns", action="store_true", help="write turn traces in entity mode, checking they are written")
+    parser.add_argument("--delay-scale", type=float, default=1.0, help="multiply delays of the fake server")
+    parser.add_argument("--reply-chars", type=int)
+    parser.add_argument("--chunk-chars", type=int)
+    parser.add_argument("--tool-calls", type=int)
+    parser.add_argument("--error-rate", type=float)
+    parser.add_argument("--save", type=Path, help="save results as a baseline")
+    parser.add_argument("--compare", type=Path, help="compare results with a saved baseline")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative change counted as worse")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    if args.save:
+        args.save.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    if args.compare:
+        return 1 if compare(results, json.loads(args.compare.read_text(encoding="utf-8")), args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,339 @@
+"""A local stand-in for the Yandex Cloud completions gRPC API.
+
+Used by conversation_turns.py, not run directly. The server speaks the
+streaming and deferred completions, operations and tokenizer services, so
+an AsyncAIStudio client pointed at it with service_map behaves as it does
+against Yandex Cloud: text is streamed cumulatively in chunks, tool calls
+come as a single final chunk and deferred completions are polled through
+OperationService.Get.
+
+The server runs in its own process, so its delays and work don't show up
+as blocking of the event loop being measured.
+"""
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+import asyncio
+import multiprocessing
+import random
+import uuid
+from dataclasses import dataclass, field, replace
+from multiprocessing.connection import Connection
+from time import monotonic
+
+import grpc
+from google.protobuf.any_pb2 import Any
+from google.protobuf.json_format import ParseDict
+from google.protobuf.struct_pb2 import Struct
+from yandex.cloud.ai.foundation_models.v1.text_common_pb2 import (Alternative,
+                                                                  ContentUsage,
+                                                                  FunctionCall,
+                                                                  Message,
+                                                                  Token,
+                                                                  ToolCall,
+                                                                  ToolCallList)
+from yandex.cloud.ai.foundation_models.v1.text_generation import \
+    text_generation_service_pb2_grpc as generation_grpc
+from yandex.cloud.ai.foundation_models.v1.text_generation.text_generation_service_pb2 import (
+    CompletionRequest, CompletionResponse, TokenizeResponse)
+from yandex.cloud.operation import operation_service_pb2_grpc as operation_grpc
+from yandex.cloud.operation.operation_pb2 import Operation
+
+WORDS = ("Нарежьте", "лук", "кубиками", "и", "обжарьте", "до", "золотистого", "цвета", "🍳", "минут", "5–7")
+# Rough length of a token of Russian text
+CHARS_PER_TOKEN = 4
+
+
+@dataclass
+class Scenario:
+    """How the fake server answers, delays are in seconds."""
+
+    reply_chars: int = 400
+    chunk_chars: int = 20
+    first_token_delay: float = 0.2
+    chunk_delay: float = 0.02
+    # Tool call rounds before the text reply, each calls the first tool of the request
+    tool_calls: int = 0
+    tool_arguments: dict = field(default_factory=dict)
+    # Share of completion requests failing with error_code, after error_after_chunks chunks
+    error_rate: float = 0.0
+    error_code: grpc.StatusCode = grpc.StatusCode.UNAVAILABLE
+    error_after_chunks: int = 0
+    seed: int = 0
+
+    def scaled(self, factor: float) -> "Scenario":
+        """Return the scenario with delays multiplied by factor."""
+        return replace(
+            self, first_token_delay=self.first_token_delay * factor, chunk_delay=self.chunk_delay * factor)
+
+
+@dataclass
+class ServerStats:
+    """Calls served by the fake server."""
+
+    completions: int = 0
+    tool_calls: int = 0
+    errors: int = 0
+    operations: int = 0
+    polls: int = 0
+    tokenizations: int = 0
+
+
+def reply_text(chars: int) -> str:
+    words: list[str] = []
+    length = 0
+    while length < chars:
+        word = WORDS[len(words) % len(WORDS)]
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)[:chars]
+
+
+def _tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _pending_tool_rounds(request: CompletionRequest) -> int:
+    """Return how many tool results follow the last user message."""
+    rounds = 0
+    for message in reversed(request.messages):
+        if message.role == "user":
+            break
+        if message.HasField("tool_result_list"):
+            rounds += 1
+    return rounds
+
+
+class _Completions:
+    """Build responses of a scenario for a request."""
+
+    def __init__(self, server: "_ServerState") -> None:
+        self.server = server
+        self.random = random.Random(server.scenario.seed)
+
+    def should_fail(self) -> bool:
+        scenario = self.server.scenario
+        return bool(scenario.error_rate) and self.random.random() < scenario.error_rate
+
+    def tool_call(self, request: CompletionRequest) -> CompletionResponse | None:
+        """Return a tool call if the scenario wants one more round."""
+        scenario = self.server.scenario
+        if not request.tools or _pending_tool_rounds(request) >= scenario.tool_calls:
+            return None
+
+        self.server.stats.tool_calls += 1
+        arguments = ParseDict(scenario.tool_arguments, Struct())
+        call = ToolCall(function_call=FunctionCall(name=request.tools[0].function.name, arguments=arguments))
+        return self.response(
+            request,
+            Message(role="assistant", tool_call_list=ToolCallList(tool_calls=[call])),
+            Alternative.ALTERNATIVE_STATUS_TOOL_CALLS,
+            _tokens(str(scenario.tool_arguments)),
+        )
+
+    def chunks(self, request: CompletionRequest) -> list[CompletionResponse]:
+        """Return cumulative text chunks, the last one final."""
+        scenario = self.server.scenario
+        text = reply_text(scenario.reply_chars)
+        step = max(scenario.chunk_chars, 1)
+        ends = [*range(step, len(text), step), len(text)]
+        return [
+            self.response(
+                request,
+                Message(role="assistant", text=text[:end]),
+                Alternative.ALTERNATIVE_STATUS_FINAL if end == len(text) else Alternative.ALTERNATIVE_STATUS_PARTIAL,
+                _tokens(text[:end]),
+            )
+            for end in ends
+        ]
+
+    @staticmethod
+    def response(
+        request: CompletionRequest, message: Message, status: int, completion_tokens: int
+    ) -> CompletionResponse:
+        input_tokens = sum(_tokens(message.text) for message in request.messages)
+        return CompletionResponse(
+            alternatives=[Alternative(message=message, status=status)],
+            usage=ContentUsage(
+                input_text_tokens=input_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=input_tokens + completion_tokens,
+            ),
+            model_version="fake",
+        )
+
+
+class _TextGenerationService(generation_grpc.TextGenerationServiceServicer):
+    def __init__(self, server: "_ServerState") -> None:
+        self.server = server
+
+    async def Completion(self, request, context):  # noqa: N802
+        server = self.server
+        scenario = server.scenario
+        server.stats.completions += 1
+        fail = server.completions.should_fail()
+
+        await asyncio.sleep(scenario.first_token_delay)
+        if tool_call := server.completions.tool_call(request):
+            chunks = [tool_call]
+        else:
+            chunks = server.completions.chunks(request)
+
+        for index, chunk in enumerate(chunks):
+            if fail and index == scenario.error_after_chunks:
+                server.stats.errors += 1
+                await context.abort(scenario.error_code, "Injected by the fake server")
+            if index:
+                await asyncio.sleep(scenario.chunk_delay)
+            yield chunk
+
+
+class _TextGenerationAsyncService(generation_grpc.TextGenerationAsyncServiceServicer):
+    def __init__(self, server: "_ServerState") -> None:
+        self.server = server
+
+    async def Completion(self, request, context):  # noqa: N802
+        server = self.server
+        scenario = server.scenario
+        server.stats.completions += 1
+        if server.completions.should_fail():
+            server.stats.errors += 1
+            await context.abort(scenario.error_code, "Injected by the fake server")
+
+        response = server.completions.tool_call(request)
+        if response is None:
+            chunks = server.completions.chunks(request)
+            response = chunks[-1]
+            duration = scenario.first_token_delay + scenario.chunk_delay * (len(chunks) - 1)
+        else:
+            duration = scenario.first_token_delay
+
+        server.stats.operations += 1
+        operation_id = uuid.uuid4().hex
+        server.operations[operation_id] = (monotonic() + duration, response)
+        return Operation(id=operation_id, description="Async GPT Completion", done=False)
+
+
+class _OperationService(operation_grpc.OperationServiceServicer):
+    def __init__(self, server: "_ServerState") -> None:
+        self.server = server
+
+    async def Get(self, request, context):  # noqa: N802
+        self.server.stats.polls += 1
+        if (pending := self.server.operations.get(request.operation_id)) is None:
+            await context.abort(grpc.StatusCode.NOT_FOUND, f"Operation {request.operation_id} not found")
+
+        ready_at, response = pending
+        if monotonic() < ready_at:
+            return Operation(id=request.operation_id, done=False)
+
+        packed = Any()
+        packed.Pack(response)
+        return Operation(id=request.operation_id, done=True, response=packed)
+
+
+class _TokenizerService(generation_grpc.TokenizerServiceServicer):
+    def __init__(self, server: "_ServerState") -> None:
+        self.server = server
+
+    async def TokenizeCompletion(self, request, context):  # noqa: N802
+        self.server.stats.tokenizations += 1
+        count = sum(_tokens(message.text) for message in request.messages)
+        return TokenizeResponse(tokens=[Token(id=index) for index in range(count)], model_version="fake")
+
+
+class _ServerState:
+    """Scenario and bookkeeping of the server process."""
+
+    def __init__(self) -> None:
+        self.operations: dict[str, tuple[float, CompletionResponse]] = {}
+        self.use(Scenario())
+
+    def use(self, scenario: Scenario) -> None:
+        self.scenario = scenario
+        self.stats = ServerStats()
+        self.completions = _Completions(self)
+        self.operations.clear()
+
+
+async def _async_serve(connection: Connection) -> None:
+    """Serve until told to stop, answering commands of the parent."""
+    state = _ServerState()
+    server = grpc.aio.server()
+    generation_grpc.add_TextGenerationServiceServicer_to_server(_TextGenerationService(state), server)
+    generation_grpc.add_TextGenerationAsyncServiceServicer_to_server(_TextGenerationAsyncService(state), server)
+    generation_grpc.add_TokenizerServiceServicer_to_server(_TokenizerService(state), server)
+    operation_grpc.add_OperationServiceServicer_to_server(_OperationService(state), server)
+    port = server.add_insecure_port("127.0.0.1:0")
+    await server.start()
+    connection.send(port)
+
+    loop = asyncio.get_running_loop()
+    while True:
+        command, argument = await loop.run_in_executor(None, connection.recv)
+        if command == "use":
+            state.use(argument)
+            connection.send(None)
+        elif command == "stats":
+            connection.send(state.stats)
+        elif command == "stop":
+            await server.stop(None)
+            connection.send(None)
+            return
+
+
+def _serve(connection: Connection) -> None:
+    asyncio.run(_async_serve(connection))
+
+
+class FakeYandexServer:
+    """Serve scenarios on a local port from a separate process.
+
+    The process keeps the server's work and the GIL away from the event loop
+    being measured, as well as its allocations out of tracemalloc.
+    """
+
+    def __init__(self) -> None:
+        self.port = 0
+        self._connection: Connection | None = None
+        self._process: multiprocessing.process.BaseProcess | None = None
+
+    @property
+    def service_map(self) -> dict[str, str]:
+        """Return the service_map pointing an AsyncAIStudio client at the server."""
+        address = f"127.0.0.1:{self.port}"
+        return {"ai-foundation-models": address, "operation": address}
+
+    def use(self, scenario: Scenario) -> None:
+        """Answer the following requests with a scenario, resetting stats."""
+        self._call("use", scenario)
+
+    def stats(self) -> ServerStats:
+        """Return calls served since the scenario was set."""
+        return self._call("stats")
+
+    def start(self) -> None:
+        context = multiprocessing.get_context("spawn")
+        self._connection, child = context.Pipe()
+        self._process = context.Process(target=_serve, args=(child,), name="fake-yandex", daemon=True)
+        self._process.start()
+        self.port = self._connection.recv()
+
+    def stop(self) -> None:
+        assert self._process
+        self._call("stop")
+        self._process.join()
+
+    def __enter__(self) -> "FakeYandexServer":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def _call(self, command: str, argument: object = None):
+        assert self._connection
+        self._connection.send((command, argument))
+        return self._connection.recv()
@@ -0,0 +1,69 @@
+"""Measure import time of the SDK and guard the integration's light modules.
+
+Run from the repository root:
+
+    python benchmarks/import_time.py
+
+Each module is imported in a fresh interpreter with -X importtime. The
+integration package, its config flow and constants are imported while Home
+Assistant loads the integration, so they must not pull in the SDK, gRPC or
+protobuf; the script exits with an error if they do. Checking them needs
+Home Assistant installed, otherwise only the SDK cost is reported.
+"""
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+import importlib.util
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parents[1]
+PACKAGE = "custom_components.yandexgpt_conversation"
+
+HEAVY = ("yandex_ai_studio_sdk", "grpc", "google.protobuf")
+REFERENCE = ("grpc", "google.protobuf", "yandex_ai_studio_sdk")
+LIGHT = (PACKAGE, f"{PACKAGE}.config_flow", f"{PACKAGE}.const")
+
+
+def import_times(module: str) -> dict[str, int]:
+    """Return cumulative import time in µs of every module imported along with module."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True, check=False,
+    )
+    if result.returncode:
+        raise ImportError(result.stderr.strip().splitlines()[-1])
+
+    times: dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = (part.strip() for part in line.removeprefix("import time:").split("|"))
+        times[name] = int(cumulative)
+    return times
+
+
+def main() -> int:
+    print(f"{'module':<48}{'ms':>8}")
+    for module in REFERENCE:
+        print(f"{module:<48}{import_times(module)[module] / 1000:>8.1f}")
+
+    if importlib.util.find_spec("homeassistant") is None:
+        print("Home Assistant isn't installed, skipping integration modules")
+        return 0
+
+    failed = False
+    for module in LIGHT:
+        times = import_times(module)
+        heavy = sorted(name for name in times if name in HEAVY)
+        print(f"{module:<48}{times[module] / 1000:>8.1f}" + (f"  imports {', '.join(heavy)}" if heavy else ""))
+        failed |= bool(heavy)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
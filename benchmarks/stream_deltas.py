@@ -0,0 +1,116 @@
+"""Replay long synthetic completion streams through the delta engine.
+
+Run from the repository root:
+
+    python benchmarks/stream_deltas.py
+
+Yandex Cloud streams cumulative text, so the stream itself grows
+quadratically; the "source" row only consumes the stream and is the floor
+both engines are measured against. "strings" is the previous engine keeping
+the texts of adjacent chunks, "offsets" is TextDeltas.
+"""
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+import importlib.util
+import timeit
+import tracemalloc
+from pathlib import Path
+
+DELTAS_PATH = Path(__file__).parents[1] / "custom_components" / "yandexgpt_conversation" / "deltas.py"
+
+WORDS = ("Нарежьте", "лук", "кубиками", "и", "обжарьте", "до", "золотистого", "цвета", "🍳", "минут", "5–7")
+
+
+def load_deltas():
+    """Load the deltas module without importing Home Assistant."""
+    spec = importlib.util.spec_from_file_location("deltas", DELTAS_PATH)
+    assert spec and spec.loader
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def stream(chunks: int):
+    """Yield cumulative texts as Yandex Cloud does, then the final text."""
+    text = ""
+    for i in range(chunks):
+        text += WORDS[i % len(WORDS)] + " "
+        yield text, False
+    yield text, True
+
+
+def source(chunks: int) -> int:
+    total = 0
+    for _text, _final in stream(chunks):
+        total += 1
+    return total
+
+
+def strings(chunks: int) -> int:
+    """The previous engine: slice deltas out of adjacent chunk texts."""
+    total = 0
+    streamed_text = ""
+    prev_text = ""
+    for text, final in stream(chunks):
+        if final:
+            total += len(text[len(streamed_text):])
+            prev_text = ""
+            streamed_text = ""
+            continue
+        if prev_text == "":
+            prev_text = text
+            continue
+        delta = text[len(streamed_text): len(prev_text)]
+        total += len(delta)
+        streamed_text = prev_text
+        prev_text = text
+    return total
+
+
+def offsets(chunks: int, text_deltas_class) -> int:
+    total = 0
+    deltas = text_deltas_class()
+    for text, final in stream(chunks):
+        if final:
+            total += len(deltas.final(text))
+            continue
+        if not deltas.started:
+            deltas.start(text)
+            continue
+        total += len(deltas.partial(text))
+    return total
+
+
+def measure(run, chunks: int) -> tuple[float, int]:
+    """Return best time of a few runs and peak traced memory."""
+    elapsed = min(timeit.repeat(lambda: run(chunks), number=1, repeat=5))
+
+    tracemalloc.start()
+    run(chunks)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return elapsed, peak
+
+
+def main() -> None:
+    text_deltas_class = load_deltas().TextDeltas
+    engines = {
+        "source": source,
+        "strings": strings,
+        "offsets": lambda chunks: offsets(chunks, text_deltas_class),
+    }
+    assert strings(2000) == offsets(2000, text_deltas_class)
+
+    print(f"{'chunks':>8}  {'engine':<10}{'ms':>10}{'peak KiB':>10}")
+    for chunks in (1000, 4000, 10000):
+        for name, run in engines.items():
+            elapsed, peak = measure(run, chunks)
+            print(f"{chunks:>8}  {name:<10}{elapsed * 1e3:>10.1f}{peak / 1024:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
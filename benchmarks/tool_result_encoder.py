@@ -0,0 +1,104 @@
+"""Compare tool result encoding: plain json.dumps vs ToolResultEncoder.
+
+Run from the repository root:
+
+    python benchmarks/tool_result_encoder.py
+"""
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+import importlib.util
+import json
+import random
+import timeit
+from pathlib import Path
+
+ENCODER_PATH = Path(__file__).parents[1] / "custom_components" / "yandexgpt_conversation" / "encoder.py"
+
+AREAS = ("Гостиная", "Кухня", "Спальня", "Детская", "Ванная", "Прихожая", "Кабинет", "Балкон")
+DEVICES = (
+    ("light", "Свет", ("on", "off")),
+    ("switch", "Розетка", ("on", "off")),
+    ("sensor", "Температура", ("21.5", "22.0", "23.4")),
+    ("sensor", "Влажность", ("41", "45", "52")),
+    ("binary_sensor", "Датчик движения", ("on", "off")),
+    ("climate", "Кондиционер", ("cool", "off", "heat")),
+    ("media_player", "Колонка", ("playing", "idle", "off")),
+    ("cover", "Шторы", ("open", "closed")),
+)
+
+
+def load_encoder():
+    """Load the encoder module without importing Home Assistant."""
+    spec = importlib.util.spec_from_file_location("encoder", ENCODER_PATH)
+    assert spec and spec.loader
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def live_context(devices_per_area: int) -> dict:
+    """A GetLiveContext result: YAML-like overview of the home."""
+    rnd = random.Random(devices_per_area)
+    lines = ["Live Context: An overview of the areas and the devices in this smart home:"]
+    for area in AREAS:
+        for domain, name, states in DEVICES[:devices_per_area]:
+            lines += [
+                f"- names: {name} ({area})",
+                f"  domain: {domain}",
+                f"  state: '{rnd.choice(states)}'",
+                f"  areas: {area}",
+            ]
+            if domain == "light":
+                lines += ["  attributes:", f"    brightness: '{rnd.randint(0, 255)}'"]
+    return {"success": True, "result": "\n".join(lines)}
+
+
+def intent_response(targets: int) -> dict:
+    """A HassTurnOn-like result with a lot of empty fields."""
+    return {
+        "speech": {},
+        "response_type": "action_done",
+        "speech_slots": {},
+        "data": {
+            "targets": [],
+            "success": [
+                {"name": f"Свет ({area})", "type": "entity", "id": f"light.svet_{i}"}
+                for i, area in zip(range(targets), AREAS * targets)
+            ],
+            "failed": [],
+        },
+        "card": None,
+    }
+
+
+def main() -> None:
+    encoder_module = load_encoder()
+    encoders = {
+        "json.dumps": json.dumps,
+        "compact": encoder_module.ToolResultEncoder().encode,
+        "compact, drop empty": encoder_module.ToolResultEncoder(drop_empty=True).encode,
+        "compact, 4 KiB cap": encoder_module.ToolResultEncoder(max_bytes=4096).encode,
+    }
+    snapshots = {
+        "live context, small home": live_context(2),
+        "live context, large home": live_context(len(DEVICES)),
+        "turn on, 8 lights": intent_response(8),
+    }
+
+    print(f"{'snapshot':<28}{'encoder':<22}{'bytes':>8}{'vs json':>9}{'µs/op':>9}")
+    for snapshot_name, snapshot in snapshots.items():
+        baseline = len(json.dumps(snapshot).encode())
+        for encoder_name, encode in encoders.items():
+            size = len(encode(snapshot).encode())
+            number, elapsed = timeit.Timer(lambda: encode(snapshot)).autorange()
+            print(
+                f"{snapshot_name:<28}{encoder_name:<22}{size:>8}"
+                f"{size / baseline:>8.0%}{elapsed / number * 1e6:>9.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Compare per-turn setup overhead: settings resolved every turn vs once per entry.
+
+Run from the repository root:
+
+    python benchmarks/turn_setup.py
+
+The "before" path is the setup done at the top of every turn by the
+conversation entity before settings were resolved once per entry, as of
+commit 7499c81, with the integration's own constants. The "after" path
+runs the shipped code: the entry setup builds RuntimeSettings and the
+model with RuntimeSettings.build_model, and every turn reads the settings
+and configures the prebuilt model with its tools, as _async_complete does.
+The entry setup is timed too, since it runs again whenever options change.
+
+The integration is imported, so Home Assistant has to be installed, see
+requirements.txt.
+"""
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+import sys
+import timeit
+from pathlib import Path
+
+from yandex_ai_studio_sdk import AsyncAIStudio
+
+ROOT = Path(__file__).parents[1]
+
+DATA = {"folder_id": "b1gexample", "api_key": "AQVNexample"}
+OPTIONS = {
+    "recommended": False,
+    "prompt": "Ты голосовой ассистент умного дома.",
+    "llm_hass_api": ["assist"],
+    "chat_model": "yandexgpt/latest",
+    "model_version": "rc",
+    "temperature": 0.3,
+    "max_tokens": 1500,
+    "max_tool_iterations": 10,
+    "no_ha_default_prompt": False,
+    "enable_server_data_logging": False,
+    "tool_result_drop_empty": True,
+    "tool_result_max_bytes": 0,
+    "live_context_delta": True,
+    "execution_mode": "auto",
+    "async_timeout": 300,
+    "response_cache": False,
+    "response_cache_ttl": 3600,
+    "response_cache_persistent": False,
+}
+CONFIG = {**DATA, **OPTIONS}
+
+
+def main() -> None:
+    sys.path.insert(0, str(ROOT))
+    from homeassistant.const import CONF_LLM_HASS_API
+
+    from custom_components.yandexgpt_conversation.const import (
+        CONF_ASYNCHRONOUS_MODE, CONF_CHAT_MODEL, CONF_MAX_TOKENS,
+        CONF_MAX_TOOL_ITERATIONS, CONF_MODEL_VERSION,
+        CONF_NO_HA_DEFAULT_PROMPT, CONF_PROMPT, CONF_TEMPERATURE,
+        DEFAULT_CHAT_MODEL, DEFAULT_INSTRUCTIONS_PROMPT_RU,
+        DEFAULT_MAX_TOOL_ITERATIONS, DEFAULT_MODEL_VERSION,
+        DEFAULT_NO_HA_DEFAULT_PROMPT, RECOMMENDED_MAX_TOKENS,
+        RECOMMENDED_TEMPERATURE)
+    from custom_components.yandexgpt_conversation.runtime import \
+        RuntimeSettings
+
+    client = AsyncAIStudio(folder_id=DATA["folder_id"], auth=DATA["api_key"])
+    # Only adding tools to the model counts here, not converting them
+    tools: list = []
+
+    def before(with_tools: bool):
+        # _async_handle_message of 7499c81, without the calls to the chat log and the model
+        settings = {**DATA, **OPTIONS}
+        settings.get(CONF_PROMPT, DEFAULT_INSTRUCTIONS_PROMPT_RU)
+        settings.get(CONF_LLM_HASS_API)
+        model_name = settings.get(CONF_CHAT_MODEL, DEFAULT_CHAT_MODEL).split("/")[0]
+        model_ver = settings.get(CONF_MODEL_VERSION, DEFAULT_MODEL_VERSION)
+        model_conf = {
+            "temperature": settings.get(CONF_TEMPERATURE, RECOMMENDED_TEMPERATURE),
+            "max_tokens": settings.get(CONF_MAX_TOKENS, RECOMMENDED_MAX_TOKENS),
+        }
+        settings.get(CONF_NO_HA_DEFAULT_PROMPT, DEFAULT_NO_HA_DEFAULT_PROMPT)
+        if with_tools:
+            model_conf["tools"] = tools
+        model = client.models.completions(model_name, model_version=model_ver)
+        configured_model = model.configure(**model_conf)
+        settings.get(CONF_MAX_TOOL_ITERATIONS, DEFAULT_MAX_TOOL_ITERATIONS)
+        settings.get(CONF_ASYNCHRONOUS_MODE, False)
+        return configured_model
+
+    def setup():
+        settings = RuntimeSettings(CONFIG)
+        return settings, settings.build_model(client)
+
+    runtime_settings, base_model = setup()
+
+    def after(with_tools: bool):
+        # Reads every setting, more than a turn does
+        for name in RuntimeSettings.__slots__:
+            getattr(runtime_settings, name)
+        model = base_model
+        if with_tools:
+            model = model.configure(tools=tools)
+        return model
+
+    print(f"{'turn':<14}{'before, µs':>12}{'after, µs':>12}{'speedup':>10}")
+    for name, with_tools in (("no tools", False), ("with tools", True)):
+        timings = [_time(lambda: setup_path(with_tools)) for setup_path in (before, after)]
+        print(f"{name:<14}{timings[0]:>12.2f}{timings[1]:>12.2f}{timings[0] / timings[1]:>9.1f}x")
+    print(f"{'entry setup':<14}{'':>12}{_time(setup):>12.2f}")
+
+
+def _time(function) -> float:
+    """Return the best time of a call out of several runs, µs."""
+    number, _elapsed = timeit.Timer(function).autorange()
+    return min(timeit.repeat(function, number=number, repeat=5)) / number * 1e6
+
+
+if __name__ == "__main__":
+    main()
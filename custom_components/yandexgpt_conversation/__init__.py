@@ -6,6 +6,13 @@
 
 from __future__ import annotations
 
+import asyncio
+import importlib
+from dataclasses import dataclass
+from functools import partial
+from time import monotonic
+from typing import Any
+
 import voluptuous as vol
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import CONF_API_KEY, Platform
@@ -14,64 +21,191 @@ from homeassistant.core import (HomeAssistant, ServiceCall, ServiceResponse,
 from homeassistant.exceptions import HomeAssistantError
 from homeassistant.helpers import config_validation as cv
 from homeassistant.helpers import selector
+from homeassistant.helpers.storage import STORAGE_DIR
 from homeassistant.helpers.typing import ConfigType
 
-from .const import (ATTR_FILENAME, ATTR_PROMPT, ATTR_SEED,
-                    CONF_ENABLE_SERVER_DATA_LOGGING, CONF_FOLDER_ID,
-                    DEFAULT_ENABLE_SERVER_DATA_LOGGING, DOMAIN, LOGGER)
+from .const import (ATTR_FILENAME, ATTR_IMAGES, ATTR_KEEP_IN_MEMORY,
+                    ATTR_MAX_CONCURRENCY, ATTR_PROMPT, ATTR_SEED,
+                    CONF_EXTRA_ACCOUNTS, CONF_FOLDER_ID,
+                    DEFAULT_IMAGE_CACHE_MAX_BYTES,
+                    DEFAULT_IMAGE_GENERATION_TIMEOUT,
+                    DEFAULT_IMAGE_MAX_CONCURRENCY,
+                    DEFAULT_IMAGE_MEMORY_MAX_BYTES, DOMAIN,
+                    IMAGE_GENERATION_MODEL, LOGGER)
+from .images import ImageCache, ImageStore, ImageView
 
 SERVICE_GENERATE_IMAGE = "generate_image"
-PLATFORMS = (Platform.CONVERSATION,)
+SERVICE_GENERATE_IMAGES = "generate_images"
+PLATFORMS = (Platform.CONVERSATION, Platform.SENSOR)
 CONFIG_SCHEMA = cv.config_entry_only_config_schema(DOMAIN)
+# Modules importing the SDK, which pulls in protobuf and gRPC stubs
+SDK_MODULES = (
+    ".accounts", ".cache", ".client", ".conversation", ".poller", ".resilience", ".runtime", ".tool_selection",
+    ".usage",
+)
 
 
-async def async_setup(hass: HomeAssistant, entry: ConfigType) -> bool:
-    def write_image_to_file(image_bytes: bytes, file_name: str) -> str:
-        try:
-            LOGGER.debug("Writing image to file: %s...", file_name)
-            with open(file_name, "wb") as file:
-                file.write(image_bytes)
-            return file_name
-        except Exception as e:
-            LOGGER.error("Failed to write image to file %s: %s", file_name, str(e))
-            raise
+@dataclass
+class _ImageRequest:
+    """Image between the cache lookup and being put to its file and memory."""
 
-    async def render_image(call: ServiceCall) -> ServiceResponse:
-        """Render an image with YandexART."""
-        LOGGER.debug("Starting image generation with seed: %s, prompt: %s",
-                     call.data[ATTR_SEED], call.data[ATTR_PROMPT])
+    cache_key: str
+    file_name: str | None
+    keep_in_memory: bool
+    image_bytes: bytes | None = None
+    saved: bool = False
+    operation: Any = None
 
-        if not hass.config.is_allowed_path(call.data[ATTR_FILENAME]):
-            raise HomeAssistantError(
-                f"Cannot write `{call.data[ATTR_FILENAME]}`, no access to path; `allowlist_external_dirs` may need to be adjusted in `configuration.yaml`")  # noqa: E501
 
-        entry_id = call.data["config_entry"]
+def _import_sdk_modules() -> None:
+    """Import the SDK and modules using it, must run in the executor."""
+    for module in SDK_MODULES:
+        importlib.import_module(module, __package__)
+
+
+async def async_setup(hass: HomeAssistant, entry: ConfigType) -> bool:
+    image_cache = ImageCache(hass.config.path(STORAGE_DIR, f"{DOMAIN}_images"), DEFAULT_IMAGE_CACHE_MAX_BYTES)
+    image_store = ImageStore(DEFAULT_IMAGE_MEMORY_MAX_BYTES)
+    hass.http.register_view(ImageView(image_store))
+
+    def get_entry(entry_id: str) -> ConfigEntry:
         entry = hass.config_entries.async_get_entry(entry_id)
         if entry is None:
             raise HomeAssistantError(f"Config entry {entry_id} not found")
+        return entry
 
-        try:
-            client = entry.runtime_data
+    def check_allowed_path(file_name: str | None) -> None:
+        if file_name is not None and not hass.config.is_allowed_path(file_name):
+            raise HomeAssistantError(
+                f"Cannot write `{file_name}`, no access to path; `allowlist_external_dirs` may need to be adjusted in `configuration.yaml`")  # noqa: E501
+
+    async def submit_image(
+        entry: ConfigEntry, prompt: str, seed: int, file_name: str | None, keep_in_memory: bool
+    ) -> _ImageRequest:
+        """Look an image up in the caches, starting its generation with YandexART if it's not there."""
+        request = _ImageRequest(
+            ImageCache.make_key(IMAGE_GENERATION_MODEL, prompt, seed), file_name, keep_in_memory or file_name is None)
+
+        if request.keep_in_memory and (found := image_store.find(request.cache_key)) is not None:
+            LOGGER.debug("Image found in memory")
+            request.image_bytes = found[1]
 
-            model = client.models.image_generation("yandex-art")
-            model = model.configure(seed=int(call.data[ATTR_SEED]))
+        if file_name is not None:
+            request.saved = await hass.async_add_executor_job(image_cache.fetch, request.cache_key, file_name)
+            if request.saved:
+                LOGGER.debug("Image found in cache, saved to: %s", file_name)
+
+        if request.image_bytes is None and not request.saved:
+            client = entry.runtime_data.client
+
+            model = client.models.image_generation(IMAGE_GENERATION_MODEL)
+            model = model.configure(seed=seed)
 
             LOGGER.debug("Sending generation request...")
-            operation = await model.run_deferred(call.data[ATTR_PROMPT])
+            request.operation = await model.run_deferred(prompt)
+
+        return request
+
+    async def finish_image(entry: ConfigEntry, request: _ImageRequest) -> dict[str, Any]:
+        """Wait for a submitted image and put it to its file and memory."""
+        response: dict[str, Any] = {"cache_hit": request.operation is None}
 
+        image_bytes = request.image_bytes
+        if request.operation is not None:
             LOGGER.debug("Waiting for image generation to complete...")
-            result = await operation
+            result = await entry.runtime_data.poller.async_wait(
+                request.operation, IMAGE_GENERATION_MODEL, DEFAULT_IMAGE_GENERATION_TIMEOUT)
+            image_bytes = result.image_bytes
+
+        if request.file_name is not None:
+            if not request.saved:
+                LOGGER.debug("Writing image to file: %s...", request.file_name)
+                await hass.async_add_executor_job(image_cache.store, request.cache_key, image_bytes, request.file_name)
+                LOGGER.debug("Successfully saved image to: %s", request.file_name)
+            response["file_name"] = request.file_name
+
+        if request.keep_in_memory:
+            if image_bytes is None:
+                image_bytes = await hass.async_add_executor_job(image_cache.read, request.cache_key)
+            if image_bytes is not None:
+                response["url"] = image_store.url(image_store.put(request.cache_key, image_bytes))
+
+        return response
+
+    async def generate_image(
+        entry: ConfigEntry, prompt: str, seed: int, file_name: str | None, keep_in_memory: bool
+    ) -> dict[str, Any]:
+        """Generate an image with YandexART or take it from the caches.
 
-            file_name = await hass.async_add_executor_job(
-                write_image_to_file, result.image_bytes, call.data[ATTR_FILENAME])
-            LOGGER.debug("Successfully saved image to: %s", file_name)
+        Without file_name the image is kept in memory only and never touches the disk.
+        """
+        return await finish_image(entry, await submit_image(entry, prompt, seed, file_name, keep_in_memory))
 
-            return {"file_name": file_name}
+    async def render_image(call: ServiceCall) -> ServiceResponse:
+        """Render an image with YandexART."""
+        LOGGER.debug("Starting image generation with seed: %s, prompt: %s",
+                     call.data[ATTR_SEED], call.data[ATTR_PROMPT])
 
+        check_allowed_path(call.data.get(ATTR_FILENAME))
+        entry = get_entry(call.data["config_entry"])
+
+        try:
+            return await generate_image(
+                entry,
+                call.data[ATTR_PROMPT],
+                int(call.data[ATTR_SEED]),
+                call.data.get(ATTR_FILENAME),
+                call.data[ATTR_KEEP_IN_MEMORY],
+            )
         except Exception as err:
             LOGGER.error("Error during image generation: %s", str(err), exc_info=True)
             raise HomeAssistantError(f"Image generation failed: {str(err)}") from err
 
+    async def render_images(call: ServiceCall) -> ServiceResponse:
+        """Render a batch of images with YandexART."""
+        jobs = call.data[ATTR_IMAGES]
+        for job in jobs:
+            check_allowed_path(job.get(ATTR_FILENAME))
+        entry = get_entry(call.data["config_entry"])
+        semaphore = asyncio.Semaphore(call.data[ATTR_MAX_CONCURRENCY])
+
+        async def run_job(job: dict[str, Any]) -> dict[str, Any]:
+            started = monotonic()
+            try:
+                # All jobs are submitted right away, generating in parallel on the Yandex side;
+                # only waiting for them and writing them out is limited
+                request = await submit_image(
+                    entry,
+                    job[ATTR_PROMPT],
+                    int(job[ATTR_SEED]),
+                    job.get(ATTR_FILENAME),
+                    job[ATTR_KEEP_IN_MEMORY],
+                )
+                async with semaphore:
+                    result = await finish_image(entry, request)
+            except Exception as err:  # pylint: disable=broad-except
+                LOGGER.error("Error during image generation: %s", str(err), exc_info=True)
+                result = {"error": str(err)}
+                if ATTR_FILENAME in job:
+                    result["file_name"] = job[ATTR_FILENAME]
+            result["duration"] = round(monotonic() - started, 3)
+            return result
+
+        LOGGER.debug("Starting generation of %d images", len(jobs))
+        started = monotonic()
+        results = await asyncio.gather(*(run_job(job) for job in jobs))
+
+        return {"images": results, "duration": round(monotonic() - started, 3)}
+
+    image_schema = {
+        vol.Required(ATTR_SEED): vol.All(
+            vol.Coerce(str), cv.matches_regex(r"[0-9]+")
+        ),
+        vol.Required(ATTR_PROMPT): cv.string,
+        vol.Optional(ATTR_FILENAME): cv.path,
+        vol.Optional(ATTR_KEEP_IN_MEMORY, default=False): cv.boolean,
+    }
+
     hass.services.async_register(
         DOMAIN,
         SERVICE_GENERATE_IMAGE,
@@ -83,11 +217,27 @@ async def async_setup(hass: HomeAssistant, entry: ConfigType) -> bool:
                         "integration": DOMAIN,
                     }
                 ),
-                vol.Required("seed"): vol.All(
-                    vol.Coerce(str), cv.matches_regex(r"[0-9]+")
+                **image_schema,
+            }
+        ),
+        supports_response=SupportsResponse.ONLY,
+    )
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_GENERATE_IMAGES,
+        render_images,
+        schema=vol.Schema(
+            {
+                vol.Required("config_entry"): selector.ConfigEntrySelector(
+                    {
+                        "integration": DOMAIN,
+                    }
+                ),
+                vol.Required(ATTR_IMAGES): vol.All(cv.ensure_list, [vol.Schema(image_schema)]),
+                vol.Optional(ATTR_MAX_CONCURRENCY, default=DEFAULT_IMAGE_MAX_CONCURRENCY): vol.All(
+                    vol.Coerce(int), vol.Range(min=1)
                 ),
-                vol.Required("prompt"): cv.string,
-                vol.Required("file_name"): cv.path,
             }
         ),
         supports_response=SupportsResponse.ONLY,
@@ -98,23 +248,99 @@ async def async_setup(hass: HomeAssistant, entry: ConfigType) -> bool:
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Set up YandexGPT from a config entry."""
-    from yandex_ai_studio_sdk import AsyncAIStudio
+    await hass.async_add_import_executor_job(_import_sdk_modules)
 
-    settings = {**entry.data, **entry.options}
+    from .accounts import Account, AccountPool
+    from .admission import AdmissionController
+    from .cache import CompletionCache
+    from .client import async_get_client_registry
+    from .conversation import ExecutionScheduler
+    from .hedging import HedgeStats
+    from .metrics import PipelineMetrics, TraceWriter
+    from .poller import OperationPoller
+    from .resilience import CircuitBreaker
+    from .runtime import RuntimeSettings, YandexGPTRuntimeData
+    from .tool_selection import ToolSelector
+    from .usage import MaxTokensGovernor, UsageTracker
 
-    entry.runtime_data = AsyncAIStudio(
-        folder_id=settings[CONF_FOLDER_ID],
-        auth=settings[CONF_API_KEY],
-        enable_server_data_logging=settings.get(
-            CONF_ENABLE_SERVER_DATA_LOGGING, DEFAULT_ENABLE_SERVER_DATA_LOGGING
-        ),
+    config = {**entry.data, **entry.options}
+    settings = RuntimeSettings(config)
+
+    registry = async_get_client_registry(hass)
+    accounts: list[Account] = []
+    for account in (
+        {CONF_FOLDER_ID: config[CONF_FOLDER_ID], CONF_API_KEY: config[CONF_API_KEY]},
+        *config.get(CONF_EXTRA_ACCOUNTS, ()),
+    ):
+        shared = registry.async_acquire(
+            account[CONF_FOLDER_ID],
+            account[CONF_API_KEY],
+            settings.enable_server_data_logging,
+            settings.keepalive_interval,
+        )
+        entry.async_on_unload(partial(registry.async_release, shared))
+        accounts.append(Account(
+            account[CONF_FOLDER_ID],
+            shared,
+            settings.build_model(shared.client),
+            settings.build_fallback_model(shared.client),
+            settings.build_hedge_model(shared.client),
+        ))
+
+    poller = OperationPoller(hass)
+    entry.async_on_unload(poller.async_shutdown)
+
+    entry.runtime_data = YandexGPTRuntimeData(
+        accounts=AccountPool(accounts),
+        admission=AdmissionController(settings.max_concurrent_requests, settings.max_queued_requests),
+        breaker=CircuitBreaker(),
+        hedge_stats=HedgeStats(),
+        scheduler=ExecutionScheduler(),
+        tool_selector=ToolSelector(hass, entry.entry_id),
+        usage=UsageTracker(),
+        governor=MaxTokensGovernor(),
+        metrics=PipelineMetrics(),
+        trace_writer=TraceWriter(hass),
+        poller=poller,
+        completion_cache=CompletionCache(hass, entry.entry_id),
+        settings=settings,
     )
+    entry.async_on_unload(entry.add_update_listener(async_update_options))
 
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
 
     return True
 
 
+async def async_update_options(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Apply updated options, reloading only if the client or entity must be recreated."""
+    from .runtime import RuntimeSettings
+
+    settings = RuntimeSettings({**entry.data, **entry.options})
+    current = entry.runtime_data.settings
+
+    if (
+        settings.llm_hass_api != current.llm_hass_api
+        or settings.enable_server_data_logging != current.enable_server_data_logging
+        or settings.keepalive_interval != current.keepalive_interval
+    ):
+        await hass.config_entries.async_reload(entry.entry_id)
+        return
+
+    entry.runtime_data.update_settings(settings)
+
+
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Unload YandexGPT."""
     return await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
+
+
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Remove persisted data of YandexGPT."""
+    await hass.async_add_import_executor_job(_import_sdk_modules)
+
+    from .cache import CompletionCache
+    from .tool_selection import ToolSelector
+
+    await CompletionCache(hass, entry.entry_id).async_remove()
+    await ToolSelector(hass, entry.entry_id).async_remove()
@@ -0,0 +1,153 @@
+"""Pool of Yandex Cloud accounts a config entry spreads requests across."""
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+from collections import deque
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from time import monotonic
+from typing import TYPE_CHECKING, Any
+
+import grpc
+
+from .const import LOGGER
+
+if TYPE_CHECKING:
+    from yandex_ai_studio_sdk._models.completions.model import AsyncGPTModel
+
+    from .client import SharedClient
+    from .runtime import RuntimeSettings
+
+COOLDOWN_MIN = 10.0
+COOLDOWN_MAX = 300.0
+# Failures in a row taking an account out of rotation
+MAX_CONSECUTIVE_FAILURES = 3
+THROUGHPUT_WINDOW = 60.0
+
+FAILURE_CODES = (grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.DEADLINE_EXCEEDED, grpc.StatusCode.INTERNAL)
+
+
+@dataclass(eq=False)
+class Account:
+    """Folder and API key pair with its client and counters."""
+
+    folder_id: str
+    shared: SharedClient
+    model: AsyncGPTModel
+    fallback_model: AsyncGPTModel | None = None
+    hedge_model: AsyncGPTModel | None = None
+    in_flight: int = 0
+    requests: int = 0
+    completed: int = 0
+    rejections: int = 0
+    failures: int = 0
+    consecutive_failures: int = 0
+    cooldown: float = 0.0
+    available_at: float = 0.0
+    _finished: deque[float] = field(default_factory=deque)
+
+    @property
+    def available(self) -> bool:
+        """Return True if the account is in rotation."""
+        return monotonic() >= self.available_at
+
+    @property
+    def throughput(self) -> int:
+        """Return requests completed over the last minute."""
+        now = monotonic()
+        while self._finished and self._finished[0] < now - THROUGHPUT_WINDOW:
+            self._finished.popleft()
+        return len(self._finished)
+
+    def record_success(self) -> None:
+        """Put the account back into rotation after a successful request."""
+        self.completed += 1
+        self.consecutive_failures = 0
+        self.cooldown = 0.0
+        self._finished.append(monotonic())
+
+    def record_error(self, code: grpc.StatusCode) -> None:
+        """Take the account out of rotation if it's saturated or failing."""
+        if code == grpc.StatusCode.RESOURCE_EXHAUSTED:
+            self.rejections += 1
+        elif code in FAILURE_CODES:
+            self.failures += 1
+            self.consecutive_failures += 1
+            if self.consecutive_failures < MAX_CONSECUTIVE_FAILURES:
+                return
+        else:
+            return
+
+        # Back off exponentially while the account keeps failing
+        self.cooldown = min(max(self.cooldown * 2, COOLDOWN_MIN), COOLDOWN_MAX)
+        self.available_at = monotonic() + self.cooldown
+        LOGGER.warning("Account %s is out of rotation for %ds: %s", self.folder_id, self.cooldown, code.name)
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return counters of the account."""
+        return {
+            "folder_id": self.folder_id,
+            "available": self.available,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "completed": self.completed,
+            "rejections": self.rejections,
+            "failures": self.failures,
+            "throughput_per_minute": self.throughput,
+            "channels": self.shared.warmer.as_dict(),
+        }
+
+
+class AccountPool:
+    """Spread requests across accounts, preferring the least loaded one.
+
+    Accounts rejecting requests with RESOURCE_EXHAUSTED or failing several
+    times in a row are skipped until their cooldown expires.
+    """
+
+    def __init__(self, accounts: list[Account]) -> None:
+        assert accounts
+        self.accounts = accounts
+
+    @property
+    def primary(self) -> Account:
+        """Return the account configured first."""
+        return self.accounts[0]
+
+    def update_models(self, settings: RuntimeSettings) -> None:
+        """Rebuild configured models of all accounts."""
+        for account in self.accounts:
+            account.model = settings.build_model(account.shared.client)
+            account.fallback_model = settings.build_fallback_model(account.shared.client)
+            account.hedge_model = settings.build_hedge_model(account.shared.client)
+
+    def select(self, exclude: tuple[Account, ...] = ()) -> Account:
+        """Return the account to send the next request to."""
+        candidates = [account for account in self.accounts if account not in exclude] or self.accounts
+        if available := [account for account in candidates if account.available]:
+            return min(available, key=lambda account: (account.in_flight, account.requests))
+        # Everything is saturated, try the account to recover first
+        return min(candidates, key=lambda account: account.available_at)
+
+    @contextmanager
+    def lease(self, exclude: tuple[Account, ...] = ()) -> Iterator[Account]:
+        """Use an account for a request, recording the outcome."""
+        account = self.select(exclude)
+        account.in_flight += 1
+        account.requests += 1
+        try:
+            yield account
+        except grpc.aio.AioRpcError as err:
+            account.record_error(err.code())
+            raise
+        else:
+            account.record_success()
+        finally:
+            account.in_flight -= 1
+            if len(self.accounts) > 1:
+                LOGGER.debug("Accounts: %s", [account.as_dict() for account in self.accounts])
@@ -0,0 +1,165 @@
+"""Admission of conversation requests to the model by priority."""
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import statistics
+from collections import Counter, defaultdict, deque
+from collections.abc import Callable
+from time import monotonic
+from typing import Any
+
+from homeassistant.exceptions import HomeAssistantError
+
+from .const import DOMAIN, LOGGER
+
+WAIT_HISTORY_SIZE = 100
+
+
+class AdmissionSlot:
+    """A slot held by a model call, released at most once."""
+
+    def __init__(self, release: Callable[[], None]) -> None:
+        self._release: Callable[[], None] | None = release
+
+    def release(self) -> None:
+        """Hand the slot over to the next waiting request."""
+        if self._release is not None:
+            release, self._release = self._release, None
+            release()
+
+    def __enter__(self) -> AdmissionSlot:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.release()
+
+
+class AdmissionController:
+    """Limit concurrent model calls of a config entry.
+
+    Requests over the limit wait in a bounded queue and are admitted by
+    priority (lower value first), in arrival order within a priority. When
+    the queue is full, a new request displaces the least important waiting
+    one if it's more important, otherwise it's rejected right away.
+
+    A slot covers a single call of the model: tools and polling of deferred
+    operations run without one.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int) -> None:
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.running = 0
+        self._queue: list[tuple[int, int, str, asyncio.Future[None]]] = []
+        self._sequence = itertools.count()
+        self.waits: defaultdict[str, deque[float]] = defaultdict(lambda: deque(maxlen=WAIT_HISTORY_SIZE))
+        self.admitted: Counter[str] = Counter()
+        self.rejected: Counter[str] = Counter()
+
+    @property
+    def queued(self) -> int:
+        """Return the number of waiting requests."""
+        return len(self._queue)
+
+    def configure(self, max_concurrency: int, max_queue: int) -> None:
+        """Apply new limits, admitting waiting requests if there is room now."""
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self._admit_waiting()
+
+    async def async_acquire(self, name: str, priority: int) -> AdmissionSlot:
+        """Wait for a slot for a model call."""
+        if self._has_capacity() and not self._queue:
+            self.running += 1
+            self._record_wait(name, 0.0)
+        else:
+            started = monotonic()
+            await self._async_wait(name, priority)
+            self._record_wait(name, monotonic() - started)
+
+        return AdmissionSlot(self._release)
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return counters and queue wait percentiles."""
+        return {
+            "running": self.running,
+            "queued": self.queued,
+            "admitted": dict(self.admitted),
+            "rejected": dict(self.rejected),
+            "wait": {name: _percentiles(samples) for name, samples in self.waits.items()},
+        }
+
+    def _has_capacity(self) -> bool:
+        return not self.max_concurrency or self.running < self.max_concurrency
+
+    def _release(self) -> None:
+        self.running -= 1
+        self._admit_waiting()
+
+    async def _async_wait(self, name: str, priority: int) -> None:
+        """Wait in the queue until the slot is handed over."""
+        if any(entry[3].done() for entry in self._queue):
+            # Waiters cancelled a moment ago are still queued until their task resumes
+            self._queue = [entry for entry in self._queue if not entry[3].done()]
+            heapq.heapify(self._queue)
+        if len(self._queue) >= self.max_queue:
+            # Queue entries are ordered, the largest one is the least important latest request
+            worst = max(self._queue, default=None)
+            if worst is None or worst[0] <= priority:
+                raise self._rejection(name)
+            self._queue.remove(worst)
+            heapq.heapify(self._queue)
+            worst[3].set_exception(self._rejection(worst[2]))
+
+        future: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self._sequence), name, future)
+        heapq.heappush(self._queue, entry)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                # The slot was handed over just before the cancellation
+                self._release()
+            elif entry in self._queue:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+            raise
+
+    def _admit_waiting(self) -> None:
+        while self._queue and self._has_capacity():
+            _priority, _sequence, _name, future = heapq.heappop(self._queue)
+            if future.done():
+                continue
+            self.running += 1
+            future.set_result(None)
+
+    def _record_wait(self, name: str, wait: float) -> None:
+        self.admitted[name] += 1
+        samples = self.waits[name]
+        samples.append(wait)
+        if wait:
+            LOGGER.debug(
+                "%s request waited %.2fs for a slot (median %.2fs, p95 %.2fs over %d requests)",
+                name, wait, *_percentiles(samples).values(), len(samples),
+            )
+
+    def _rejection(self, name: str) -> HomeAssistantError:
+        self.rejected[name] += 1
+        LOGGER.warning(
+            "Rejecting %s request: %d requests running, %d waiting", name, self.running, len(self._queue)
+        )
+        return HomeAssistantError(translation_domain=DOMAIN, translation_key="queue_full")
+
+
+def _percentiles(samples: deque[float]) -> dict[str, float]:
+    """Return median and 95th percentile of wait times."""
+    if len(samples) < 2:
+        return {"median": sum(samples), "p95": sum(samples)}
+    return {"median": statistics.median(samples), "p95": statistics.quantiles(samples, n=20)[-1]}
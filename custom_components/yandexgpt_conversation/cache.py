@@ -0,0 +1,279 @@
+"""Caches used by the YandexGPT integration."""
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from collections.abc import AsyncGenerator, Hashable
+from dataclasses import dataclass
+from enum import Enum
+from types import BuiltinFunctionType, FunctionType
+from typing import TYPE_CHECKING, Any, Generic, TypeVar
+
+import voluptuous as vol
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers import llm
+from homeassistant.helpers.storage import Store
+from yandex_ai_studio_sdk._models.completions.result import AlternativeStatus
+
+from .const import (DEFAULT_COMPLETION_CACHE_SIZE,
+                    DEFAULT_COMPLETION_DISK_CACHE_SIZE,
+                    DEFAULT_TOOL_CACHE_SIZE, DOMAIN, LOGGER)
+from .mappers import ContentConverter
+
+if TYPE_CHECKING:
+    from yandex_ai_studio_sdk import AsyncAIStudio
+    from yandex_ai_studio_sdk._models.completions.message import \
+        CompletionsMessageType
+    from yandex_ai_studio_sdk._tools.tool import FunctionTool
+
+_KT = TypeVar("_KT", bound=Hashable)
+_VT = TypeVar("_VT")
+
+COMPLETION_CACHE_STORAGE_VERSION = 1
+COMPLETION_CACHE_SAVE_DELAY = 30
+REPLAY_CHUNK_SIZE = 32
+
+
+class LRUCache(Generic[_KT, _VT]):
+    """Least recently used cache with hit/miss counters."""
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[_KT, _VT] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: _KT) -> _VT | None:
+        """Return a cached value and mark it as recently used."""
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return None
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: _KT, value: _VT) -> None:
+        """Store a value, evicting the least recently used one if needed."""
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def items(self) -> list[tuple[_KT, _VT]]:
+        """Return cached items, least recently used first, without touching them."""
+        return list(self._data.items())
+
+    def pop(self, key: _KT) -> _VT | None:
+        """Remove a value from the cache."""
+        return self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """Drop all cached values."""
+        self._data.clear()
+
+
+class UnsupportedSchemaError(Exception):
+    """Schema holds a value without a stable fingerprint."""
+
+
+def schema_fingerprint(value: Any) -> Hashable:
+    """Build a hashable fingerprint of a voluptuous schema.
+
+    Cheaper than converting the schema to OpenAPI, and stable across turns
+    even though HA rebuilds the tool objects on every message. Only values
+    with a known structure are fingerprinted: a default repr() holds the
+    memory address, which another schema may reuse once this one is
+    collected, so anything else raises UnsupportedSchemaError.
+    """
+    if value is None or isinstance(value, (bool, int, float, str, bytes, Enum)):
+        return repr(value)
+    if isinstance(value, type):
+        return ("type", value.__module__, value.__qualname__)
+    if isinstance(value, vol.Schema):
+        return ("schema", schema_fingerprint(value.schema))
+    if isinstance(value, vol.Marker):
+        # Defaults end up in the converted schema too
+        default = getattr(value, "default", vol.UNDEFINED)
+        default_fingerprint = None if default is vol.UNDEFINED else ("default", schema_fingerprint(default()))
+        return (type(value).__name__, schema_fingerprint(value.schema), value.description, default_fingerprint)
+    if isinstance(value, dict):
+        return ("dict", *((schema_fingerprint(k), schema_fingerprint(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__, *(schema_fingerprint(item) for item in value))
+    if isinstance(value, (set, frozenset)):
+        return ("set", *sorted(repr(schema_fingerprint(item)) for item in value))
+    if isinstance(value, (FunctionType, BuiltinFunctionType)) and "<" not in value.__qualname__:
+        # Module and class level functions like cv.string live as long as the process
+        return ("function", value.__module__, value.__qualname__)
+    if hasattr(value, "selector_type") and hasattr(value, "config"):
+        # HA selectors don't implement __repr__
+        return ("selector", value.selector_type, schema_fingerprint(value.config))
+    if type(value).__module__.startswith("voluptuous") and hasattr(value, "__dict__"):
+        # Validators like vol.All, vol.In or vol.Coerce are defined by their public attributes;
+        # private ones and the parent schema are set by voluptuous when compiling them
+        attributes = sorted(item for item in vars(value).items() if not item[0].startswith("_") and item[0] != "schema")
+        return (type(value).__qualname__, *((name, schema_fingerprint(attr)) for name, attr in attributes))
+    raise UnsupportedSchemaError(f"Can't fingerprint {type(value).__qualname__}")
+
+
+class ToolCache:
+    """Cache of HA tools converted to YandexGPT format."""
+
+    def __init__(self, maxsize: int = DEFAULT_TOOL_CACHE_SIZE) -> None:
+        self._cache: LRUCache[tuple[str, str, str, Hashable], FunctionTool] = LRUCache(maxsize)
+
+    @property
+    def hits(self) -> int:
+        return self._cache.hits
+
+    @property
+    def misses(self) -> int:
+        return self._cache.misses
+
+    def get_tools(self, sdk: AsyncAIStudio, llm_api: llm.APIInstance) -> list[FunctionTool]:
+        """Return converted tools of an LLM API, converting only unseen ones."""
+        tools: list[FunctionTool] = []
+
+        for tool in llm_api.tools:
+            try:
+                key = (llm_api.api.id, tool.name, tool.description or "", schema_fingerprint(tool.parameters))
+            except UnsupportedSchemaError as err:
+                LOGGER.debug("Not caching tool %s: %s", tool.name, err)
+                tools.append(ContentConverter.format_tool(sdk, tool, llm_api.custom_serializer))
+                continue
+            function_tool = self._cache.get(key)
+            if function_tool is None:
+                function_tool = ContentConverter.format_tool(sdk, tool, llm_api.custom_serializer)
+                self._cache.put(key, function_tool)
+            tools.append(function_tool)
+
+        return tools
+
+    def clear(self) -> None:
+        """Invalidate all converted tools."""
+        self._cache.clear()
+
+
+@dataclass(frozen=True)
+class CachedAlternative:
+    """Stand-in for a completion alternative replayed from the cache."""
+
+    text: str
+    status: AlternativeStatus
+    tool_calls: None = None
+
+
+@dataclass(frozen=True)
+class CachedResult:
+    """Stand-in for a completion result replayed from the cache."""
+
+    alternatives: tuple[CachedAlternative, ...]
+
+
+class CompletionCache:
+    """Cache of completions produced without tools.
+
+    Recently used completions are kept in memory; optionally they are also
+    persisted under .storage to survive restarts.
+    """
+
+    def __init__(self, hass: HomeAssistant, entry_id: str) -> None:
+        self.hass = hass
+        self._memory: LRUCache[str, tuple[float, str]] = LRUCache(DEFAULT_COMPLETION_CACHE_SIZE)
+        self._store: Store[dict[str, list[Any]]] = Store(
+            hass, COMPLETION_CACHE_STORAGE_VERSION, f"{DOMAIN}.{entry_id}.completions")
+        self._persisted: dict[str, list[Any]] | None = None
+        self._load_lock = asyncio.Lock()
+
+    @property
+    def hits(self) -> int:
+        return self._memory.hits
+
+    @property
+    def misses(self) -> int:
+        return self._memory.misses
+
+    @staticmethod
+    def make_key(
+        model_name: str, model_version: str, model_conf: dict[str, Any], messages: list[CompletionsMessageType]
+    ) -> str | None:
+        """Return cache key for a request or None if the request can't be cached."""
+        try:
+            payload = json.dumps([model_name, model_version, model_conf, messages], ensure_ascii=False, sort_keys=True)
+        except TypeError:
+            # SDK objects, e.g. tool calls, can't be hashed reliably
+            return None
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    async def async_get(self, key: str, persistent: bool) -> str | None:
+        """Return cached completion text."""
+        if (cached := self._memory.get(key)) is None and persistent:
+            cached = (await self._async_load_persisted()).get(key)
+            if cached is not None:
+                self._memory.put(key, (cached[0], cached[1]))
+
+        if cached is None:
+            return None
+
+        expires, text = cached
+        if expires < time.time():
+            self._memory.pop(key)
+            if self._persisted is not None and self._persisted.pop(key, None):
+                self._store.async_delay_save(self._data_to_save, COMPLETION_CACHE_SAVE_DELAY)
+            return None
+
+        return text
+
+    async def async_put(self, key: str, text: str, ttl: float, persistent: bool) -> None:
+        """Store completion text."""
+        expires = time.time() + ttl
+        self._memory.put(key, (expires, text))
+
+        if persistent:
+            persisted = await self._async_load_persisted()
+            persisted[key] = [expires, text]
+            self._store.async_delay_save(self._data_to_save, COMPLETION_CACHE_SAVE_DELAY)
+
+    async def _async_load_persisted(self) -> dict[str, list[Any]]:
+        """Load the on-disk tier on first use."""
+        async with self._load_lock:
+            if self._persisted is None:
+                self._persisted = await self._store.async_load() or {}
+        return self._persisted
+
+    async def async_remove(self) -> None:
+        """Remove persisted completions."""
+        await self._store.async_remove()
+
+    @callback
+    def _data_to_save(self) -> dict[str, list[Any]]:
+        """Return persisted completions, dropping expired and the oldest ones."""
+        assert self._persisted is not None
+        now = time.time()
+        alive = sorted(
+            ((key, value) for key, value in self._persisted.items() if value[0] >= now),
+            key=lambda item: item[1][0],
+        )
+        self._persisted = dict(alive[-DEFAULT_COMPLETION_DISK_CACHE_SIZE:])
+        return self._persisted
+
+    @staticmethod
+    async def replay(text: str) -> AsyncGenerator[CachedResult, None]:
+        """Replay a cached completion as a stream of partial results."""
+        for end in range(REPLAY_CHUNK_SIZE, len(text), REPLAY_CHUNK_SIZE):
+            yield CachedResult((CachedAlternative(text[:end], AlternativeStatus.PARTIAL),))
+        yield CachedResult((CachedAlternative(text, AlternativeStatus.FINAL),))
@@ -0,0 +1,209 @@
+"""Warm gRPC channels to Yandex Cloud."""
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import statistics
+from collections import deque
+from dataclasses import dataclass
+from typing import Any
+
+import grpc
+from homeassistant.core import HomeAssistant
+from yandex.cloud.ai.foundation_models.v1.text_generation.text_generation_service_pb2_grpc import (  # noqa: E501
+    TextGenerationAsyncServiceStub, TextGenerationServiceStub)
+from yandex_ai_studio_sdk import AsyncAIStudio
+
+from .const import DOMAIN, LOGGER, MIN_KEEPALIVE_INTERVAL
+
+# Channels used by conversations: streaming and deferred completions
+WARM_STUBS = (TextGenerationServiceStub, TextGenerationAsyncServiceStub)
+WARM_UP_TIMEOUT = 30
+KEEPALIVE_TIMEOUT_MS = 10_000
+RECONNECT_DELAY = 1
+RETRY_MAX_DELAY = 300
+TTFT_HISTORY_SIZE = 100
+DATA_CLIENTS = f"{DOMAIN}_clients"
+
+
+def configure_keepalive(client: AsyncAIStudio, interval: int) -> None:
+    """Make channels opened by the client send keepalive pings every interval seconds."""
+    if not interval:
+        return
+
+    interval = max(interval, MIN_KEEPALIVE_INTERVAL)
+    cloud_client = client._client
+    options = (
+        *cloud_client._get_options(),
+        ("grpc.keepalive_time_ms", interval * 1000),
+        ("grpc.keepalive_timeout_ms", KEEPALIVE_TIMEOUT_MS),
+        ("grpc.keepalive_permit_without_calls", 1),
+        ("grpc.http2.max_pings_without_data", 0),
+    )
+    # The SDK has no public way to pass channel options. _get_options is private to
+    # yandex-ai-studio-sdk 0.20.2 pinned in manifest.json: check it still exists on upgrades
+    cloud_client._get_options = lambda: options  # type: ignore[method-assign]
+
+
+class ChannelWarmer:
+    """Keep conversation channels connected between requests.
+
+    Channels are opened at entry setup, so DNS, TLS and HTTP/2 setup don't
+    happen inside the first voice request. Whenever a channel drops to idle,
+    e.g. after a network change or an idle disconnect, it is reconnected.
+    """
+
+    def __init__(self, hass: HomeAssistant, client: AsyncAIStudio) -> None:
+        self.hass = hass
+        self.client = client
+        self._channels: list[grpc.aio.Channel] = []
+        self._tasks: list[asyncio.Task[None]] = []
+        self.ttft: dict[bool, deque[float]] = {
+            True: deque(maxlen=TTFT_HISTORY_SIZE),
+            False: deque(maxlen=TTFT_HISTORY_SIZE),
+        }
+
+    @property
+    def is_warm(self) -> bool:
+        """Return True if all conversation channels are connected."""
+        return len(self._channels) == len(WARM_STUBS) and all(
+            channel.get_state() == grpc.ChannelConnectivity.READY for channel in self._channels
+        )
+
+    def async_start(self) -> None:
+        """Start warming channels in the background."""
+        self._tasks = [
+            self.hass.async_create_background_task(
+                self._async_keep_warm(stub_class), f"Warm {stub_class.__name__} channel")
+            for stub_class in WARM_STUBS
+        ]
+
+    def async_stop(self) -> None:
+        """Stop warming channels."""
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def record_ttft(self, warm: bool, ttft: float) -> None:
+        """Record time to first token of a request."""
+        samples = self.ttft[warm]
+        samples.append(ttft)
+        LOGGER.debug(
+            "Time to first token %.2fs on a %s channel (median %.2fs over %d requests)",
+            ttft, "warm" if warm else "cold", statistics.median(samples), len(samples),
+        )
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return channel state and recent time to first token on warm and cold channels."""
+        return {
+            "warm": self.is_warm,
+            **{
+                f"{'warm' if warm else 'cold'}_ttft": {
+                    "median": round(statistics.median(samples), 3) if samples else None,
+                    "samples": [round(ttft, 3) for ttft in samples],
+                }
+                for warm, samples in self.ttft.items()
+            },
+        }
+
+    async def _async_get_channel(self, stub_class: type) -> grpc.aio.Channel:
+        """Open a channel, retrying while the network is unavailable."""
+        delay = RECONNECT_DELAY
+        while True:
+            try:
+                return await self.client._client._get_channel(stub_class, timeout=WARM_UP_TIMEOUT)
+            except Exception as err:  # pylint: disable=broad-except
+                LOGGER.debug("Failed to open %s channel, retrying in %ds: %s", stub_class.__name__, delay, err)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RETRY_MAX_DELAY)
+
+    async def _async_keep_warm(self, stub_class: type) -> None:
+        """Connect a channel and reconnect it whenever it goes idle."""
+        channel = await self._async_get_channel(stub_class)
+        self._channels.append(channel)
+
+        state = channel.get_state(try_to_connect=True)
+        while True:
+            # gRPC retries connections in transient failure itself, with backoff
+            await channel.wait_for_state_change(state)
+            state = channel.get_state()
+            if state == grpc.ChannelConnectivity.SHUTDOWN:
+                return
+            if state == grpc.ChannelConnectivity.READY:
+                LOGGER.debug("%s channel is connected", stub_class.__name__)
+            elif state == grpc.ChannelConnectivity.IDLE:
+                LOGGER.debug("%s channel is idle, reconnecting", stub_class.__name__)
+                await asyncio.sleep(RECONNECT_DELAY)
+                state = channel.get_state(try_to_connect=True)
+
+
+@dataclass
+class SharedClient:
+    """Client used by all config entries with the same credentials."""
+
+    key: tuple[str, str, bool, int]
+    client: AsyncAIStudio
+    warmer: ChannelWarmer
+    refs: int = 0
+
+
+class ClientRegistry:
+    """Reference-counted clients shared by config entries.
+
+    Entries with different prompts or models but the same folder and key
+    share channels and authentication instead of opening their own.
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        self.hass = hass
+        self._clients: dict[tuple[str, str, bool, int], SharedClient] = {}
+
+    def async_acquire(
+        self, folder_id: str, api_key: str, enable_server_data_logging: bool, keepalive_interval: int
+    ) -> SharedClient:
+        """Return a client for the credentials, creating it for the first user."""
+        # Keepalive is part of the key since it's set on the channels
+        key = (
+            folder_id,
+            hashlib.sha256(api_key.encode()).hexdigest(),
+            enable_server_data_logging,
+            keepalive_interval,
+        )
+        if (shared := self._clients.get(key)) is None:
+            client = AsyncAIStudio(
+                folder_id=folder_id,
+                auth=api_key,
+                enable_server_data_logging=enable_server_data_logging,
+            )
+            configure_keepalive(client, keepalive_interval)
+            warmer = ChannelWarmer(self.hass, client)
+            warmer.async_start()
+            shared = self._clients[key] = SharedClient(key, client, warmer)
+        else:
+            LOGGER.debug("Reusing client of folder %s", folder_id)
+
+        shared.refs += 1
+        return shared
+
+    async def async_release(self, shared: SharedClient) -> None:
+        """Release a client, closing its channels once nobody uses it."""
+        shared.refs -= 1
+        if shared.refs:
+            return
+
+        del self._clients[shared.key]
+        shared.warmer.async_stop()
+        for channel in list(shared.client._client._channels.values()):
+            await channel.close()
+
+
+def async_get_client_registry(hass: HomeAssistant) -> ClientRegistry:
+    """Return the client registry."""
+    if DATA_CLIENTS not in hass.data:
+        hass.data[DATA_CLIENTS] = ClientRegistry(hass)
+    return hass.data[DATA_CLIENTS]
@@ -20,25 +20,50 @@ from homeassistant.helpers.selector import (NumberSelector,
                                             SelectOptionDict, SelectSelector,
                                             SelectSelectorConfig,
                                             SelectSelectorMode,
-                                            TemplateSelector)
+                                            TemplateSelector, TextSelector,
+                                            TextSelectorConfig)
 
 from .const import (ASSIST_PARTIALLY_SUPPORTED_MODELS,
-                    ASSIST_UNSUPPORTED_MODELS, CHAT_MODELS,
+                    ASSIST_UNSUPPORTED_MODELS, CHAT_MODELS, CONF_ASYNC_TIMEOUT,
                     CONF_ASYNCHRONOUS_MODE, CONF_CHAT_MODEL,
-                    CONF_ENABLE_SERVER_DATA_LOGGING, CONF_FOLDER_ID,
-                    CONF_MAX_TOKENS, CONF_MAX_TOOL_ITERATIONS,
+                    CONF_ENABLE_SERVER_DATA_LOGGING, CONF_EXECUTION_MODE,
+                    CONF_EXTRA_ACCOUNTS, CONF_FALLBACK_MODEL, CONF_FOLDER_ID,
+                    CONF_HEDGE_DELAY, CONF_HEDGE_MODEL,
+                    CONF_HISTORY_TOKEN_BUDGET, CONF_KEEPALIVE_INTERVAL,
+                    CONF_LIVE_CONTEXT_DELTA, CONF_MAX_CONCURRENT_REQUESTS,
+                    CONF_MAX_QUEUED_REQUESTS, CONF_MAX_TOKENS,
+                    CONF_MAX_TOKENS_GOVERNOR, CONF_MAX_TOOL_ITERATIONS,
                     CONF_MODEL_VERSION, CONF_NO_HA_DEFAULT_PROMPT, CONF_PROMPT,
-                    CONF_RECOMMENDED, CONF_TEMPERATURE, DEFAULT_CHAT_MODEL,
-                    DEFAULT_ENABLE_SERVER_DATA_LOGGING,
-                    DEFAULT_INSTRUCTIONS_PROMPT_RU,
+                    CONF_RECOMMENDED, CONF_RESPONSE_CACHE,
+                    CONF_RESPONSE_CACHE_PERSISTENT, CONF_RESPONSE_CACHE_TTL,
+                    CONF_TEMPERATURE, CONF_TOOL_RESULT_DROP_EMPTY,
+                    CONF_TOOL_RESULT_MAX_BYTES,
+                    CONF_TOOL_SELECTION_ALWAYS_INCLUDE,
+                    CONF_TOOL_SELECTION_TOP_K, CONF_TRACE_TURNS,
+                    DEFAULT_ASYNC_TIMEOUT, DEFAULT_CHAT_MODEL,
+                    DEFAULT_ENABLE_SERVER_DATA_LOGGING, DEFAULT_FALLBACK_MODEL,
+                    DEFAULT_HEDGE_DELAY, DEFAULT_HEDGE_MODEL,
+                    DEFAULT_HISTORY_TOKEN_BUDGET,
+                    DEFAULT_INSTRUCTIONS_PROMPT_RU, DEFAULT_KEEPALIVE_INTERVAL,
+                    DEFAULT_LIVE_CONTEXT_DELTA,
+                    DEFAULT_MAX_CONCURRENT_REQUESTS,
+                    DEFAULT_MAX_QUEUED_REQUESTS, DEFAULT_MAX_TOKENS_GOVERNOR,
                     DEFAULT_MAX_TOOL_ITERATIONS, DEFAULT_MODEL_VERSION,
-                    DEFAULT_NO_HA_DEFAULT_PROMPT, DOMAIN,
+                    DEFAULT_NO_HA_DEFAULT_PROMPT, DEFAULT_RESPONSE_CACHE,
+                    DEFAULT_RESPONSE_CACHE_PERSISTENT,
+                    DEFAULT_RESPONSE_CACHE_TTL, DEFAULT_TOOL_RESULT_DROP_EMPTY,
+                    DEFAULT_TOOL_RESULT_MAX_BYTES,
+                    DEFAULT_TOOL_SELECTION_ALWAYS_INCLUDE,
+                    DEFAULT_TOOL_SELECTION_TOP_K, DEFAULT_TRACE_TURNS, DOMAIN,
+                    EXECUTION_MODE_AUTO, EXECUTION_MODE_DEFERRED,
+                    EXECUTION_MODE_STREAMING, MIN_KEEPALIVE_INTERVAL,
                     RECOMMENDED_MAX_TOKENS, RECOMMENDED_TEMPERATURE)
 
 STEP_USER_DATA_SCHEMA = vol.Schema(
     {
         vol.Required(CONF_FOLDER_ID): str,
         vol.Required(CONF_API_KEY): str,
+        vol.Optional(CONF_EXTRA_ACCOUNTS, default=""): TextSelector(TextSelectorConfig(multiline=True)),
     }
 )
 
@@ -51,6 +76,19 @@ RECOMMENDED_OPTIONS = {
 }
 
 
+def _parse_extra_accounts(user_input: dict[str, Any]) -> dict[str, Any]:
+    """Parse additional accounts given as folder_id:api_key lines."""
+    accounts = []
+    for line in user_input.get(CONF_EXTRA_ACCOUNTS, "").splitlines():
+        if not line.strip():
+            continue
+        folder_id, separator, api_key = line.partition(":")
+        if not separator or not folder_id.strip() or not api_key.strip():
+            raise vol.Invalid(f"Invalid account: {line}")
+        accounts.append({CONF_FOLDER_ID: folder_id.strip(), CONF_API_KEY: api_key.strip()})
+    return {**user_input, CONF_EXTRA_ACCOUNTS: accounts}
+
+
 class YandexGPTConfigFlow(ConfigFlow, domain=DOMAIN):
     """Handle a config flow for YandexGPT."""
 
@@ -61,17 +99,24 @@ class YandexGPTConfigFlow(ConfigFlow, domain=DOMAIN):
         self, user_input: dict[str, Any] | None = None
     ) -> ConfigFlowResult:
         """Handle the initial step."""
+        errors: dict[str, str] = {}
 
         if user_input is not None:
-            return self.async_create_entry(
-                title="YandexGPT",
-                data=user_input,
-                options=RECOMMENDED_OPTIONS,
-            )
+            try:
+                user_input = _parse_extra_accounts(user_input)
+            except vol.Invalid:
+                errors[CONF_EXTRA_ACCOUNTS] = "invalid_extra_accounts"
+            else:
+                return self.async_create_entry(
+                    title="YandexGPT",
+                    data=user_input,
+                    options=RECOMMENDED_OPTIONS,
+                )
 
         return self.async_show_form(
             step_id="user",
             data_schema=STEP_USER_DATA_SCHEMA,
+            errors=errors,
         )
 
     async def async_step_reconfigure(
@@ -80,16 +125,23 @@ class YandexGPTConfigFlow(ConfigFlow, domain=DOMAIN):
         """User initiated reconfiguration."""
 
         entry = self._get_reconfigure_entry()
+        errors: dict[str, str] = {}
 
         if user_input is not None:
-            return self.async_update_reload_and_abort(
-                entry,
-                data_updates=user_input,
-            )
+            try:
+                user_input = _parse_extra_accounts(user_input)
+            except vol.Invalid:
+                errors[CONF_EXTRA_ACCOUNTS] = "invalid_extra_accounts"
+            else:
+                return self.async_update_reload_and_abort(
+                    entry,
+                    data_updates=user_input,
+                )
 
         return self.async_show_form(
             step_id="reconfigure",
             data_schema=STEP_USER_DATA_SCHEMA,
+            errors=errors,
         )
 
     @staticmethod
@@ -121,6 +173,7 @@ class YandexGPTOptionsFlow(OptionsFlow):
                     user_input.pop(CONF_LLM_HASS_API, None)
 
                 self._validate_selected_model(user_input)
+                self._validate_keepalive_interval(user_input)
 
                 if not self.errors:
                     return self.async_create_entry(title="", data=user_input)
@@ -183,6 +236,14 @@ class YandexGPTOptionsFlow(OptionsFlow):
 
         self.last_selected_model = selected_model
 
+    def _validate_keepalive_interval(self, user_input: dict[str, Any]) -> None:
+        """Validate that keepalive pings are either disabled or not too frequent."""
+        interval = user_input.get(CONF_KEEPALIVE_INTERVAL, DEFAULT_KEEPALIVE_INTERVAL)
+        if 0 < interval < MIN_KEEPALIVE_INTERVAL:
+            self.errors[CONF_KEEPALIVE_INTERVAL] = "keepalive_interval_too_short"
+        else:
+            self.errors.pop(CONF_KEEPALIVE_INTERVAL, None)
+
 
 def yandexgpt_config_option_schema(
     hass: HomeAssistant,
@@ -234,6 +295,19 @@ def yandexgpt_config_option_schema(
         SelectOptionDict(label="Release Candidate", value="rc"),
     ]
 
+    fallback_models = [SelectOptionDict(label="None", value=DEFAULT_FALLBACK_MODEL), *chat_models]
+
+    execution_modes = [
+        SelectOptionDict(label="Streaming", value=EXECUTION_MODE_STREAMING),
+        SelectOptionDict(label="Asynchronous", value=EXECUTION_MODE_DEFERRED),
+        SelectOptionDict(label="Automatic: asynchronous for automations", value=EXECUTION_MODE_AUTO),
+    ]
+    # Migration: old asynchronous mode switch → execution mode
+    default_execution_mode = options.get(
+        CONF_EXECUTION_MODE,
+        EXECUTION_MODE_DEFERRED if options.get(CONF_ASYNCHRONOUS_MODE) else EXECUTION_MODE_STREAMING,
+    )
+
     schema.update(
         {
             vol.Optional(
@@ -243,6 +317,25 @@ def yandexgpt_config_option_schema(
             ): SelectSelector(
                 SelectSelectorConfig(mode=SelectSelectorMode.DROPDOWN, options=model_versions)
             ),
+            vol.Optional(
+                CONF_FALLBACK_MODEL,
+                description={"suggested_value": options.get(CONF_FALLBACK_MODEL)},
+                default=options.get(CONF_FALLBACK_MODEL, DEFAULT_FALLBACK_MODEL),
+            ): SelectSelector(
+                SelectSelectorConfig(mode=SelectSelectorMode.DROPDOWN, options=fallback_models)
+            ),
+            vol.Optional(
+                CONF_HEDGE_MODEL,
+                description={"suggested_value": options.get(CONF_HEDGE_MODEL)},
+                default=options.get(CONF_HEDGE_MODEL, DEFAULT_HEDGE_MODEL),
+            ): SelectSelector(
+                SelectSelectorConfig(mode=SelectSelectorMode.DROPDOWN, options=fallback_models)
+            ),
+            vol.Optional(
+                CONF_HEDGE_DELAY,
+                description={"suggested_value": options.get(CONF_HEDGE_DELAY)},
+                default=options.get(CONF_HEDGE_DELAY, DEFAULT_HEDGE_DELAY),
+            ): vol.All(int, vol.Range(min=0)),
             vol.Optional(
                 CONF_TEMPERATURE,
                 description={"suggested_value": options.get(CONF_TEMPERATURE)},
@@ -253,6 +346,11 @@ def yandexgpt_config_option_schema(
                 description={"suggested_value": options.get(CONF_MAX_TOKENS)},
                 default=RECOMMENDED_MAX_TOKENS,
             ): int,
+            vol.Optional(
+                CONF_MAX_TOKENS_GOVERNOR,
+                description={"suggested_value": options.get(CONF_MAX_TOKENS_GOVERNOR)},
+                default=options.get(CONF_MAX_TOKENS_GOVERNOR, DEFAULT_MAX_TOKENS_GOVERNOR),
+            ): bool,
             vol.Optional(
                 CONF_NO_HA_DEFAULT_PROMPT,
                 description={"suggested_value": options.get(CONF_NO_HA_DEFAULT_PROMPT, DEFAULT_NO_HA_DEFAULT_PROMPT)},
@@ -264,9 +362,81 @@ def yandexgpt_config_option_schema(
                 default=options.get(CONF_MAX_TOOL_ITERATIONS, DEFAULT_MAX_TOOL_ITERATIONS),
             ): int,
             vol.Optional(
-                CONF_ASYNCHRONOUS_MODE,
-                description={"suggested_value": options.get(CONF_ASYNCHRONOUS_MODE)},
-                default=options.get(CONF_ASYNCHRONOUS_MODE, False),
+                CONF_TOOL_RESULT_DROP_EMPTY,
+                description={"suggested_value": options.get(CONF_TOOL_RESULT_DROP_EMPTY)},
+                default=options.get(CONF_TOOL_RESULT_DROP_EMPTY, DEFAULT_TOOL_RESULT_DROP_EMPTY),
+            ): bool,
+            vol.Optional(
+                CONF_TOOL_RESULT_MAX_BYTES,
+                description={"suggested_value": options.get(CONF_TOOL_RESULT_MAX_BYTES)},
+                default=options.get(CONF_TOOL_RESULT_MAX_BYTES, DEFAULT_TOOL_RESULT_MAX_BYTES),
+            ): int,
+            vol.Optional(
+                CONF_LIVE_CONTEXT_DELTA,
+                description={"suggested_value": options.get(CONF_LIVE_CONTEXT_DELTA)},
+                default=options.get(CONF_LIVE_CONTEXT_DELTA, DEFAULT_LIVE_CONTEXT_DELTA),
+            ): bool,
+            vol.Optional(
+                CONF_HISTORY_TOKEN_BUDGET,
+                description={"suggested_value": options.get(CONF_HISTORY_TOKEN_BUDGET)},
+                default=options.get(CONF_HISTORY_TOKEN_BUDGET, DEFAULT_HISTORY_TOKEN_BUDGET),
+            ): int,
+            vol.Optional(
+                CONF_TOOL_SELECTION_TOP_K,
+                description={"suggested_value": options.get(CONF_TOOL_SELECTION_TOP_K)},
+                default=options.get(CONF_TOOL_SELECTION_TOP_K, DEFAULT_TOOL_SELECTION_TOP_K),
+            ): vol.All(int, vol.Range(min=0)),
+            vol.Optional(
+                CONF_TOOL_SELECTION_ALWAYS_INCLUDE,
+                description={"suggested_value": options.get(CONF_TOOL_SELECTION_ALWAYS_INCLUDE)},
+                default=options.get(CONF_TOOL_SELECTION_ALWAYS_INCLUDE, DEFAULT_TOOL_SELECTION_ALWAYS_INCLUDE),
+            ): str,
+            vol.Optional(
+                CONF_EXECUTION_MODE,
+                description={"suggested_value": default_execution_mode},
+                default=default_execution_mode,
+            ): SelectSelector(
+                SelectSelectorConfig(mode=SelectSelectorMode.DROPDOWN, options=execution_modes)
+            ),
+            vol.Optional(
+                CONF_ASYNC_TIMEOUT,
+                description={"suggested_value": options.get(CONF_ASYNC_TIMEOUT)},
+                default=options.get(CONF_ASYNC_TIMEOUT, DEFAULT_ASYNC_TIMEOUT),
+            ): int,
+            vol.Optional(
+                CONF_KEEPALIVE_INTERVAL,
+                description={"suggested_value": options.get(CONF_KEEPALIVE_INTERVAL)},
+                default=options.get(CONF_KEEPALIVE_INTERVAL, DEFAULT_KEEPALIVE_INTERVAL),
+            ): vol.All(int, vol.Range(min=0)),
+            vol.Optional(
+                CONF_MAX_CONCURRENT_REQUESTS,
+                description={"suggested_value": options.get(CONF_MAX_CONCURRENT_REQUESTS)},
+                default=options.get(CONF_MAX_CONCURRENT_REQUESTS, DEFAULT_MAX_CONCURRENT_REQUESTS),
+            ): vol.All(int, vol.Range(min=0)),
+            vol.Optional(
+                CONF_MAX_QUEUED_REQUESTS,
+                description={"suggested_value": options.get(CONF_MAX_QUEUED_REQUESTS)},
+                default=options.get(CONF_MAX_QUEUED_REQUESTS, DEFAULT_MAX_QUEUED_REQUESTS),
+            ): vol.All(int, vol.Range(min=0)),
+            vol.Optional(
+                CONF_RESPONSE_CACHE,
+                description={"suggested_value": options.get(CONF_RESPONSE_CACHE)},
+                default=options.get(CONF_RESPONSE_CACHE, DEFAULT_RESPONSE_CACHE),
+            ): bool,
+            vol.Optional(
+                CONF_RESPONSE_CACHE_TTL,
+                description={"suggested_value": options.get(CONF_RESPONSE_CACHE_TTL)},
+                default=options.get(CONF_RESPONSE_CACHE_TTL, DEFAULT_RESPONSE_CACHE_TTL),
+            ): int,
+            vol.Optional(
+                CONF_RESPONSE_CACHE_PERSISTENT,
+                description={"suggested_value": options.get(CONF_RESPONSE_CACHE_PERSISTENT)},
+                default=options.get(CONF_RESPONSE_CACHE_PERSISTENT, DEFAULT_RESPONSE_CACHE_PERSISTENT),
+            ): bool,
+            vol.Optional(
+                CONF_TRACE_TURNS,
+                description={"suggested_value": options.get(CONF_TRACE_TURNS)},
+                default=options.get(CONF_TRACE_TURNS, DEFAULT_TRACE_TURNS),
             ): bool,
         }
     )
@@ -10,28 +10,89 @@ DOMAIN = "yandexgpt_conversation"
 LOGGER = logging.getLogger(__package__)
 
 CONF_FOLDER_ID = "folder_id"
+CONF_EXTRA_ACCOUNTS = "extra_accounts"
 CONF_PROMPT = "prompt"
 CONF_RECOMMENDED = "recommended"
 CONF_MAX_TOKENS = "max_tokens"
 CONF_TEMPERATURE = "temperature"
 CONF_CHAT_MODEL = "chat_model"
+CONF_FALLBACK_MODEL = "fallback_model"
+CONF_HEDGE_MODEL = "hedge_model"
+CONF_HEDGE_DELAY = "hedge_delay"
 CONF_MODEL_VERSION = "model_version"
 CONF_ENABLE_SERVER_DATA_LOGGING = "enable_server_data_logging"
 CONF_ASYNCHRONOUS_MODE = "asynchronous_mode"
+CONF_ASYNC_TIMEOUT = "async_timeout"
+CONF_EXECUTION_MODE = "execution_mode"
+CONF_RESPONSE_CACHE = "response_cache"
+CONF_RESPONSE_CACHE_TTL = "response_cache_ttl"
+CONF_RESPONSE_CACHE_PERSISTENT = "response_cache_persistent"
 CONF_MAX_TOOL_ITERATIONS = "max_tool_iterations"
 CONF_NO_HA_DEFAULT_PROMPT = "no_ha_default_prompt"
+CONF_TOOL_RESULT_DROP_EMPTY = "tool_result_drop_empty"
+CONF_TOOL_RESULT_MAX_BYTES = "tool_result_max_bytes"
+CONF_LIVE_CONTEXT_DELTA = "live_context_delta"
+CONF_HISTORY_TOKEN_BUDGET = "history_token_budget"
+CONF_MAX_TOKENS_GOVERNOR = "max_tokens_governor"
+CONF_TRACE_TURNS = "trace_turns"
+CONF_TOOL_SELECTION_TOP_K = "tool_selection_top_k"
+CONF_TOOL_SELECTION_ALWAYS_INCLUDE = "tool_selection_always_include"
+CONF_KEEPALIVE_INTERVAL = "keepalive_interval"
+CONF_MAX_CONCURRENT_REQUESTS = "max_concurrent_requests"
+CONF_MAX_QUEUED_REQUESTS = "max_queued_requests"
 DEFAULT_CHAT_MODEL = "yandexgpt-lite"
+DEFAULT_FALLBACK_MODEL = "none"
+DEFAULT_HEDGE_MODEL = "none"
+DEFAULT_HEDGE_DELAY = 0
 DEFAULT_MODEL_VERSION = "latest"
 DEFAULT_NO_HA_DEFAULT_PROMPT = False
 DEFAULT_ENABLE_SERVER_DATA_LOGGING = True
 DEFAULT_MAX_TOOL_ITERATIONS = 10
+DEFAULT_ASYNC_TIMEOUT = 300
+DEFAULT_KEEPALIVE_INTERVAL = 300
+# More frequent pings get answered with GOAWAY too_many_pings by gRPC servers
+MIN_KEEPALIVE_INTERVAL = 60
+DEFAULT_MAX_CONCURRENT_REQUESTS = 4
+DEFAULT_MAX_QUEUED_REQUESTS = 16
+DEFAULT_RESPONSE_CACHE = False
+DEFAULT_RESPONSE_CACHE_TTL = 3600
+DEFAULT_RESPONSE_CACHE_PERSISTENT = False
+EXECUTION_MODE_STREAMING = "streaming"
+EXECUTION_MODE_DEFERRED = "deferred"
+EXECUTION_MODE_AUTO = "auto"
+DEFAULT_IMAGE_GENERATION_TIMEOUT = 3600
+DEFAULT_IMAGE_CACHE_MAX_BYTES = 200 * 1024 * 1024
+DEFAULT_IMAGE_MAX_CONCURRENCY = 4
+DEFAULT_IMAGE_MEMORY_MAX_BYTES = 32 * 1024 * 1024
+DEFAULT_POLL_MIN_INTERVAL = 0.2
+DEFAULT_POLL_MAX_INTERVAL = 5.0
+DEFAULT_TOOL_RESULT_DROP_EMPTY = False
+DEFAULT_TOOL_RESULT_MAX_BYTES = 0
+DEFAULT_LIVE_CONTEXT_DELTA = False
+DEFAULT_TOOL_SELECTION_TOP_K = 0
 RECOMMENDED_MAX_TOKENS = 1024
+DEFAULT_TOOL_CACHE_SIZE = 256
+DEFAULT_HISTORY_CACHE_SIZE = 32
+DEFAULT_HISTORY_TOKEN_BUDGET = 0
+DEFAULT_MAX_TOKENS_GOVERNOR = False
+DEFAULT_TRACE_TURNS = False
+DEFAULT_TOKEN_CACHE_SIZE = 1024
+DEFAULT_PROMPT_CACHE_TTL = 300
+DEFAULT_COMPLETION_CACHE_SIZE = 128
+DEFAULT_COMPLETION_DISK_CACHE_SIZE = 1024
 RECOMMENDED_TEMPERATURE = 0.6
 
 DEFAULT_INSTRUCTIONS_PROMPT_RU = """Ты — голосовой ассистент для Home Assistant.
 Отвечай на вопросы правдиво. Отвечай кратко, чётко и на русском языке.
 """
 
+HISTORY_SUMMARY_MODEL = "yandexgpt-lite"
+HISTORY_SUMMARY_PROMPT_RU = """Кратко перескажи разговор пользователя с голосовым ассистентом умного дома.
+Сохрани факты, просьбы пользователя, действия ассистента и договорённости, важные для продолжения разговора.
+Ничего не добавляй от себя.
+"""
+HISTORY_SUMMARY_HEADER_RU = "Краткое содержание начала разговора:"
+
 CHAT_MODELS = (
     ("yandexgpt-lite", "YandexGPT Lite"),
     ("yandexgpt", "YandexGPT Pro"),
@@ -41,6 +102,14 @@ CHAT_MODELS = (
 ASSIST_UNSUPPORTED_MODELS = []
 ASSIST_PARTIALLY_SUPPORTED_MODELS = ["yandexgpt-lite"]
 
+LIVE_CONTEXT_TOOL_NAME = "GetLiveContext"
+DEFAULT_TOOL_SELECTION_ALWAYS_INCLUDE = LIVE_CONTEXT_TOOL_NAME
+
+IMAGE_GENERATION_MODEL = "yandex-art"
+
 ATTR_FILENAME = "file_name"
 ATTR_SEED = "seed"
 ATTR_PROMPT = "prompt"
+ATTR_IMAGES = "images"
+ATTR_MAX_CONCURRENCY = "max_concurrency"
+ATTR_KEEP_IN_MEMORY = "keep_in_memory"
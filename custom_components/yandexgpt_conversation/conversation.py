@@ -6,29 +6,51 @@
 
 from __future__ import annotations
 
-from typing import Literal
+import asyncio
+import statistics
+from collections import defaultdict, deque
+from collections.abc import AsyncIterator
+from enum import StrEnum
+from functools import partial
+from time import monotonic
+from typing import TYPE_CHECKING, Any, Literal
 
 from grpc.aio import AioRpcError
 from homeassistant.components import conversation
+from homeassistant.components.homeassistant.exposed_entities import \
+    async_listen_entity_updates
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import CONF_LLM_HASS_API, MATCH_ALL
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.exceptions import HomeAssistantError, TemplateError
+from homeassistant.helpers import chat_session
 from homeassistant.helpers import device_registry as dr
-from homeassistant.helpers import intent, template
+from homeassistant.helpers import intent
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
-from yandex_ai_studio_sdk import AsyncAIStudio
-from yandex_ai_studio_sdk._models.completions.message import \
-    CompletionsMessageType
-
-from .const import (CONF_ASYNCHRONOUS_MODE, CONF_CHAT_MODEL, CONF_MAX_TOKENS,
-                    CONF_MAX_TOOL_ITERATIONS, CONF_MODEL_VERSION,
-                    CONF_NO_HA_DEFAULT_PROMPT, CONF_PROMPT, CONF_TEMPERATURE,
-                    DEFAULT_CHAT_MODEL, DEFAULT_INSTRUCTIONS_PROMPT_RU,
-                    DEFAULT_MAX_TOOL_ITERATIONS, DEFAULT_MODEL_VERSION,
-                    DEFAULT_NO_HA_DEFAULT_PROMPT, DOMAIN, LOGGER,
-                    RECOMMENDED_MAX_TOKENS, RECOMMENDED_TEMPERATURE)
+
+from .cache import CompletionCache, LRUCache, ToolCache
+from .const import (DEFAULT_HISTORY_CACHE_SIZE, DOMAIN, EXECUTION_MODE_AUTO,
+                    EXECUTION_MODE_DEFERRED, EXECUTION_MODE_STREAMING, LOGGER)
+from .hedging import hedged_stream
+from .history import ConversationHistory, HistoryCompactor
 from .mappers import ContentConverter, StreamTransformer
+from .metrics import TurnTrace
+from .prompt import PromptTemplateCache
+from .resilience import (RETRY_ATTEMPTS, is_backend_failure, is_transient,
+                         retry_delay)
+from .runtime import YandexGPTRuntimeData
+
+if TYPE_CHECKING:
+    from yandex_ai_studio_sdk._models.completions.message import \
+        CompletionsMessageType
+    from yandex_ai_studio_sdk._models.completions.model import AsyncGPTModel
+    from yandex_ai_studio_sdk._models.completions.result import GPTModelResult
+    from yandex_ai_studio_sdk._tools.tool import FunctionTool
+
+    from .accounts import Account
+    from .admission import AdmissionSlot
+
+LATENCY_HISTORY_SIZE = 100
 
 
 async def async_setup_entry(
@@ -41,6 +63,73 @@ async def async_setup_entry(
     async_add_entities([agent])
 
 
+class RequestOrigin(StrEnum):
+    """Where a conversation request came from."""
+
+    VOICE = "voice"
+    INTERACTIVE = "interactive"
+    AUTOMATION = "automation"
+
+    @property
+    def priority(self) -> int:
+        """Return admission priority of the origin, lower goes first."""
+        return ORIGIN_PRIORITIES[self]
+
+    @classmethod
+    def from_user_input(cls, user_input: conversation.ConversationInput) -> RequestOrigin:
+        """Guess the origin of a request from the conversation input."""
+        if user_input.satellite_id or user_input.device_id:
+            return cls.VOICE
+        if user_input.context.user_id:
+            return cls.INTERACTIVE
+        return cls.AUTOMATION
+
+
+ORIGIN_PRIORITIES = {RequestOrigin.VOICE: 0, RequestOrigin.INTERACTIVE: 1, RequestOrigin.AUTOMATION: 2}
+
+
+class ExecutionScheduler:
+    """Pick streaming or deferred execution for each request.
+
+    Voice and chat need the lowest time to first token, so in the automatic
+    mode only requests with neither a user nor a device behind them
+    (automations, scripts) go to the cheaper deferred API.
+    """
+
+    def __init__(self) -> None:
+        self.latencies: defaultdict[tuple[RequestOrigin, str], deque[float]] = defaultdict(
+            lambda: deque(maxlen=LATENCY_HISTORY_SIZE))
+
+    @staticmethod
+    def select(policy: str, origin: RequestOrigin) -> str:
+        """Return execution mode for a request."""
+        if policy != EXECUTION_MODE_AUTO:
+            return policy
+        if origin == RequestOrigin.AUTOMATION:
+            return EXECUTION_MODE_DEFERRED
+        return EXECUTION_MODE_STREAMING
+
+    def record(self, origin: RequestOrigin, mode: str, latency: float) -> None:
+        """Record how long a request took in the selected mode."""
+        samples = self.latencies[(origin, mode)]
+        samples.append(latency)
+        LOGGER.debug(
+            "%s request took %.2fs in %s mode (median %.2fs over %d requests)",
+            origin, latency, mode, statistics.median(samples), len(samples),
+        )
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return recent request latencies by origin and execution mode."""
+        return {
+            f"{origin}/{mode}": {
+                "median": round(statistics.median(samples), 3),
+                "samples": [round(latency, 3) for latency in samples],
+            }
+            for (origin, mode), samples in self.latencies.items()
+            if samples
+        }
+
+
 class YandexGPTConversationEntity(
     conversation.ConversationEntity, conversation.AbstractConversationAgent  # type: ignore
 ):
@@ -61,11 +150,41 @@ class YandexGPTConversationEntity(
             model="YandexGPT",
             entry_type=dr.DeviceEntryType.SERVICE,
         )
+        self._tool_cache = ToolCache()
+        self._histories: LRUCache[str, ConversationHistory] = LRUCache(DEFAULT_HISTORY_CACHE_SIZE)
+        self._prompt_cache: PromptTemplateCache | None = None
+        self._compactor: HistoryCompactor | None = None
         if self.entry.options.get(CONF_LLM_HASS_API):
             self._attr_supported_features = (
                 conversation.ConversationEntityFeature.CONTROL
             )
 
+    async def async_added_to_hass(self) -> None:
+        """When entity is added to Home Assistant."""
+        await super().async_added_to_hass()
+        self.async_on_remove(
+            async_listen_entity_updates(self.hass, conversation.DOMAIN, self._async_exposed_entities_updated)
+        )
+        self._prompt_cache = PromptTemplateCache(self.hass)
+        self.async_on_remove(self._prompt_cache.async_invalidate)
+        self._compactor = HistoryCompactor(self.hass)
+        self.async_on_remove(self._compactor.async_cancel)
+
+    @callback
+    def _async_exposed_entities_updated(self) -> None:
+        """Drop converted tools, they may depend on the exposed entities."""
+        self._tool_cache.clear()
+
+    def _get_history(self, conversation_id: str) -> ConversationHistory:
+        """Return converted history of a conversation, dropped when the chat session expires."""
+        history = self._histories.get(conversation_id)
+        if history is None:
+            history = ConversationHistory()
+            self._histories.put(conversation_id, history)
+            if session := chat_session.current_session.get():
+                session.async_on_cleanup(partial(self._histories.pop, conversation_id))
+        return history
+
     @property
     def supported_languages(self) -> list[str] | Literal["*"]:
         """Return a list of supported languages."""
@@ -77,76 +196,104 @@ class YandexGPTConversationEntity(
         chat_log: conversation.ChatLog,
     ) -> conversation.ConversationResult:
         """Process a conversation with YandexGPT."""
-        settings = {**self.entry.data, **self.entry.options}
-
-        system_prompt = settings.get(CONF_PROMPT, DEFAULT_INSTRUCTIONS_PROMPT_RU)
+        runtime_data: YandexGPTRuntimeData = self.entry.runtime_data
+        settings = runtime_data.settings
+        trace = TurnTrace()
 
         try:
-            await chat_log.async_provide_llm_data(
-                user_input.as_llm_context(DOMAIN),
-                settings.get(CONF_LLM_HASS_API),
-                system_prompt,
-                user_input.extra_system_prompt,
-            )
+            with trace.span("provide_llm_data"):
+                await chat_log.async_provide_llm_data(
+                    user_input.as_llm_context(DOMAIN),
+                    settings.llm_hass_api,
+                    settings.prompt,
+                    user_input.extra_system_prompt,
+                )
         except conversation.ConverseError as err:
             return err.as_conversation_result()
 
-        client: AsyncAIStudio = self.entry.runtime_data
-        model_name = settings.get(CONF_CHAT_MODEL, DEFAULT_CHAT_MODEL).split("/")[0]
-        model_ver = settings.get(CONF_MODEL_VERSION, DEFAULT_MODEL_VERSION)
-        model_conf = {
-            "temperature": settings.get(CONF_TEMPERATURE, RECOMMENDED_TEMPERATURE),
-            "max_tokens": settings.get(CONF_MAX_TOKENS, RECOMMENDED_MAX_TOKENS),
-        }
-
-        no_ha_default_prompt = settings.get(CONF_NO_HA_DEFAULT_PROMPT, DEFAULT_NO_HA_DEFAULT_PROMPT)
-        system_prompt_override = await self._async_expand_prompt_template(
-            system_prompt, user_input) if no_ha_default_prompt else None
-
-        content_converter = ContentConverter(system_prompt_override=system_prompt_override)
-        messages: list[CompletionsMessageType] = content_converter.to_yandexgpt_api(chat_log.content)
+        system_prompt_override = None
+        if settings.no_ha_default_prompt:
+            with trace.span("prompt_template"):
+                system_prompt_override = await self._async_expand_prompt_template(settings.prompt, user_input)
+
+        history = self._get_history(chat_log.conversation_id)
+        live_context = history.live_context
+        if not settings.live_context_delta:
+            # Don't leave a stale snapshot behind in case the option gets enabled later
+            live_context.reset()
+            live_context = None
+        with trace.span("conversion"):
+            messages: list[CompletionsMessageType] = history.sync(
+                chat_log.content,
+                ContentConverter(system_prompt_override=system_prompt_override,
+                                 tool_result_encoder=settings.tool_result_encoder,
+                                 live_context=live_context),
+            )
 
+        tools = None
         if chat_log.llm_api:
-            model_conf["tools"] = [
-                ContentConverter.format_tool(client, tool, chat_log.llm_api.custom_serializer)
-                for tool in chat_log.llm_api.tools
-            ]
+            with trace.span("tools"):
+                tools = self._tool_cache.get_tools(runtime_data.client, chat_log.llm_api)
+                LOGGER.debug("Tool cache: %d hits, %d misses", self._tool_cache.hits, self._tool_cache.misses)
+                if settings.tool_selection_top_k:
+                    tools = await runtime_data.tool_selector.async_select(
+                        runtime_data.client,
+                        chat_log.llm_api,
+                        tools,
+                        user_input.text,
+                        settings.tool_selection_top_k,
+                        settings.tool_selection_always_include,
+                    )
 
-        try:
-            model = client.models.completions(model_name, model_version=model_ver)
-            configured_model = model.configure(**model_conf)
+        origin = RequestOrigin.from_user_input(user_input)
+        execution_mode = runtime_data.scheduler.select(settings.execution_mode, origin)
+        model_conf = dict(settings.model_conf)
+        max_tokens: int | None = None
+        # Automations may ask for long texts, they keep the configured headroom
+        if settings.max_tokens_governor and origin != RequestOrigin.AUTOMATION:
+            governed = runtime_data.governor.max_tokens(origin, model_conf["max_tokens"])
+            if governed < model_conf["max_tokens"]:
+                max_tokens = model_conf["max_tokens"] = governed
+        # Only completions without tools and randomness can be reused
+        cache_key: str | None = None
+        cached_text: str | None = None
+        if settings.response_cache and not chat_log.llm_api and settings.model_conf["temperature"] == 0:
+            cache_key = CompletionCache.make_key(
+                settings.model_name, settings.model_version, model_conf, messages)
+        if cache_key:
+            cached_text = await runtime_data.completion_cache.async_get(cache_key, settings.response_cache_persistent)
+            LOGGER.debug(
+                "Completion cache: %d hits, %d misses",
+                runtime_data.completion_cache.hits, runtime_data.completion_cache.misses,
+            )
 
-            max_tool_iterations = settings.get(CONF_MAX_TOOL_ITERATIONS, DEFAULT_MAX_TOOL_ITERATIONS)
-            for _iteration in range(max_tool_iterations):
+        started = monotonic()
+        used_fallback = False
+        try:
+            for _iteration in range(settings.max_tool_iterations):
                 LOGGER.debug("Prompt: %s", messages)
 
-                if settings.get(CONF_ASYNCHRONOUS_MODE, False):
-                    operation = await configured_model.run_deferred(messages)
-                    LOGGER.debug("Async operation ID: %s", operation.id)
-                    result = await operation.wait(poll_timeout=300, poll_interval=0.5)
-
-                    async def single_result_stream():
-                        yield result
-
-                    response_stream = single_result_stream()
+                if cached_text is not None:
+                    stream_transformer = StreamTransformer(CompletionCache.replay(cached_text))
+                    with trace.span("stream", cached=True):
+                        async for _content in chat_log.async_add_delta_content_stream(
+                            user_input.agent_id,
+                            stream_transformer.to_chatlog_api(),
+                        ):
+                            pass
                 else:
-                    response_stream = configured_model.run_stream(messages)
-
-                stream_transformer = StreamTransformer(response_stream)
-                content_converter = ContentConverter(
-                    stream_transformer=stream_transformer, system_prompt_override=system_prompt_override)
-
-                messages.extend(
-                    content_converter.to_yandexgpt_api(
-                        [
-                            content
-                            async for content in chat_log.async_add_delta_content_stream(
-                                user_input.agent_id,
-                                stream_transformer.to_chatlog_api(),
-                            )
-                        ]
+                    stream_transformer, fallback = await self._async_complete(
+                        runtime_data, user_input, chat_log, messages, tools, execution_mode, origin, max_tokens, trace)
+                    used_fallback |= fallback
+
+                with trace.span("conversion"):
+                    messages = history.sync(
+                        chat_log.content,
+                        ContentConverter(stream_transformer=stream_transformer,
+                                         system_prompt_override=system_prompt_override,
+                                         tool_result_encoder=settings.tool_result_encoder,
+                                         live_context=live_context),
                     )
-                )
 
                 if not chat_log.unresponded_tool_results:
                     break
@@ -164,8 +311,31 @@ class YandexGPTConversationEntity(
                 translation_placeholders={"details": "Async operation timed out"},
             ) from err
 
-        intent_response = intent.IntentResponse(language=user_input.language)
+        # Time spent in the admission queue is tracked separately
+        runtime_data.scheduler.record(
+            origin, execution_mode, monotonic() - started - trace.durations().get("queue", 0.0))
+
+        if settings.history_token_budget:
+            assert self._compactor is not None
+            self._compactor.async_schedule(
+                history, runtime_data.client, runtime_data.accounts.primary.model, settings.history_token_budget)
+
         assert type(chat_log.content[-1]) is conversation.AssistantContent
+        # The cache key names the main model, don't store what the fallback said
+        if cache_key and cached_text is None and not used_fallback and chat_log.content[-1].content:
+            await runtime_data.completion_cache.async_put(
+                cache_key,
+                chat_log.content[-1].content,
+                settings.response_cache_ttl,
+                settings.response_cache_persistent,
+            )
+
+        trace.add("turn", trace.started, monotonic(), origin=origin, execution_mode=execution_mode)
+        runtime_data.metrics.async_record(trace)
+        if settings.trace_turns:
+            runtime_data.trace_writer.async_write(trace, chat_log.conversation_id)
+
+        intent_response = intent.IntentResponse(language=user_input.language)
         intent_response.async_set_speech(chat_log.content[-1].content or "")
         return conversation.ConversationResult(
             response=intent_response,
@@ -173,12 +343,157 @@ class YandexGPTConversationEntity(
             continue_conversation=chat_log.continue_conversation,
         )
 
+    async def _async_complete(
+        self,
+        runtime_data: YandexGPTRuntimeData,
+        user_input: conversation.ConversationInput,
+        chat_log: conversation.ChatLog,
+        messages: list[CompletionsMessageType],
+        tools: list[FunctionTool] | None,
+        execution_mode: str,
+        origin: RequestOrigin,
+        max_tokens: int | None,
+        trace: TurnTrace,
+    ) -> tuple[StreamTransformer, bool]:
+        """Stream a completion into the chat log, retrying transient errors.
+
+        Requests are only retried, on another account if there is one, until
+        the first delta reaches the chat log. While the circuit breaker is
+        open they go to the fallback model, or fail right away without one.
+        Slow voice and chat streams are raced against the hedge model. Usage
+        of the completion is recorded. Return the transformer and whether the fallback model answered.
+
+        Each attempt holds an admission slot only until the model is done
+        answering, tool calls and polling of deferred operations don't keep it.
+        """
+        settings = runtime_data.settings
+        breaker = runtime_data.breaker
+        tried: list[Account] = []
+        attempt = 0
+
+        while True:
+            use_fallback = not breaker.allow()
+            if use_fallback and settings.fallback_model is None:
+                raise HomeAssistantError(translation_domain=DOMAIN, translation_key="service_unavailable")
+
+            queued = monotonic()
+            slot = await runtime_data.admission.async_acquire(origin, origin.priority)
+            stream_transformer: StreamTransformer | None = None
+            started = monotonic()
+            trace.add("queue", queued, started, attempt=attempt)
+            try:
+                with slot, runtime_data.accounts.lease(exclude=tuple(tried)) as account:
+                    model = account.fallback_model if use_fallback else account.model
+                    assert model is not None
+                    hedge_model = (
+                        account.hedge_model if origin != RequestOrigin.AUTOMATION and not use_fallback else None
+                    )
+                    request_conf: dict[str, Any] = {}
+                    if tools:
+                        request_conf["tools"] = tools
+                    if max_tokens is not None:
+                        request_conf["max_tokens"] = max_tokens
+                    if request_conf:
+                        model = model.configure(**request_conf)
+                        if hedge_model is not None:
+                            hedge_model = hedge_model.configure(**request_conf)
+                    warm = account.shared.warmer.is_warm
+                    model_name = settings.fallback_model if use_fallback else settings.model_name
+                    assert model_name is not None
+
+                    stream_transformer = StreamTransformer(self._async_response_stream(
+                        runtime_data, model, model_name, messages, execution_mode, hedge_model, slot))
+                    async for _content in chat_log.async_add_delta_content_stream(
+                        user_input.agent_id,
+                        stream_transformer.to_chatlog_api(),
+                    ):
+                        pass
+                    finished = monotonic()
+            except AioRpcError as err:
+                if not use_fallback:
+                    if is_backend_failure(err):
+                        breaker.record_failure()
+                    else:
+                        breaker.record_other()
+                if (
+                    not is_transient(err)
+                    or (stream_transformer is not None and stream_transformer.streamed)
+                    or attempt + 1 == RETRY_ATTEMPTS
+                ):
+                    raise
+                tried.append(account)
+                delay = retry_delay(attempt)
+                LOGGER.info("Retrying in %.2fs after %s from Yandex Cloud", delay, err.code().name)
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            except BaseException:
+                if not use_fallback:
+                    breaker.record_other()
+                raise
+
+            if use_fallback:
+                LOGGER.debug("Answered by the fallback model %s", settings.fallback_model)
+            else:
+                breaker.record_success()
+            if execution_mode == EXECUTION_MODE_STREAMING and stream_transformer.first_token_at is not None:
+                account.shared.warmer.record_ttft(warm, stream_transformer.first_token_at - started)
+                trace.add("ttft", started, stream_transformer.first_token_at, attempt=attempt)
+            # Tools run while the chat log consumes the stream, the rest of the wait is theirs
+            stream_finished = stream_transformer.finished_at or finished
+            trace.add("stream", started, stream_finished, attempt=attempt, fallback=use_fallback)
+            if finished > stream_finished:
+                trace.add("tool_calls", stream_finished, finished)
+            if (usage := stream_transformer.usage) is not None:
+                runtime_data.usage.async_record(chat_log.conversation_id, usage)
+                runtime_data.governor.record(
+                    origin, usage.completion_tokens, stream_transformer.truncated, settings.model_conf["max_tokens"])
+            return stream_transformer, use_fallback
+
+    @staticmethod
+    async def _async_response_stream(
+        runtime_data: YandexGPTRuntimeData,
+        model: AsyncGPTModel,
+        model_name: str,
+        messages: list[CompletionsMessageType],
+        execution_mode: str,
+        hedge_model: AsyncGPTModel | None,
+        slot: AdmissionSlot,
+    ) -> AsyncIterator[GPTModelResult]:
+        """Yield results of a completion in the execution mode, hedging streams if there is a hedge model.
+
+        The admission slot is released as soon as the model is done: before
+        polling a deferred operation, and before the chat log waits for tool
+        calls started by the last streamed result.
+        """
+        if execution_mode == EXECUTION_MODE_DEFERRED:
+            with slot:
+                operation = await model.run_deferred(messages)
+            LOGGER.debug("Async operation ID: %s", operation.id)
+            yield await runtime_data.poller.async_wait(
+                operation, model_name, runtime_data.settings.async_timeout)
+            return
+
+        stream = model.run_stream(messages)
+        if hedge_model is not None:
+            hedge_stats = runtime_data.hedge_stats
+            stream = hedged_stream(
+                stream,
+                partial(hedge_model.run_stream, messages),
+                hedge_stats.budget(runtime_data.settings.hedge_delay),
+                hedge_stats,
+            )
+        with slot:
+            async for result in stream:
+                yield result
+
     async def _async_expand_prompt_template(
         self, prompt_template: str, user_input: conversation.ConversationInput
     ) -> str:
         """Render the prompt template."""
+        assert self._prompt_cache is not None
         try:
-            system_prompt = template.Template(prompt_template, self.hass).async_render(parse_result=False)
+            system_prompt = self._prompt_cache.async_render(prompt_template)
 
             if user_input.extra_system_prompt:
                 system_prompt += user_input.extra_system_prompt
@@ -0,0 +1,48 @@
+"""Deltas of streamed completions."""
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+
+class TextDeltas:
+    """Turn cumulative texts of a completion stream into deltas.
+
+    Only offsets are kept between chunks, so each character is copied once
+    no matter how long the answer grows.
+
+    The text received last is held back until the next chunk arrives, since
+    it may end with an incomplete multi-byte character, see
+    https://github.com/black-roland/homeassistant-yandexgpt/issues/17
+    """
+
+    __slots__ = ("_streamed", "_received")
+
+    def __init__(self) -> None:
+        self._streamed = 0
+        self._received = 0
+
+    @property
+    def started(self) -> bool:
+        """Return True once a non-empty chunk has been received."""
+        return self._received > 0
+
+    def start(self, text: str) -> None:
+        """Remember the first chunk without emitting it yet."""
+        self._received = len(text)
+
+    def partial(self, text: str) -> str:
+        """Return the held back part of the previous chunk, holding back the new one."""
+        delta = text[self._streamed:self._received]
+        self._streamed = self._received
+        self._received = len(text)
+        return delta
+
+    def final(self, text: str) -> str:
+        """Return everything not yet emitted and reset for the next message."""
+        delta = text[self._streamed:]
+        self._streamed = 0
+        self._received = 0
+        return delta
@@ -0,0 +1,37 @@
+"""Diagnostics support for the YandexGPT integration."""
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+from typing import Any
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import CONF_API_KEY
+from homeassistant.core import HomeAssistant
+
+from .const import CONF_EXTRA_ACCOUNTS, CONF_FOLDER_ID
+
+TO_REDACT = {CONF_API_KEY, CONF_FOLDER_ID, CONF_EXTRA_ACCOUNTS}
+
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, entry: ConfigEntry) -> dict[str, Any]:
+    """Return diagnostics of a config entry."""
+    runtime_data = entry.runtime_data
+    return {
+        "data": async_redact_data(entry.data, TO_REDACT),
+        "options": async_redact_data(entry.options, TO_REDACT),
+        "accounts": async_redact_data(
+            [account.as_dict() for account in runtime_data.accounts.accounts], TO_REDACT),
+        "admission": runtime_data.admission.as_dict(),
+        "circuit_breaker": runtime_data.breaker.as_dict(),
+        "hedging": runtime_data.hedge_stats.as_dict(),
+        "poller": runtime_data.poller.stats.as_dict(),
+        "execution": runtime_data.scheduler.as_dict(),
+        "tool_selection": runtime_data.tool_selector.as_dict(),
+        "usage": runtime_data.usage.as_dict(),
+        "latency": runtime_data.metrics.as_dict(),
+    }
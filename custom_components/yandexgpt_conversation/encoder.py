@@ -0,0 +1,70 @@
+"""Compact encoding of tool results sent to YandexGPT."""
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+# No Home Assistant imports here: benchmarks load this module standalone.
+
+from __future__ import annotations
+
+import json
+from typing import Any
+
+TRUNCATION_MARKER = "…[truncated {} bytes]"
+
+
+class ToolResultEncoder:
+    """Encode tool results into as few tokens as possible.
+
+    Non-ASCII characters are kept as is instead of being escaped to \\uXXXX,
+    which matters a lot for entity names in Russian.
+    """
+
+    def __init__(self, drop_empty: bool = False, max_bytes: int = 0) -> None:
+        self.drop_empty = drop_empty
+        self.max_bytes = max_bytes
+
+    def encode(self, tool_result: Any) -> str:
+        """Encode a tool result to compact JSON."""
+        return self.encode_with_status(tool_result)[0]
+
+    def encode_with_status(self, tool_result: Any) -> tuple[str, bool]:
+        """Encode a tool result to compact JSON, telling whether it was truncated."""
+        if self.drop_empty:
+            tool_result = _drop_empty(tool_result)
+
+        encoded = json.dumps(tool_result, ensure_ascii=False, separators=(",", ":"))
+
+        if self.max_bytes:
+            kept = self._truncate(encoded)
+            return kept, kept is not encoded
+
+        return encoded, False
+
+    def _truncate(self, encoded: str) -> str:
+        """Cut the encoded result to the byte limit, marking how much was dropped."""
+        # Cheap check first: a string never takes more than 4 bytes per character
+        if len(encoded) * 4 <= self.max_bytes:
+            return encoded
+
+        data = encoded.encode()
+        if len(data) <= self.max_bytes:
+            return encoded
+
+        # Half-cut multi-byte characters at the end are dropped
+        kept = data[: self.max_bytes].decode(errors="ignore")
+        return kept + TRUNCATION_MARKER.format(len(data) - len(kept.encode()))
+
+
+def _drop_empty(value: Any) -> Any:
+    """Recursively remove null and empty fields."""
+    if isinstance(value, dict):
+        return {
+            key: item
+            for key, item in ((key, _drop_empty(item)) for key, item in value.items())
+            if item is not None and item != "" and item != [] and item != {}
+        }
+    if isinstance(value, (list, tuple)):
+        return [_drop_empty(item) for item in value if item is not None]
+    return value
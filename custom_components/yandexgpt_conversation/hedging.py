@@ -0,0 +1,133 @@
+"""Hedged completion streams racing a second model on slow first tokens."""
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import asyncio
+import statistics
+from collections import deque
+from collections.abc import AsyncIterator, Callable
+from contextlib import suppress
+from time import monotonic
+from typing import Any, TypeVar
+
+from .const import LOGGER
+
+_T = TypeVar("_T")
+
+FIRST_EVENT_HISTORY_SIZE = 100
+# Recent first events needed before the budget follows them
+MIN_SAMPLES = 10
+ADAPTIVE_PERCENTILE = 90
+INITIAL_BUDGET = 3.0
+MIN_BUDGET = 0.3
+
+
+class HedgeStats:
+    """Time to first event of the main model and outcomes of hedged requests."""
+
+    def __init__(self) -> None:
+        self.first_events: deque[float] = deque(maxlen=FIRST_EVENT_HISTORY_SIZE)
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def budget(self, configured: float) -> float:
+        """Return how long to wait for the main model before hedging."""
+        if configured:
+            return configured
+        if len(self.first_events) < MIN_SAMPLES:
+            return INITIAL_BUDGET
+        percentile = statistics.quantiles(self.first_events, n=100)[ADAPTIVE_PERCENTILE - 1]
+        return max(percentile, MIN_BUDGET)
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return hedge rate and win statistics."""
+        return {
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "hedge_rate": self.hedged / self.requests if self.requests else 0.0,
+            "hedge_win_rate": self.hedge_wins / self.hedged if self.hedged else 0.0,
+        }
+
+
+async def hedged_stream(
+    primary: AsyncIterator[_T],
+    start_hedge: Callable[[], AsyncIterator[_T]],
+    budget: float,
+    stats: HedgeStats,
+) -> AsyncIterator[_T]:
+    """Yield events of the stream producing the first event, racing a hedge after budget seconds.
+
+    The losing stream is cancelled. If one of the streams fails before its
+    first event, the other one still gets the chance to answer.
+    """
+    stats.requests += 1
+    started = monotonic()
+    streams: dict[asyncio.Task[_T], AsyncIterator[_T]] = {
+        asyncio.ensure_future(anext(primary)): primary,
+    }
+    primary_task = next(iter(streams))
+    winner: asyncio.Task[_T] | None = None
+    error: BaseException | None = None
+
+    try:
+        done, _pending = await asyncio.wait(streams, timeout=budget)
+        if not done:
+            stats.hedged += 1
+            LOGGER.debug("No result from the main model in %.2fs, hedging", budget)
+            hedge = start_hedge()
+            streams[asyncio.ensure_future(anext(hedge))] = hedge
+
+        pending = set(streams)
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            # Prefer the main model if both answered at once
+            for task in sorted(done, key=lambda task: task is not primary_task):
+                failure: BaseException | None
+                if task.cancelled():
+                    failure = asyncio.CancelledError()
+                else:
+                    failure = task.exception()
+                    # A stream ending without events is an empty answer, not a failure
+                    if failure is None or isinstance(failure, StopAsyncIteration):
+                        winner = task
+                        break
+                if task is primary_task or error is None:
+                    error = failure
+    finally:
+        for task, stream in streams.items():
+            if task is winner:
+                continue
+            if task is primary_task and winner is not None and not task.done():
+                # The main model was slower than this, count it to keep the budget honest
+                stats.first_events.append(monotonic() - started)
+            task.cancel()
+            with suppress(BaseException):
+                await task
+            with suppress(Exception):
+                await stream.aclose()  # type: ignore[attr-defined]
+
+    if winner is None:
+        assert error is not None
+        raise error
+
+    if winner is primary_task:
+        stats.first_events.append(monotonic() - started)
+    else:
+        stats.hedge_wins += 1
+    if stats.hedged:
+        LOGGER.debug("Hedging: %s", stats.as_dict())
+
+    stream = streams[winner]
+    try:
+        if winner.exception() is None:
+            yield winner.result()
+            async for event in stream:
+                yield event
+    finally:
+        await stream.aclose()  # type: ignore[attr-defined]
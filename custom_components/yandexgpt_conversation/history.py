@@ -0,0 +1,233 @@
+"""Per-conversation history of messages converted to YandexGPT format."""
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+from collections.abc import Sequence
+from dataclasses import dataclass
+from time import monotonic
+from typing import TYPE_CHECKING, Any
+
+from homeassistant.components import conversation
+from homeassistant.core import HomeAssistant
+
+from .cache import LRUCache
+from .const import (DEFAULT_TOKEN_CACHE_SIZE, HISTORY_SUMMARY_HEADER_RU,
+                    HISTORY_SUMMARY_MODEL, HISTORY_SUMMARY_PROMPT_RU,
+                    LIVE_CONTEXT_TOOL_NAME, LOGGER)
+from .live_context import LIVE_CONTEXT_DELTA_HEADER, LiveContextTracker
+from .mappers import ContentConverter
+
+if TYPE_CHECKING:
+    from yandex_ai_studio_sdk import AsyncAIStudio
+    from yandex_ai_studio_sdk._models.completions.message import \
+        CompletionsMessageType
+    from yandex_ai_studio_sdk._models.completions.model import AsyncGPTModel
+
+# Share of the budget left to recent turns after compaction
+KEEP_RATIO = 0.5
+
+
+@dataclass(frozen=True)
+class HistorySummary:
+    """Summary replacing the oldest converted messages of a conversation."""
+
+    covered: int
+    text: str
+
+
+class ConversationHistory:
+    """Incrementally converted chat log of a single conversation.
+
+    Only the content added since the previous sync is converted. The system
+    prompt is re-converted every time since HA replaces it on each turn.
+    Once compacted, the oldest messages are replaced with a summary appended
+    to the system prompt.
+    """
+
+    def __init__(self) -> None:
+        self._messages: list[CompletionsMessageType] = []
+        self._synced = 0
+        self._last_content: conversation.Content | None = None
+        self.live_context = LiveContextTracker()
+        self.summary: HistorySummary | None = None
+        # Bumped when the chat log is rewritten, so stale summaries are dropped
+        self.generation = 0
+        self.compaction: asyncio.Task[None] | None = None
+
+    def sync(
+        self, chat_log_content: Sequence[conversation.Content], content_converter: ContentConverter
+    ) -> list[CompletionsMessageType]:
+        """Convert new chat log content and return all messages of the conversation."""
+        if self._is_rewritten(chat_log_content):
+            LOGGER.debug("Chat log was rewritten, converting the whole history")
+            self.live_context.reset()
+            self.summary = None
+            self.generation += 1
+            self._messages = content_converter.to_yandexgpt_api(chat_log_content)
+        else:
+            self._messages[0:1] = content_converter.to_yandexgpt_api(chat_log_content[:1])
+            content_converter.extend_yandexgpt_api(self._messages, chat_log_content[self._synced:])
+
+        self._synced = len(chat_log_content)
+        self._last_content = chat_log_content[-1] if chat_log_content else None
+
+        if self.summary is None or not self._messages:
+            return list(self._messages)
+
+        system = self._messages[0]
+        assert isinstance(system, dict) and "text" in system
+        return [
+            {"role": "system", "text": f"{system['text']}\n\n{HISTORY_SUMMARY_HEADER_RU}\n{self.summary.text}"},
+            *self._messages[1 + self.summary.covered:],
+        ]
+
+    @property
+    def messages(self) -> list[CompletionsMessageType]:
+        """Return converted messages without the system prompt, compacted or not."""
+        return self._messages[1:]
+
+    def _is_rewritten(self, chat_log_content: Sequence[conversation.Content]) -> bool:
+        """Check if the chat log still starts with the already converted content."""
+        if self._synced <= 1 or len(chat_log_content) < self._synced:
+            return True
+
+        return chat_log_content[self._synced - 1] is not self._last_content
+
+
+def _message_key(message: CompletionsMessageType) -> str:
+    try:
+        payload = json.dumps(message, ensure_ascii=False, sort_keys=True)
+    except TypeError:
+        # Tool calls are SDK objects
+        payload = repr(message)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _transcript(messages: Sequence[CompletionsMessageType]) -> str:
+    """Render messages as plain text for the summarization model."""
+    lines: list[str] = []
+    for message in messages:
+        if not isinstance(message, dict):
+            continue
+        if "text" in message:
+            lines.append(f"{message['role']}: {message['text']}")
+        elif "tool_results" in message:
+            lines.extend(
+                f"{result['name']} result: {result['content']}"
+                for result in message["tool_results"]  # type: ignore[union-attr]
+            )
+    return "\n".join(lines)
+
+
+def _last_full_live_context(messages: Sequence[CompletionsMessageType]) -> int | None:
+    """Return index of the last message with a full GetLiveContext result, not a delta."""
+    for index in range(len(messages) - 1, -1, -1):
+        message = messages[index]
+        if not isinstance(message, dict) or "tool_results" not in message:
+            continue
+        for result in message["tool_results"]:  # type: ignore[union-attr]
+            if result["name"] == LIVE_CONTEXT_TOOL_NAME and LIVE_CONTEXT_DELTA_HEADER not in result["content"]:
+                return index
+    return None
+
+
+class HistoryCompactor:
+    """Keep conversation histories under a token budget.
+
+    After a turn, the history is measured with the SDK tokenizer, caching the
+    count of every message. If it's over the budget, the oldest turns are
+    summarized by the Lite model in the background, so the next turn sends
+    the summary instead of them without waiting for it.
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        self.hass = hass
+        self._tokens: LRUCache[str, int] = LRUCache(DEFAULT_TOKEN_CACHE_SIZE)
+        self._tasks: set[asyncio.Task[None]] = set()
+        self.compactions = 0
+
+    def async_schedule(
+        self, history: ConversationHistory, client: AsyncAIStudio, model: AsyncGPTModel, budget: int
+    ) -> None:
+        """Compact a history in the background if it's over the budget."""
+        if history.compaction is not None and not history.compaction.done():
+            return
+        task = self.hass.async_create_background_task(
+            self._async_compact(history, client, model, budget), "Compact YandexGPT conversation history")
+        history.compaction = task
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def async_cancel(self) -> None:
+        """Cancel running compactions."""
+        for task in self._tasks:
+            task.cancel()
+
+    async def _async_count(self, model: AsyncGPTModel, message: CompletionsMessageType) -> int:
+        key = _message_key(message)
+        if (tokens := self._tokens.get(key)) is None:
+            tokens = len(await model.tokenize([message]))
+            self._tokens.put(key, tokens)
+        return tokens
+
+    async def _async_compact(
+        self, history: ConversationHistory, client: AsyncAIStudio, model: AsyncGPTModel, budget: int
+    ) -> None:
+        generation = history.generation
+        summary = history.summary
+        covered = summary.covered if summary else 0
+        messages = history.messages
+
+        try:
+            tokens = [await self._async_count(model, message) for message in messages[covered:]]
+        except Exception as err:  # pylint: disable=broad-except
+            LOGGER.debug("Failed to count tokens of the history: %s", err)
+            return
+
+        total = sum(tokens)
+        if total <= budget:
+            return
+
+        # Cut before a user message, so tool calls and results stay together
+        remaining = total
+        cut: int | None = None
+        for index, count in enumerate(tokens):
+            if remaining <= budget * KEEP_RATIO:
+                break
+            remaining -= count
+            following = messages[covered + index + 1] if covered + index + 1 < len(messages) else None
+            if isinstance(following, dict) and following.get("role") == "user":
+                cut = covered + index + 1
+        if cut is None:
+            return
+
+        started = monotonic()
+        request: list[Any] = [{"role": "system", "text": HISTORY_SUMMARY_PROMPT_RU}]
+        if summary:
+            request.append({"role": "user", "text": f"{HISTORY_SUMMARY_HEADER_RU}\n{summary.text}"})
+        request.append({"role": "user", "text": _transcript(messages[covered:cut])})
+        try:
+            result = await client.models.completions(HISTORY_SUMMARY_MODEL).configure(temperature=0).run(request)
+        except Exception as err:  # pylint: disable=broad-except
+            LOGGER.debug("Failed to summarize the history: %s", err)
+            return
+
+        if history.generation != generation or history.summary is not summary:
+            return
+        history.summary = HistorySummary(cut, result.alternatives[0].text)
+        self.compactions += 1
+        snapshot = _last_full_live_context(history.messages)
+        if snapshot is not None and snapshot < cut:
+            # Later deltas would refer to a snapshot the model now sees only summarized
+            history.live_context.reset()
+        LOGGER.debug(
+            "Summarized %d messages in %.2fs, history is down from %d tokens to about %d",
+            cut - covered, monotonic() - started, total, sum(tokens[cut - covered:]),
+        )
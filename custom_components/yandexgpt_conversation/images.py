@@ -0,0 +1,183 @@
+"""Storage of images generated with YandexART."""
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import hashlib
+import os
+import secrets
+import tempfile
+from collections import OrderedDict
+from http import HTTPStatus
+from pathlib import Path
+
+from aiohttp import web
+from homeassistant.components.http import HomeAssistantView
+
+from .const import DOMAIN, LOGGER
+
+IMAGE_CONTENT_TYPE = "image/jpeg"
+TMP_SUFFIX = ".tmp"
+
+
+class ImageCache:
+    """Content-addressed on-disk cache of generated images.
+
+    YandexART always returns the same image for the same prompt, seed and
+    model, so repeated requests can be served from disk. Least recently
+    used images are evicted once the cache grows over the size limit.
+
+    All methods do blocking I/O and must run in the executor, several of
+    them at once when images are generated in a batch.
+    """
+
+    def __init__(self, path: str, max_bytes: int) -> None:
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def make_key(model: str, prompt: str, seed: int) -> str:
+        """Return cache key of an image."""
+        return hashlib.sha256(f"{model}\0{seed}\0{prompt}".encode()).hexdigest()
+
+    def fetch(self, key: str, file_name: str) -> bool:
+        """Put a cached image to file_name, return False if there's no such image."""
+        cached = self.path / key
+        try:
+            # Mark as recently used for eviction
+            os.utime(cached)
+            image_bytes = cached.read_bytes()
+        except FileNotFoundError:
+            return False
+
+        _write(Path(file_name), image_bytes)
+        return True
+
+    def read(self, key: str) -> bytes | None:
+        """Return a cached image."""
+        try:
+            return (self.path / key).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def store(self, key: str, image_bytes: bytes, file_name: str) -> None:
+        """Add an image to the cache and put it to file_name."""
+        _write(Path(file_name), image_bytes)
+
+        self.path.mkdir(parents=True, exist_ok=True)
+        # Jobs of a batch may store the same image at once, each writes its own temporary file
+        with tempfile.NamedTemporaryFile(dir=self.path, suffix=TMP_SUFFIX, delete=False) as tmp:
+            tmp.write(image_bytes)
+        Path(tmp.name).replace(self.path / key)
+
+        self._evict()
+
+    def _evict(self) -> None:
+        """Remove least recently used images over the size limit."""
+        images: list[tuple[float, int, Path]] = []
+        for entry in self.path.iterdir():
+            # Temporary files belong to stores in progress
+            if entry.suffix == TMP_SUFFIX:
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                # Evicted by a concurrent store
+                continue
+            images.append((stat.st_mtime, stat.st_size, entry))
+
+        images.sort(key=lambda image: image[0])
+        total = sum(size for _, size, _ in images)
+        for _, size, image in images:
+            if total <= self.max_bytes:
+                break
+            LOGGER.debug("Evicting cached image %s", image.name)
+            image.unlink(missing_ok=True)
+            total -= size
+
+
+class ImageStore:
+    """In-memory store of generated images served by ImageView.
+
+    Images are addressed by random tokens, so URLs can't be guessed. Least
+    recently used images are evicted once the store grows over the size
+    limit.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self._images: OrderedDict[str, tuple[str, bytes]] = OrderedDict()
+        self._tokens: dict[str, str] = {}
+        self._size = 0
+
+    @staticmethod
+    def url(token: str) -> str:
+        """Return URL of an image."""
+        return ImageView.url.format(token=token)
+
+    def get(self, token: str) -> bytes | None:
+        """Return an image by its token."""
+        if (image := self._images.get(token)) is None:
+            return None
+        self._images.move_to_end(token)
+        return image[1]
+
+    def find(self, key: str) -> tuple[str, bytes] | None:
+        """Return token and content of an image by its cache key."""
+        if (token := self._tokens.get(key)) is None or (image_bytes := self.get(token)) is None:
+            return None
+        return token, image_bytes
+
+    def put(self, key: str, image_bytes: bytes) -> str:
+        """Keep an image in memory and return its token."""
+        if (found := self.find(key)) is not None:
+            return found[0]
+
+        token = secrets.token_urlsafe(32)
+        self._images[token] = (key, image_bytes)
+        self._tokens[key] = token
+        self._size += len(image_bytes)
+
+        # Always keep the newest image, even if it's over the limit alone
+        while self._size > self.max_bytes and len(self._images) > 1:
+            _, (evicted_key, evicted_bytes) = self._images.popitem(last=False)
+            del self._tokens[evicted_key]
+            self._size -= len(evicted_bytes)
+
+        return token
+
+
+class ImageView(HomeAssistantView):
+    """Serve images kept in memory."""
+
+    # Unguessable tokens act as credentials, same as camera proxy URLs
+    requires_auth = False
+    url = f"/api/{DOMAIN}/images/{{token}}"
+    name = f"api:{DOMAIN}:images"
+
+    def __init__(self, store: ImageStore) -> None:
+        self.store = store
+
+    async def get(self, request: web.Request, token: str) -> web.Response:
+        """Return an image."""
+        if (image_bytes := self.store.get(token)) is None:
+            return web.Response(status=HTTPStatus.NOT_FOUND)
+        return web.Response(
+            body=image_bytes,
+            content_type=IMAGE_CONTENT_TYPE,
+            # Content behind a token never changes
+            headers={"Cache-Control": "private, max-age=31536000, immutable"},
+        )
+
+
+def _write(destination: Path, image_bytes: bytes) -> None:
+    """Write an image to a file of the user.
+
+    The file is replaced rather than written over, so other files linked to
+    it, cached images included, stay as they are.
+    """
+    destination.unlink(missing_ok=True)
+    destination.write_bytes(image_bytes)
@@ -0,0 +1,88 @@
+"""Delta encoding of repeated GetLiveContext results."""
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+from typing import Any
+
+LIVE_CONTEXT_DELTA_HEADER = (
+    "Live Context: Changes since the previous GetLiveContext result, other devices are unchanged:"
+)
+
+
+class LiveContextTracker:
+    """Snapshot index of the last live context seen in a conversation.
+
+    Only a hash per entity is kept, so the index stays small even for
+    large homes. Repeated results are replaced with changed, added and
+    removed entities unless the full snapshot is shorter.
+    """
+
+    def __init__(self) -> None:
+        self._index: dict[str, int] | None = None
+
+    def reset(self) -> None:
+        """Forget the previous snapshot."""
+        self._index = None
+
+    def compress(self, tool_result: Any) -> Any:
+        """Return a tool result with the live context replaced by a delta if possible."""
+        if not isinstance(tool_result, dict) or not isinstance(tool_result.get("result"), str):
+            return tool_result
+
+        text: str = tool_result["result"]
+        blocks = _split_entities(text)
+        if not blocks:
+            return tool_result
+
+        previous, self._index = self._index, {key: hash(block) for key, block in blocks.items()}
+        if previous is None:
+            return tool_result
+
+        changed = [block for key, block in blocks.items() if key in previous and previous[key] != hash(block)]
+        added = [block for key, block in blocks.items() if key not in previous]
+        removed = [key for key in previous if key not in blocks]
+
+        lines = [LIVE_CONTEXT_DELTA_HEADER]
+        if changed:
+            lines += ["Changed:", *changed]
+        if added:
+            lines += ["Added:", *added]
+        if removed:
+            lines += ["Removed:", *removed]
+        if not changed and not added and not removed:
+            lines.append("Nothing changed.")
+
+        delta = "\n".join(lines)
+        if len(delta) >= len(text):
+            return tool_result
+
+        return {**tool_result, "result": delta}
+
+
+def _split_entities(text: str) -> dict[str, str]:
+    """Split live context YAML into entity blocks keyed by the names and domain lines."""
+    blocks: dict[str, str] = {}
+    current: list[str] = []
+
+    def flush() -> None:
+        if current:
+            key = "\n".join(line for line in current if line.startswith(("- ", "  domain:")))
+            blocks[key] = "\n".join(current)
+
+    for line in text.splitlines():
+        if line.startswith("- "):
+            flush()
+            current = [line]
+        elif current and line.startswith(" "):
+            current.append(line)
+        else:
+            # Header or anything that's not a part of the entities list
+            flush()
+            current = []
+
+    flush()
+    return blocks
@@ -4,25 +4,33 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at https://mozilla.org/MPL/2.0/.
 
-import json
+from __future__ import annotations
+
 from collections.abc import AsyncGenerator, AsyncIterator, Callable
-from typing import Any, Iterable, Optional, cast
+from time import monotonic
+from typing import TYPE_CHECKING, Any, Iterable, Optional, cast
 
 from homeassistant.components import conversation
 from homeassistant.exceptions import HomeAssistantError
 from homeassistant.helpers import llm
 from voluptuous_openapi import convert
-from yandex_ai_studio_sdk import AsyncAIStudio
-from yandex_ai_studio_sdk._models.completions.message import \
-    CompletionsMessageType
-from yandex_ai_studio_sdk._models.completions.message import \
-    FunctionResultMessageDict as ToolResultsMessageType
-from yandex_ai_studio_sdk._models.completions.result import (AlternativeStatus,
-                                                             GPTModelResult)
-from yandex_ai_studio_sdk._tools.tool import FunctionTool
-from yandex_ai_studio_sdk._tools.tool_call import AsyncToolCall
+from yandex_ai_studio_sdk._models.completions.result import AlternativeStatus
+
+from .const import DOMAIN, LIVE_CONTEXT_TOOL_NAME, LOGGER
+from .deltas import TextDeltas
+from .encoder import ToolResultEncoder
+from .live_context import LiveContextTracker
 
-from .const import DOMAIN, LOGGER
+if TYPE_CHECKING:
+    from yandex_ai_studio_sdk import AsyncAIStudio
+    from yandex_ai_studio_sdk._models.completions.message import \
+        CompletionsMessageType
+    from yandex_ai_studio_sdk._models.completions.message import \
+        FunctionResultMessageDict as ToolResultsMessageType
+    from yandex_ai_studio_sdk._models.completions.result import (
+        CompletionUsage, GPTModelResult)
+    from yandex_ai_studio_sdk._tools.tool import FunctionTool
+    from yandex_ai_studio_sdk._tools.tool_call import AsyncToolCall
 
 
 class StreamTransformer:
@@ -30,6 +38,11 @@ class StreamTransformer:
     def __init__(self, stream: AsyncIterator[GPTModelResult[AsyncToolCall]]) -> None:
         self.stream = stream
         self._tool_calls_event = None
+        self.first_token_at: Optional[float] = None
+        self.streamed = False
+        self.usage: Optional[CompletionUsage] = None
+        self.truncated = False
+        self.finished_at: Optional[float] = None
 
     @property
     def tool_calls_message(self) -> GPTModelResult[AsyncToolCall]:
@@ -40,11 +53,20 @@ class StreamTransformer:
         self,
     ) -> AsyncGenerator[conversation.AssistantContentDeltaDict, None]:
         """Transform YandexGPT stream into HA format."""
+        async for delta in self._transform():
+            # Nothing can be retried once the chat log got a delta
+            self.streamed = True
+            yield delta
+        self.finished_at = monotonic()
 
-        streamed_text = ""
-        prev_text = ""
+    async def _transform(
+        self,
+    ) -> AsyncGenerator[conversation.AssistantContentDeltaDict, None]:
+        deltas = TextDeltas()
         async for event in self.stream:
             LOGGER.debug("Received partial result: %s", event)
+            # Usage is cumulative, the last result has the totals; cached results have none
+            self.usage = getattr(event, "usage", None)
 
             alt = event.alternatives[0]
             text, status = alt.text, alt.status
@@ -52,11 +74,10 @@ class StreamTransformer:
             if status in (AlternativeStatus.FINAL, AlternativeStatus.TRUNCATED_FINAL):
                 if status == AlternativeStatus.TRUNCATED_FINAL:
                     LOGGER.warning("Response was truncated by YandexGPT")
-                delta = text[len(streamed_text):]
-                yield {"content": delta}
-                # Reset for potential new messages
-                prev_text = ""
-                streamed_text = ""
+                    self.truncated = True
+                if self.first_token_at is None:
+                    self.first_token_at = monotonic()
+                yield {"content": deltas.final(text)}
                 continue
 
             if status == AlternativeStatus.CONTENT_FILTER:
@@ -82,45 +103,63 @@ class StreamTransformer:
                 continue
 
             # First chunk - just store and send role
-            if prev_text == "":
+            if not deltas.started:
                 yield {"role": "assistant"}
-                prev_text = text
+                deltas.start(text)
                 continue
 
             if status != AlternativeStatus.PARTIAL:
                 continue
 
-            # Calculate delta between adjacent chunks to handle multi-byte characters.
-            # Workaround for emoji/4-byte character streaming issues:
-            # https://github.com/black-roland/homeassistant-yandexgpt/issues/17
-            delta = text[len(streamed_text): len(prev_text)]
-            yield {"content": delta}
-            streamed_text = prev_text
-            prev_text = text
+            if self.first_token_at is None:
+                self.first_token_at = monotonic()
+            yield {"content": deltas.partial(text)}
 
 
 class ContentConverter:
 
     def __init__(
-        self, stream_transformer: Optional[StreamTransformer] = None, system_prompt_override: Optional[str] = None
+        self,
+        stream_transformer: Optional[StreamTransformer] = None,
+        system_prompt_override: Optional[str] = None,
+        tool_result_encoder: Optional[ToolResultEncoder] = None,
+        live_context: Optional[LiveContextTracker] = None,
     ) -> None:
         self._stream_transformer = stream_transformer
         self._system_prompt_override = system_prompt_override
+        self._tool_result_encoder = tool_result_encoder or ToolResultEncoder()
+        self._live_context = live_context
 
     def to_yandexgpt_api(
         self, chat_logs: Iterable[conversation.Content]
     ) -> list[CompletionsMessageType]:
         """Convert Home Assistant conversation content to YandexGPT message format."""
         messages: list[CompletionsMessageType] = []
+        self.extend_yandexgpt_api(messages, chat_logs)
+        return messages
 
+    def extend_yandexgpt_api(
+        self, messages: list[CompletionsMessageType], chat_logs: Iterable[conversation.Content]
+    ) -> None:
+        """Convert Home Assistant conversation content and append it to already converted messages."""
         for content in chat_logs:
             if isinstance(content, conversation.ToolResultContent):
+                tool_result = content.tool_result
+                if self._live_context and content.tool_name == LIVE_CONTEXT_TOOL_NAME:
+                    tool_result = self._live_context.compress(tool_result)
+                    encoded, truncated = self._tool_result_encoder.encode_with_status(tool_result)
+                    if truncated:
+                        # The model didn't see the whole snapshot, so the next one can't be a delta of it
+                        self._live_context.reset()
+                else:
+                    encoded = self._tool_result_encoder.encode(tool_result)
+
                 # Group tool results into a single message
-                previous = cast(ToolResultsMessageType, messages[-1])
+                previous = cast("ToolResultsMessageType", messages[-1])
                 if "tool_results" in previous and isinstance(previous["tool_results"], list):
                     previous["tool_results"].append({
                         "name": content.tool_name,
-                        "content": json.dumps(content.tool_result),
+                        "content": encoded,
                     })
                     continue
 
@@ -128,7 +167,7 @@ class ContentConverter:
                     "role": "assistant",
                     "tool_results": [{
                         "name": content.tool_name,
-                        "content": json.dumps(content.tool_result),
+                        "content": encoded,
                     }],
                 })
 
@@ -150,8 +189,6 @@ class ContentConverter:
             else:
                 raise TypeError(f"Unexpected content type: {type(content)}")
 
-        return messages
-
     @staticmethod
     def format_tool(
         sdk: AsyncAIStudio, tool: llm.Tool, custom_serializer: Callable[[Any], Any] | None
@@ -0,0 +1,188 @@
+"""Latency of conversation pipeline stages."""
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import bisect
+import json
+import statistics
+from collections import deque
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from time import monotonic
+from typing import Any
+
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.util import dt as dt_util
+
+from .const import DOMAIN, LOGGER
+
+# Stages of a turn, in the order they happen
+STAGES = (
+    "turn",
+    "provide_llm_data",
+    "prompt_template",
+    "tools",
+    "conversion",
+    "queue",
+    "ttft",
+    "stream",
+    "tool_calls",
+)
+# Upper bounds of histogram buckets, seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SAMPLE_HISTORY_SIZE = 500
+TRACES_DIR = f"{DOMAIN}_traces"
+MAX_TRACE_FILES = 50
+
+
+class TurnTrace:
+    """Timing spans of a single conversation turn."""
+
+    def __init__(self) -> None:
+        self.started = monotonic()
+        self.wall_started = dt_util.utcnow()
+        self.spans: list[tuple[str, float, float, dict[str, Any]]] = []
+
+    @contextmanager
+    def span(self, name: str, **args: Any) -> Iterator[None]:
+        """Time the enclosed block."""
+        start = monotonic()
+        try:
+            yield
+        finally:
+            self.add(name, start, monotonic(), **args)
+
+    def add(self, name: str, start: float, end: float, **args: Any) -> None:
+        """Add a span measured elsewhere."""
+        self.spans.append((name, start, end, args))
+
+    def durations(self) -> dict[str, float]:
+        """Return total time spent in each stage."""
+        durations: dict[str, float] = {}
+        for name, start, end, _args in self.spans:
+            durations[name] = durations.get(name, 0.0) + end - start
+        return durations
+
+    def to_chrome_trace(self, conversation_id: str) -> dict[str, Any]:
+        """Return the turn in Chrome trace event format, for chrome://tracing or Perfetto."""
+        return {
+            "displayTimeUnit": "ms",
+            "metadata": {"conversation_id": conversation_id, "started": self.wall_started.isoformat()},
+            "traceEvents": [
+                {
+                    "name": name,
+                    "ph": "X",
+                    "ts": round((start - self.started) * 1e6),
+                    "dur": round((end - start) * 1e6),
+                    "pid": 1,
+                    "tid": 1,
+                    "args": args,
+                }
+                for name, start, end, args in sorted(self.spans, key=lambda span: (span[1], -span[2]))
+            ],
+        }
+
+
+class LatencyHistogram:
+    """Cumulative bucket counts plus recent samples for percentiles."""
+
+    def __init__(self) -> None:
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.samples: deque[float] = deque(maxlen=SAMPLE_HISTORY_SIZE)
+
+    def observe(self, value: float) -> None:
+        """Add a duration."""
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.samples.append(value)
+
+    def percentile(self, percentile: int) -> float | None:
+        """Return a percentile of recent durations."""
+        if not self.samples:
+            return None
+        if len(self.samples) == 1:
+            return self.samples[0]
+        return statistics.quantiles(self.samples, n=100, method="inclusive")[percentile - 1]
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return buckets, count, sum and percentiles."""
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "buckets": dict(zip((*map(str, LATENCY_BUCKETS), "+Inf"), self.buckets)),
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+        }
+
+
+class PipelineMetrics:
+    """Latency histograms of turn stages of a config entry."""
+
+    def __init__(self) -> None:
+        self.histograms = {stage: LatencyHistogram() for stage in STAGES}
+        self._listeners: list[Callable[[], None]] = []
+
+    @callback
+    def async_add_listener(self, update_callback: Callable[[], None]) -> CALLBACK_TYPE:
+        """Call update_callback whenever a turn is recorded."""
+        self._listeners.append(update_callback)
+
+        @callback
+        def remove_listener() -> None:
+            self._listeners.remove(update_callback)
+
+        return remove_listener
+
+    @callback
+    def async_record(self, trace: TurnTrace) -> None:
+        """Add durations of a finished turn."""
+        durations = trace.durations()
+        for stage, duration in durations.items():
+            self.histograms[stage].observe(duration)
+        LOGGER.debug("Turn stages: %s", {stage: round(duration, 3) for stage, duration in durations.items()})
+
+        for update_callback in list(self._listeners):
+            update_callback()
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return all histograms."""
+        return {stage: histogram.as_dict() for stage, histogram in self.histograms.items()}
+
+
+class TraceWriter:
+    """Dump turns as Chrome trace JSON files, keeping the latest ones."""
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        self.hass = hass
+        self.path = Path(hass.config.path(TRACES_DIR))
+
+    @callback
+    def async_write(self, trace: TurnTrace, conversation_id: str) -> None:
+        """Write a turn in the background."""
+        self.hass.async_create_background_task(
+            self._async_write(trace.to_chrome_trace(conversation_id), trace.wall_started),
+            "Write YandexGPT turn trace",
+        )
+
+    async def _async_write(self, data: dict[str, Any], started: datetime) -> None:
+        try:
+            await self.hass.async_add_executor_job(self._write, data, started)
+        except OSError as err:
+            LOGGER.warning("Failed to write turn trace: %s", err)
+
+    def _write(self, data: dict[str, Any], started: datetime) -> None:
+        self.path.mkdir(exist_ok=True)
+        file_name = self.path / f"{started.strftime('%Y%m%dT%H%M%S%f')}.json"
+        file_name.write_text(json.dumps(data), encoding="utf-8")
+        for stale in sorted(self.path.glob("*.json"))[:-MAX_TRACE_FILES]:
+            stale.unlink(missing_ok=True)
+        LOGGER.debug("Turn trace written to %s", file_name)
@@ -0,0 +1,183 @@
+"""Shared polling of deferred Yandex Cloud operations."""
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import asyncio
+import statistics
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from time import monotonic
+from typing import TYPE_CHECKING, Any
+
+from homeassistant.core import HomeAssistant
+
+from .const import DEFAULT_POLL_MAX_INTERVAL, DEFAULT_POLL_MIN_INTERVAL, LOGGER
+
+if TYPE_CHECKING:
+    from yandex_ai_studio_sdk._types.operation import AsyncOperation
+
+# Quantiles of observed completion times to poll at
+POLL_QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9, 0.95)
+BACKOFF_FACTOR = 1.5
+HISTORY_SIZE = 50
+
+
+@dataclass
+class _PendingOperation:
+    operation: AsyncOperation[Any]
+    kind: str
+    future: asyncio.Future[Any]
+    started: float
+    next_poll: float
+    last_poll: float
+    interval: float
+    polls: int = 0
+
+
+@dataclass
+class PollerStats:
+    """Counters of the operation poller."""
+
+    operations: int = 0
+    polls: int = 0
+    wasted_wait: float = 0.0
+    durations: dict[str, deque[float]] = field(default_factory=lambda: defaultdict(lambda: deque(maxlen=HISTORY_SIZE)))
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return poll counters and median completion times per kind of operation."""
+        return {
+            "operations": self.operations,
+            "polls": self.polls,
+            "polls_per_operation": self.polls / self.operations if self.operations else 0.0,
+            "wasted_wait": round(self.wasted_wait, 3),
+            "median_duration": {
+                kind: round(statistics.median(durations), 3) for kind, durations in self.durations.items() if durations
+            },
+        }
+
+
+class OperationPoller:
+    """Poll all in-flight operations of an entry from a single loop.
+
+    Polls are scheduled at quantiles of completion times observed earlier
+    for the same kind of operation (usually the model name), falling back
+    to exponential backoff once an operation runs longer than usual.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        min_interval: float = DEFAULT_POLL_MIN_INTERVAL,
+        max_interval: float = DEFAULT_POLL_MAX_INTERVAL,
+    ) -> None:
+        self.hass = hass
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.stats = PollerStats()
+        self._pending: dict[str, _PendingOperation] = {}
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task[None] | None = None
+
+    async def async_wait(self, operation: AsyncOperation[Any], kind: str, timeout: float) -> Any:
+        """Wait for an operation result."""
+        now = monotonic()
+        delay = self._next_delay(kind, 0, self.min_interval)
+        pending = _PendingOperation(
+            operation=operation,
+            kind=kind,
+            future=self.hass.loop.create_future(),
+            started=now,
+            next_poll=now + delay,
+            last_poll=now,
+            interval=delay,
+        )
+        self._pending[operation.id] = pending
+        self.stats.operations += 1
+
+        if self._task is None or self._task.done():
+            self._task = self.hass.async_create_background_task(self._async_run(), "YandexGPT operation poller")
+        self._wakeup.set()
+
+        try:
+            async with asyncio.timeout(timeout):
+                return await pending.future
+        finally:
+            self._pending.pop(operation.id, None)
+
+    def async_shutdown(self) -> None:
+        """Stop polling and fail all pending operations."""
+        if self._task:
+            self._task.cancel()
+        for pending in self._pending.values():
+            if not pending.future.done():
+                pending.future.cancel()
+        self._pending.clear()
+
+    async def _async_run(self) -> None:
+        """Poll operations until none are left."""
+        while self._pending:
+            self._wakeup.clear()
+            delay = min(pending.next_poll for pending in self._pending.values()) - monotonic()
+            if delay > 0:
+                try:
+                    async with asyncio.timeout(delay):
+                        await self._wakeup.wait()
+                    continue  # A new operation may be due earlier
+                except TimeoutError:
+                    pass
+
+            now = monotonic()
+            due = [pending for pending in self._pending.values() if pending.next_poll <= now]
+            await asyncio.gather(*(self._async_poll(pending) for pending in due))
+
+    async def _async_poll(self, pending: _PendingOperation) -> None:
+        """Poll a single operation and resolve its future once finished."""
+        now = monotonic()
+        self.stats.polls += 1
+        pending.polls += 1
+
+        try:
+            status = await pending.operation.get_status()
+            if not status.is_finished:
+                pending.interval = self._next_delay(pending.kind, now - pending.started, pending.interval)
+                pending.last_poll, pending.next_poll = now, now + pending.interval
+                return
+
+            result = await pending.operation.get_result()
+        except Exception as err:  # pylint: disable=broad-except
+            if not pending.future.done():
+                pending.future.set_exception(err)
+            self._pending.pop(pending.operation.id, None)
+            return
+
+        # The operation finished somewhere between the two last polls
+        wasted = (now - pending.last_poll) / 2
+        self.stats.wasted_wait += wasted
+        self.stats.durations[pending.kind].append(now - wasted - pending.started)
+        LOGGER.debug(
+            "Operation %s finished after %.2fs and %d polls",
+            pending.operation.id, now - pending.started, pending.polls,
+        )
+
+        if not pending.future.done():
+            pending.future.set_result(result)
+        self._pending.pop(pending.operation.id, None)
+
+    def _next_delay(self, kind: str, elapsed: float, interval: float) -> float:
+        """Return delay before the next poll of an operation."""
+        durations = self.stats.durations[kind]
+        if len(durations) >= 2:
+            quantiles = statistics.quantiles(durations, n=100, method="inclusive")
+            for quantile in POLL_QUANTILES:
+                expected = quantiles[int(quantile * 100) - 1]
+                if expected > elapsed + self.min_interval:
+                    return min(expected - elapsed, self.max_interval)
+
+        if elapsed == 0:
+            return interval
+
+        return min(max(interval * BACKOFF_FACTOR, self.min_interval), self.max_interval)
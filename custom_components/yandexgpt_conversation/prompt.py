@@ -0,0 +1,89 @@
+"""Rendering of the system prompt template."""
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+from time import monotonic
+from typing import TYPE_CHECKING
+
+from homeassistant.core import (Event, EventStateChangedData, HomeAssistant,
+                                callback)
+from homeassistant.helpers import template
+from homeassistant.helpers.event import (TrackStates,
+                                         async_track_state_change_filtered)
+from homeassistant.util import dt as dt_util
+
+from .const import DEFAULT_PROMPT_CACHE_TTL, LOGGER
+
+if TYPE_CHECKING:
+    from homeassistant.helpers.event import _TrackStateChangeFiltered
+
+
+class PromptTemplateCache:
+    """Compiled prompt template and its last render.
+
+    The render is reused until a state it depends on changes or the TTL
+    expires. Templates using now() are re-rendered every minute.
+    """
+
+    def __init__(self, hass: HomeAssistant, ttl: float = DEFAULT_PROMPT_CACHE_TTL) -> None:
+        self.hass = hass
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._source: str | None = None
+        self._template: template.Template | None = None
+        self._rendered: str | None = None
+        self._expires = 0.0
+        self._tracker: _TrackStateChangeFiltered | None = None
+
+    def async_render(self, source: str) -> str:
+        """Return the rendered template, raise TemplateError on errors."""
+        if source != self._source or self._template is None:
+            self.async_invalidate()
+            self._source = source
+            self._template = template.Template(source, self.hass)
+
+        if self._rendered is not None and monotonic() < self._expires:
+            self.hits += 1
+            return self._rendered
+
+        self.misses += 1
+        info = self._template.async_render_to_info(parse_result=False)
+        rendered = str(info.result())
+
+        if info.is_static:
+            self._expires = float("inf")
+        else:
+            self._expires = monotonic() + self.ttl
+            if info.has_time:
+                now = dt_util.utcnow()
+                self._expires = min(self._expires, monotonic() + 60 - now.second - now.microsecond / 1e6)
+            self._track(info)
+
+        self._rendered = rendered
+        LOGGER.debug("Prompt template rendered, cache: %d hits, %d misses", self.hits, self.misses)
+        return rendered
+
+    @callback
+    def async_invalidate(self, event: Event[EventStateChangedData] | None = None) -> None:
+        """Drop the last render."""
+        self._rendered = None
+        if self._tracker is not None:
+            self._tracker.async_remove()
+            self._tracker = None
+
+    def _track(self, info: template.RenderInfo) -> None:
+        """Drop the render as soon as any state it depends on changes."""
+        if info.all_states or info.all_states_lifecycle:
+            track_states = TrackStates(True, set(), set())
+        else:
+            track_states = TrackStates(False, info.entities, info.domains | info.domains_lifecycle)
+
+        if self._tracker is None:
+            self._tracker = async_track_state_change_filtered(self.hass, track_states, self.async_invalidate)
+        else:
+            self._tracker.async_update_listeners(track_states)
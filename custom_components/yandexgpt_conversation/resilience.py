@@ -0,0 +1,125 @@
+"""Retries and circuit breaking for transient Yandex Cloud errors."""
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import random
+from enum import StrEnum
+from time import monotonic
+from typing import Any
+
+import grpc
+
+from .const import LOGGER
+
+TRANSIENT_CODES = (
+    grpc.StatusCode.UNAVAILABLE,
+    grpc.StatusCode.DEADLINE_EXCEEDED,
+    grpc.StatusCode.RESOURCE_EXHAUSTED,
+)
+# RESOURCE_EXHAUSTED is the quota of a single account, which the account pool
+# takes out of rotation; it says nothing about the backend shared by all of them
+BACKEND_FAILURE_CODES = (
+    grpc.StatusCode.UNAVAILABLE,
+    grpc.StatusCode.DEADLINE_EXCEEDED,
+)
+RETRY_ATTEMPTS = 3
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 4.0
+
+
+def is_transient(err: grpc.aio.AioRpcError) -> bool:
+    """Return True if the request may succeed when repeated."""
+    return err.code() in TRANSIENT_CODES
+
+
+def is_backend_failure(err: grpc.aio.AioRpcError) -> bool:
+    """Return True if the error counts towards opening the circuit breaker."""
+    return err.code() in BACKEND_FAILURE_CODES
+
+
+def retry_delay(attempt: int) -> float:
+    """Return a jittered delay before the attempt following a failed one."""
+    # Full jitter, so requests failed together don't retry together
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2**attempt))
+
+
+class BreakerState(StrEnum):
+    """State of a circuit breaker."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Stop sending requests to a backend failing over and over.
+
+    After several backend failures in a row the breaker opens and requests
+    fail fast (or go to the fallback model) instead of waiting for the gRPC
+    timeout. Once the reset timeout passes, one probe request is let through:
+    success closes the breaker, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = BreakerState.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._probing = False
+
+    def allow(self) -> bool:
+        """Return True if a request may go to the backend."""
+        if self.state == BreakerState.CLOSED:
+            return True
+        if self.state == BreakerState.OPEN:
+            if monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = BreakerState.HALF_OPEN
+            LOGGER.debug("Circuit breaker is half-open, probing the backend")
+        if self._probing:
+            return False
+        self._probing = True
+        return True
+
+    def record_success(self) -> None:
+        """Close the breaker after a successful request."""
+        if self.state != BreakerState.CLOSED:
+            LOGGER.info("Circuit breaker is closed, the backend has recovered")
+        self.state = BreakerState.CLOSED
+        self.consecutive_failures = 0
+        self._probing = False
+
+    def record_failure(self) -> None:
+        """Count a backend failure, opening the breaker if there are too many."""
+        self.consecutive_failures += 1
+        if self.state == BreakerState.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self._open()
+
+    def record_other(self) -> None:
+        """Release the probe after a request ending with an error of another kind."""
+        self._probing = False
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return state and counters of the breaker."""
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "trips": self.trips,
+        }
+
+    def _open(self) -> None:
+        if self.state != BreakerState.OPEN:
+            self.trips += 1
+            LOGGER.warning(
+                "Circuit breaker is open for %ds after %d failures in a row",
+                self.reset_timeout, self.consecutive_failures,
+            )
+        self.state = BreakerState.OPEN
+        self.opened_at = monotonic()
+        self._probing = False
@@ -0,0 +1,234 @@
+"""Runtime data of YandexGPT config entries."""
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+from collections.abc import Mapping
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Any
+
+from homeassistant.const import CONF_LLM_HASS_API
+
+from .accounts import AccountPool
+from .admission import AdmissionController
+from .cache import CompletionCache
+from .const import (CONF_ASYNC_TIMEOUT, CONF_ASYNCHRONOUS_MODE,
+                    CONF_CHAT_MODEL, CONF_ENABLE_SERVER_DATA_LOGGING,
+                    CONF_EXECUTION_MODE, CONF_FALLBACK_MODEL, CONF_HEDGE_DELAY,
+                    CONF_HEDGE_MODEL, CONF_HISTORY_TOKEN_BUDGET,
+                    CONF_KEEPALIVE_INTERVAL, CONF_LIVE_CONTEXT_DELTA,
+                    CONF_MAX_CONCURRENT_REQUESTS, CONF_MAX_QUEUED_REQUESTS,
+                    CONF_MAX_TOKENS, CONF_MAX_TOKENS_GOVERNOR,
+                    CONF_MAX_TOOL_ITERATIONS, CONF_MODEL_VERSION,
+                    CONF_NO_HA_DEFAULT_PROMPT, CONF_PROMPT,
+                    CONF_RESPONSE_CACHE, CONF_RESPONSE_CACHE_PERSISTENT,
+                    CONF_RESPONSE_CACHE_TTL, CONF_TEMPERATURE,
+                    CONF_TOOL_RESULT_DROP_EMPTY, CONF_TOOL_RESULT_MAX_BYTES,
+                    CONF_TOOL_SELECTION_ALWAYS_INCLUDE,
+                    CONF_TOOL_SELECTION_TOP_K, CONF_TRACE_TURNS,
+                    DEFAULT_ASYNC_TIMEOUT, DEFAULT_CHAT_MODEL,
+                    DEFAULT_ENABLE_SERVER_DATA_LOGGING, DEFAULT_FALLBACK_MODEL,
+                    DEFAULT_HEDGE_DELAY, DEFAULT_HEDGE_MODEL,
+                    DEFAULT_HISTORY_TOKEN_BUDGET,
+                    DEFAULT_INSTRUCTIONS_PROMPT_RU, DEFAULT_KEEPALIVE_INTERVAL,
+                    DEFAULT_LIVE_CONTEXT_DELTA,
+                    DEFAULT_MAX_CONCURRENT_REQUESTS,
+                    DEFAULT_MAX_QUEUED_REQUESTS, DEFAULT_MAX_TOKENS_GOVERNOR,
+                    DEFAULT_MAX_TOOL_ITERATIONS, DEFAULT_MODEL_VERSION,
+                    DEFAULT_NO_HA_DEFAULT_PROMPT, DEFAULT_RESPONSE_CACHE,
+                    DEFAULT_RESPONSE_CACHE_PERSISTENT,
+                    DEFAULT_RESPONSE_CACHE_TTL, DEFAULT_TOOL_RESULT_DROP_EMPTY,
+                    DEFAULT_TOOL_RESULT_MAX_BYTES,
+                    DEFAULT_TOOL_SELECTION_ALWAYS_INCLUDE,
+                    DEFAULT_TOOL_SELECTION_TOP_K, DEFAULT_TRACE_TURNS,
+                    EXECUTION_MODE_DEFERRED, EXECUTION_MODE_STREAMING,
+                    RECOMMENDED_MAX_TOKENS, RECOMMENDED_TEMPERATURE)
+from .encoder import ToolResultEncoder
+from .hedging import HedgeStats
+from .metrics import PipelineMetrics, TraceWriter
+from .poller import OperationPoller
+from .resilience import CircuitBreaker
+from .tool_selection import ToolSelector
+from .usage import MaxTokensGovernor, UsageTracker
+
+if TYPE_CHECKING:
+    from yandex_ai_studio_sdk import AsyncAIStudio
+    from yandex_ai_studio_sdk._models.completions.model import AsyncGPTModel
+
+    from .conversation import ExecutionScheduler
+
+
+class RuntimeSettings:
+    """Settings of a config entry resolved once instead of on every turn."""
+
+    __slots__ = (
+        "async_timeout",
+        "enable_server_data_logging",
+        "execution_mode",
+        "fallback_model",
+        "hedge_delay",
+        "hedge_model",
+        "history_token_budget",
+        "keepalive_interval",
+        "live_context_delta",
+        "llm_hass_api",
+        "max_concurrent_requests",
+        "max_queued_requests",
+        "max_tokens_governor",
+        "max_tool_iterations",
+        "model_conf",
+        "model_name",
+        "model_version",
+        "no_ha_default_prompt",
+        "prompt",
+        "response_cache",
+        "response_cache_persistent",
+        "response_cache_ttl",
+        "tool_result_encoder",
+        "tool_selection_always_include",
+        "tool_selection_top_k",
+        "trace_turns",
+    )
+
+    async_timeout: float
+    enable_server_data_logging: bool
+    execution_mode: str
+    fallback_model: str | None
+    hedge_delay: float
+    hedge_model: str | None
+    history_token_budget: int
+    keepalive_interval: int
+    live_context_delta: bool
+    llm_hass_api: str | list[str] | None
+    max_concurrent_requests: int
+    max_queued_requests: int
+    max_tokens_governor: bool
+    max_tool_iterations: int
+    model_conf: Mapping[str, Any]
+    model_name: str
+    model_version: str
+    no_ha_default_prompt: bool
+    prompt: str
+    response_cache: bool
+    response_cache_persistent: bool
+    response_cache_ttl: float
+    tool_result_encoder: ToolResultEncoder
+    tool_selection_always_include: frozenset[str]
+    tool_selection_top_k: int
+    trace_turns: bool
+
+    def __init__(self, settings: Mapping[str, Any]) -> None:
+        values = {
+            "async_timeout": settings.get(CONF_ASYNC_TIMEOUT, DEFAULT_ASYNC_TIMEOUT),
+            "enable_server_data_logging": settings.get(
+                CONF_ENABLE_SERVER_DATA_LOGGING, DEFAULT_ENABLE_SERVER_DATA_LOGGING),
+            "execution_mode": settings.get(
+                CONF_EXECUTION_MODE,
+                EXECUTION_MODE_DEFERRED if settings.get(CONF_ASYNCHRONOUS_MODE) else EXECUTION_MODE_STREAMING,
+            ),
+            "fallback_model": settings.get(CONF_FALLBACK_MODEL, DEFAULT_FALLBACK_MODEL),
+            # Milliseconds in the options, 0 follows recent time to first token
+            "hedge_delay": settings.get(CONF_HEDGE_DELAY, DEFAULT_HEDGE_DELAY) / 1000,
+            "hedge_model": settings.get(CONF_HEDGE_MODEL, DEFAULT_HEDGE_MODEL),
+            "history_token_budget": settings.get(CONF_HISTORY_TOKEN_BUDGET, DEFAULT_HISTORY_TOKEN_BUDGET),
+            "keepalive_interval": settings.get(CONF_KEEPALIVE_INTERVAL, DEFAULT_KEEPALIVE_INTERVAL),
+            "live_context_delta": settings.get(CONF_LIVE_CONTEXT_DELTA, DEFAULT_LIVE_CONTEXT_DELTA),
+            "llm_hass_api": settings.get(CONF_LLM_HASS_API),
+            # Negative limits saved before the options flow checked them would block every request
+            "max_concurrent_requests": max(
+                settings.get(CONF_MAX_CONCURRENT_REQUESTS, DEFAULT_MAX_CONCURRENT_REQUESTS), 0),
+            "max_queued_requests": max(settings.get(CONF_MAX_QUEUED_REQUESTS, DEFAULT_MAX_QUEUED_REQUESTS), 0),
+            "max_tokens_governor": settings.get(CONF_MAX_TOKENS_GOVERNOR, DEFAULT_MAX_TOKENS_GOVERNOR),
+            "max_tool_iterations": settings.get(CONF_MAX_TOOL_ITERATIONS, DEFAULT_MAX_TOOL_ITERATIONS),
+            "model_conf": MappingProxyType({
+                "temperature": settings.get(CONF_TEMPERATURE, RECOMMENDED_TEMPERATURE),
+                "max_tokens": settings.get(CONF_MAX_TOKENS, RECOMMENDED_MAX_TOKENS),
+            }),
+            "model_name": settings.get(CONF_CHAT_MODEL, DEFAULT_CHAT_MODEL).split("/")[0],
+            "model_version": settings.get(CONF_MODEL_VERSION, DEFAULT_MODEL_VERSION),
+            "no_ha_default_prompt": settings.get(CONF_NO_HA_DEFAULT_PROMPT, DEFAULT_NO_HA_DEFAULT_PROMPT),
+            "prompt": settings.get(CONF_PROMPT, DEFAULT_INSTRUCTIONS_PROMPT_RU),
+            "response_cache": settings.get(CONF_RESPONSE_CACHE, DEFAULT_RESPONSE_CACHE),
+            "response_cache_persistent": settings.get(
+                CONF_RESPONSE_CACHE_PERSISTENT, DEFAULT_RESPONSE_CACHE_PERSISTENT),
+            "response_cache_ttl": settings.get(CONF_RESPONSE_CACHE_TTL, DEFAULT_RESPONSE_CACHE_TTL),
+            "tool_result_encoder": ToolResultEncoder(
+                drop_empty=settings.get(CONF_TOOL_RESULT_DROP_EMPTY, DEFAULT_TOOL_RESULT_DROP_EMPTY),
+                max_bytes=settings.get(CONF_TOOL_RESULT_MAX_BYTES, DEFAULT_TOOL_RESULT_MAX_BYTES),
+            ),
+            "tool_selection_always_include": frozenset(
+                name.strip()
+                for name in settings.get(
+                    CONF_TOOL_SELECTION_ALWAYS_INCLUDE, DEFAULT_TOOL_SELECTION_ALWAYS_INCLUDE).split(",")
+                if name.strip()
+            ),
+            "tool_selection_top_k": settings.get(CONF_TOOL_SELECTION_TOP_K, DEFAULT_TOOL_SELECTION_TOP_K),
+            "trace_turns": settings.get(CONF_TRACE_TURNS, DEFAULT_TRACE_TURNS),
+        }
+        # Falling back to the same model wouldn't help
+        if values["fallback_model"] in (DEFAULT_FALLBACK_MODEL, values["model_name"]):
+            values["fallback_model"] = None
+        if values["hedge_model"] == DEFAULT_HEDGE_MODEL:
+            values["hedge_model"] = None
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def build_model(self, client: AsyncAIStudio) -> AsyncGPTModel:
+        """Return the completions model configured with these settings."""
+        model = client.models.completions(self.model_name, model_version=self.model_version)
+        return model.configure(**self.model_conf)
+
+    def build_fallback_model(self, client: AsyncAIStudio) -> AsyncGPTModel | None:
+        """Return the fallback completions model, if there is one."""
+        if self.fallback_model is None:
+            return None
+        model = client.models.completions(self.fallback_model, model_version=DEFAULT_MODEL_VERSION)
+        return model.configure(**self.model_conf)
+
+    def build_hedge_model(self, client: AsyncAIStudio) -> AsyncGPTModel | None:
+        """Return the completions model racing slow requests, if there is one."""
+        if self.hedge_model is None:
+            return None
+        # The same model is fine too, the hedge likely lands on another backend
+        model = client.models.completions(self.hedge_model, model_version=DEFAULT_MODEL_VERSION)
+        return model.configure(**self.model_conf)
+
+
+@dataclass
+class YandexGPTRuntimeData:
+    """Objects shared by everything running on behalf of a config entry."""
+
+    accounts: AccountPool
+    admission: AdmissionController
+    breaker: CircuitBreaker
+    hedge_stats: HedgeStats
+    scheduler: ExecutionScheduler
+    tool_selector: ToolSelector
+    usage: UsageTracker
+    governor: MaxTokensGovernor
+    metrics: PipelineMetrics
+    trace_writer: TraceWriter
+    poller: OperationPoller
+    completion_cache: CompletionCache
+    settings: RuntimeSettings
+
+    @property
+    def client(self) -> AsyncAIStudio:
+        """Return client of the primary account."""
+        return self.accounts.primary.shared.client
+
+    def update_settings(self, settings: RuntimeSettings) -> None:
+        """Switch to new settings, rebuilding configured models."""
+        self.accounts.update_models(settings)
+        self.admission.configure(settings.max_concurrent_requests, settings.max_queued_requests)
+        self.settings = settings
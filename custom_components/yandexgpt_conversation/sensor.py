@@ -0,0 +1,117 @@
+"""Token usage and latency sensors of the YandexGPT integration."""
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+from typing import Any
+
+from homeassistant.components.sensor import (SensorDeviceClass, SensorEntity,
+                                             SensorStateClass)
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import EntityCategory, UnitOfTime
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers import device_registry as dr
+from homeassistant.helpers.entity_platform import AddEntitiesCallback
+
+from .const import DOMAIN
+from .metrics import STAGES, PipelineMetrics
+from .usage import USAGE_COUNTERS, UsageTracker
+
+LATENCY_PERCENTILES = (50, 95)
+# Stages with sensors enabled by default, the rest are there for debugging
+DEFAULT_LATENCY_STAGES = ("turn", "ttft")
+
+
+async def async_setup_entry(
+    hass: HomeAssistant,
+    config_entry: ConfigEntry,
+    async_add_entities: AddEntitiesCallback,
+) -> None:
+    """Set up token usage and latency sensors."""
+    usage: UsageTracker = config_entry.runtime_data.usage
+    metrics: PipelineMetrics = config_entry.runtime_data.metrics
+    async_add_entities([
+        *(YandexGPTUsageSensor(config_entry, usage, key) for key in USAGE_COUNTERS),
+        *(
+            YandexGPTLatencySensor(config_entry, metrics, stage, percentile)
+            for stage in STAGES
+            for percentile in LATENCY_PERCENTILES
+        ),
+    ])
+
+
+class YandexGPTUsageSensor(SensorEntity):
+    """Tokens used by a config entry since Home Assistant started."""
+
+    _attr_has_entity_name = True
+    _attr_should_poll = False
+    _attr_state_class = SensorStateClass.TOTAL_INCREASING
+    _attr_native_unit_of_measurement = "tokens"
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    # Changes on every request, the recorder keeps the state already
+    _unrecorded_attributes = frozenset({"requests"})
+
+    def __init__(self, entry: ConfigEntry, usage: UsageTracker, key: str) -> None:
+        """Initialize the sensor."""
+        self.usage = usage
+        self.key = key
+        self._attr_translation_key = key
+        self._attr_unique_id = f"{entry.entry_id}_{key}"
+        self._attr_device_info = dr.DeviceInfo(identifiers={(DOMAIN, entry.entry_id)})
+
+    async def async_added_to_hass(self) -> None:
+        """Update the state whenever usage changes."""
+        await super().async_added_to_hass()
+        self.async_on_remove(self.usage.async_add_listener(self.async_write_ha_state))
+
+    @property
+    def native_value(self) -> int:
+        """Return tokens used."""
+        return self.usage.totals[self.key]
+
+    @property
+    def extra_state_attributes(self) -> dict[str, Any]:
+        """Return the number of requests, usage per conversation is in diagnostics."""
+        return {"requests": self.usage.totals["requests"]}
+
+
+class YandexGPTLatencySensor(SensorEntity):
+    """Percentile of recent durations of a conversation pipeline stage."""
+
+    _attr_has_entity_name = True
+    _attr_should_poll = False
+    _attr_state_class = SensorStateClass.MEASUREMENT
+    _attr_device_class = SensorDeviceClass.DURATION
+    _attr_native_unit_of_measurement = UnitOfTime.SECONDS
+    _attr_suggested_unit_of_measurement = UnitOfTime.MILLISECONDS
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    # Changes on every turn
+    _unrecorded_attributes = frozenset({"count"})
+
+    def __init__(self, entry: ConfigEntry, metrics: PipelineMetrics, stage: str, percentile: int) -> None:
+        """Initialize the sensor."""
+        self.metrics = metrics
+        self.stage = stage
+        self.percentile = percentile
+        self._attr_translation_key = f"{stage}_p{percentile}"
+        self._attr_unique_id = f"{entry.entry_id}_{stage}_p{percentile}"
+        self._attr_entity_registry_enabled_default = stage in DEFAULT_LATENCY_STAGES
+        self._attr_device_info = dr.DeviceInfo(identifiers={(DOMAIN, entry.entry_id)})
+
+    async def async_added_to_hass(self) -> None:
+        """Update the state whenever a turn is recorded."""
+        await super().async_added_to_hass()
+        self.async_on_remove(self.metrics.async_add_listener(self.async_write_ha_state))
+
+    @property
+    def native_value(self) -> float | None:
+        """Return the percentile of recent durations."""
+        return self.metrics.histograms[self.stage].percentile(self.percentile)
+
+    @property
+    def extra_state_attributes(self) -> dict[str, Any]:
+        """Return the number of turns measured."""
+        return {"count": self.metrics.histograms[self.stage].count}
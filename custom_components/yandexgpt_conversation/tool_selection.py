@@ -0,0 +1,175 @@
+"""Selection of tools relevant to a request by text embeddings."""
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import math
+import statistics
+from collections.abc import Collection, Sequence
+from typing import TYPE_CHECKING, Any
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers import llm
+from homeassistant.helpers.storage import Store
+
+from .cache import LRUCache
+from .const import DOMAIN, LOGGER
+
+if TYPE_CHECKING:
+    from yandex_ai_studio_sdk import AsyncAIStudio
+    from yandex_ai_studio_sdk._tools.tool import FunctionTool
+
+TOOL_EMBEDDINGS_STORAGE_VERSION = 1
+TOOL_EMBEDDINGS_SAVE_DELAY = 30
+DOC_EMBEDDINGS_MODEL = "doc"
+QUERY_EMBEDDINGS_MODEL = "query"
+# Embedding requests sent at once while indexing new tools
+EMBEDDING_CONCURRENCY = 4
+QUERY_CACHE_SIZE = 64
+# Vectors of tools of all agents and exposed entities switched between, a few KiB each
+TOOL_VECTORS_CACHE_SIZE = 512
+# The best tool must be this similar to the request, and stand out from the
+# rest by the margin, otherwise the model gets all tools
+MIN_SIMILARITY = 0.3
+MIN_MARGIN = 0.05
+
+
+def _normalize(vector: Sequence[float]) -> list[float]:
+    norm = math.sqrt(math.fsum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+def _similarity(left: Sequence[float], right: Sequence[float]) -> float:
+    """Return cosine similarity of normalized vectors."""
+    return math.fsum(a * b for a, b in zip(left, right))
+
+
+def _tool_text(tool: llm.Tool) -> str:
+    return f"{tool.name}: {tool.description or ''}"
+
+
+class ToolSelector:
+    """Pick the tools most similar to a request out of a large set.
+
+    Tool names and descriptions are embedded once and persisted under
+    .storage, keyed by a hash of the text, so only new or changed tools are
+    embedded again. The least recently used vectors are dropped once there
+    are more than TOOL_VECTORS_CACHE_SIZE of them; they are stored in the
+    order of use, so it survives restarts.
+    """
+
+    def __init__(self, hass: HomeAssistant, entry_id: str) -> None:
+        self.hass = hass
+        self._store: Store[dict[str, list[float]]] = Store(
+            hass, TOOL_EMBEDDINGS_STORAGE_VERSION, f"{DOMAIN}.{entry_id}.tool_embeddings")
+        self._vectors: LRUCache[str, list[float]] | None = None
+        self._used: set[str] = set()
+        self._queries: LRUCache[str, list[float]] = LRUCache(QUERY_CACHE_SIZE)
+        self._load_lock = asyncio.Lock()
+        self.selected = 0
+        self.fallbacks = 0
+
+    async def async_select(
+        self,
+        client: AsyncAIStudio,
+        llm_api: llm.APIInstance,
+        tools: list[FunctionTool],
+        query: str,
+        top_k: int,
+        always_include: Collection[str],
+    ) -> list[FunctionTool]:
+        """Return the top-k tools for the query plus the always included ones.
+
+        tools are the converted llm_api.tools, in the same order. All of them
+        are returned if there are few or if the selection isn't confident.
+        """
+        if len(tools) <= top_k + len(always_include) or not query:
+            return tools
+
+        try:
+            vectors = await self._async_tool_vectors(client, llm_api.tools)
+            query_vector = await self._async_query_vector(client, query)
+        except Exception as err:  # pylint: disable=broad-except
+            # Selection only saves tokens, a failure of it must not fail the turn
+            LOGGER.warning("Failed to embed tools, sending all of them: %s", err)
+            return tools
+
+        scores = [_similarity(query_vector, vector) for vector in vectors]
+        ranked = sorted(range(len(tools)), key=scores.__getitem__, reverse=True)
+        best = scores[ranked[0]]
+        if best < MIN_SIMILARITY or best - statistics.median(scores) < MIN_MARGIN:
+            self.fallbacks += 1
+            LOGGER.debug("Tool selection isn't confident (best %.2f), sending all tools", best)
+            return tools
+
+        chosen = set(ranked[:top_k])
+        chosen.update(index for index, tool in enumerate(llm_api.tools) if tool.name in always_include)
+        self.selected += 1
+        LOGGER.debug(
+            "Selected %d of %d tools: %s",
+            len(chosen), len(tools), [llm_api.tools[index].name for index in sorted(chosen)],
+        )
+        return [tool for index, tool in enumerate(tools) if index in chosen]
+
+    async def _async_tool_vectors(self, client: AsyncAIStudio, tools: Sequence[llm.Tool]) -> list[list[float]]:
+        """Return vectors of the tools, embedding the ones not seen before."""
+        stored = await self._async_load()
+        keys = [hashlib.sha256(_tool_text(tool).encode()).hexdigest() for tool in tools]
+        found = {key: vector for key in keys if (vector := stored.get(key)) is not None}
+        if missing := {key: tool for key, tool in zip(keys, tools) if key not in found}:
+            LOGGER.debug("Embedding %d tools", len(missing))
+            model = client.models.text_embeddings(DOC_EMBEDDINGS_MODEL)
+            semaphore = asyncio.Semaphore(EMBEDDING_CONCURRENCY)
+
+            async def embed(tool: llm.Tool) -> list[float]:
+                async with semaphore:
+                    result = await model.run(_tool_text(tool))
+                return _normalize(result.embedding)
+
+            vectors = await asyncio.gather(*(embed(tool) for tool in missing.values()))
+            for key, vector in zip(missing, vectors):
+                found[key] = vector
+                stored.put(key, vector)
+
+        # The order of use changes with the set of tools
+        used = set(keys)
+        if missing or used != self._used:
+            self._used = used
+            self._store.async_delay_save(self._data_to_save, TOOL_EMBEDDINGS_SAVE_DELAY)
+        return [found[key] for key in keys]
+
+    async def _async_query_vector(self, client: AsyncAIStudio, query: str) -> list[float]:
+        if (vector := self._queries.get(query)) is None:
+            result = await client.models.text_embeddings(QUERY_EMBEDDINGS_MODEL).run(query)
+            vector = _normalize(result.embedding)
+            self._queries.put(query, vector)
+        return vector
+
+    async def _async_load(self) -> LRUCache[str, list[float]]:
+        """Load persisted vectors on first use."""
+        async with self._load_lock:
+            if self._vectors is None:
+                vectors: LRUCache[str, list[float]] = LRUCache(TOOL_VECTORS_CACHE_SIZE)
+                for key, vector in (await self._store.async_load() or {}).items():
+                    vectors.put(key, vector)
+                self._vectors = vectors
+        return self._vectors
+
+    async def async_remove(self) -> None:
+        """Remove persisted vectors."""
+        await self._store.async_remove()
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return counters of the selector."""
+        return {"selected": self.selected, "fallbacks": self.fallbacks, "indexed": len(self._vectors or ())}
+
+    @callback
+    def _data_to_save(self) -> dict[str, list[float]]:
+        """Return vectors, least recently used first."""
+        assert self._vectors is not None
+        return dict(self._vectors.items())
@@ -0,0 +1,103 @@
+"""Token usage accounting and the adaptive max_tokens governor."""
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import math
+import statistics
+from collections import defaultdict, deque
+from collections.abc import Callable
+from typing import TYPE_CHECKING, Any
+
+from homeassistant.core import CALLBACK_TYPE, callback
+
+from .cache import LRUCache
+from .const import DEFAULT_HISTORY_CACHE_SIZE, LOGGER
+
+if TYPE_CHECKING:
+    from yandex_ai_studio_sdk._models.completions.result import CompletionUsage
+
+USAGE_COUNTERS = ("input_tokens", "completion_tokens", "total_tokens")
+COMPLETION_HISTORY_SIZE = 100
+# Completions per origin needed before the governor limits max_tokens
+MIN_SAMPLES = 20
+GOVERNOR_PERCENTILE = 95
+GOVERNOR_HEADROOM = 1.5
+MIN_MAX_TOKENS = 64
+
+
+def _empty_counters() -> dict[str, int]:
+    return dict.fromkeys(("requests", *USAGE_COUNTERS), 0)
+
+
+class UsageTracker:
+    """Tokens used by a config entry, in total and per recent conversation."""
+
+    def __init__(self) -> None:
+        self.totals = _empty_counters()
+        self.conversations: LRUCache[str, dict[str, int]] = LRUCache(DEFAULT_HISTORY_CACHE_SIZE)
+        self._listeners: list[Callable[[], None]] = []
+
+    @callback
+    def async_add_listener(self, update_callback: Callable[[], None]) -> CALLBACK_TYPE:
+        """Call update_callback whenever usage changes."""
+        self._listeners.append(update_callback)
+
+        @callback
+        def remove_listener() -> None:
+            self._listeners.remove(update_callback)
+
+        return remove_listener
+
+    @callback
+    def async_record(self, conversation_id: str, usage: CompletionUsage) -> None:
+        """Add usage of a completion."""
+        conversation = self.conversations.get(conversation_id)
+        if conversation is None:
+            conversation = _empty_counters()
+            self.conversations.put(conversation_id, conversation)
+
+        for counters in (self.totals, conversation):
+            counters["requests"] += 1
+            counters["input_tokens"] += usage.input_text_tokens
+            counters["completion_tokens"] += usage.completion_tokens
+            counters["total_tokens"] += usage.total_tokens
+
+        for update_callback in list(self._listeners):
+            update_callback()
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return total and per-conversation counters."""
+        return {"totals": self.totals, "conversations": dict(self.conversations.items())}
+
+
+class MaxTokensGovernor:
+    """Pick max_tokens per request from recent completion lengths of its origin.
+
+    Short voice replies shouldn't reserve the budget of a long answer, so
+    governed origins get the 95th percentile of their recent completions
+    with some headroom, never more than the configured limit. A truncated
+    completion counts as one of the configured length, raising the limit.
+    """
+
+    def __init__(self) -> None:
+        self.completions: defaultdict[str, deque[int]] = defaultdict(
+            lambda: deque(maxlen=COMPLETION_HISTORY_SIZE))
+
+    def max_tokens(self, origin: str, configured: int) -> int:
+        """Return max_tokens for a request."""
+        samples = self.completions[origin]
+        if len(samples) < MIN_SAMPLES:
+            return configured
+        percentile = statistics.quantiles(samples, n=100)[GOVERNOR_PERCENTILE - 1]
+        return min(configured, max(MIN_MAX_TOKENS, math.ceil(percentile * GOVERNOR_HEADROOM)))
+
+    def record(self, origin: str, completion_tokens: int, truncated: bool, configured: int) -> None:
+        """Record the length of a completion."""
+        samples = self.completions[origin]
+        samples.append(configured if truncated else completion_tokens)
+        if truncated:
+            LOGGER.debug("%s completion was truncated at %d tokens", origin, completion_tokens)
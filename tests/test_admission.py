@@ -0,0 +1,149 @@
+"""Tests of admission of model calls."""
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import asyncio
+from types import MappingProxyType, SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+from homeassistant.exceptions import HomeAssistantError
+from yandex_ai_studio_sdk._models.completions.result import AlternativeStatus
+
+from custom_components.yandexgpt_conversation.accounts import (Account,
+                                                               AccountPool)
+from custom_components.yandexgpt_conversation.admission import \
+    AdmissionController
+from custom_components.yandexgpt_conversation.cache import (CachedAlternative,
+                                                            CachedResult)
+from custom_components.yandexgpt_conversation.client import (ChannelWarmer,
+                                                             SharedClient)
+from custom_components.yandexgpt_conversation.const import (
+    EXECUTION_MODE_DEFERRED, EXECUTION_MODE_STREAMING)
+from custom_components.yandexgpt_conversation.conversation import (
+    RequestOrigin, YandexGPTConversationEntity)
+from custom_components.yandexgpt_conversation.metrics import TurnTrace
+from custom_components.yandexgpt_conversation.resilience import CircuitBreaker
+
+ANSWER = CachedResult((CachedAlternative("Готово", AlternativeStatus.FINAL),))
+
+
+class FakeModel:
+    """Completions model answering right away."""
+
+    def configure(self, **kwargs) -> FakeModel:
+        return self
+
+    async def run_deferred(self, messages):
+        return SimpleNamespace(id="operation")
+
+    async def run_stream(self, messages):
+        yield ANSWER
+
+
+class FakePoller:
+    """Operation poller holding deferred operations until released."""
+
+    def __init__(self) -> None:
+        self.waiting = 0
+        self.done = asyncio.Event()
+
+    async def async_wait(self, operation, kind: str, timeout: float):
+        self.waiting += 1
+        await self.done.wait()
+        return ANSWER
+
+
+class FakeChatLog:
+    """Chat log consuming the delta stream."""
+
+    conversation_id = "conversation"
+
+    async def async_add_delta_content_stream(self, agent_id, stream):
+        async for delta in stream:
+            yield delta
+
+
+def _runtime_data(admission: AdmissionController) -> SimpleNamespace:
+    shared = SharedClient(key=("folder", "key", False, 0), client=MagicMock(), warmer=ChannelWarmer(MagicMock(), None))
+    return SimpleNamespace(
+        settings=SimpleNamespace(
+            fallback_model=None, model_name="yandexgpt", async_timeout=10, model_conf=MappingProxyType({})),
+        accounts=AccountPool([Account(folder_id="folder", shared=shared, model=FakeModel())]),
+        admission=admission,
+        breaker=CircuitBreaker(),
+        poller=FakePoller(),
+    )
+
+
+async def test_polling_automations_leave_slots_to_voice() -> None:
+    """Automations waiting for deferred operations don't hold admission slots."""
+    admission = AdmissionController(max_concurrency=2, max_queue=2)
+    runtime_data = _runtime_data(admission)
+    entity = YandexGPTConversationEntity(MagicMock(entry_id="entry", title="YandexGPT", options={}))
+    user_input = SimpleNamespace(agent_id="conversation.yandexgpt")
+
+    def complete(origin: RequestOrigin, execution_mode: str):
+        return entity._async_complete(
+            runtime_data, user_input, FakeChatLog(), [], None, execution_mode, origin, None, TurnTrace())
+
+    automations = [
+        asyncio.create_task(complete(RequestOrigin.AUTOMATION, EXECUTION_MODE_DEFERRED)) for _ in range(2)
+    ]
+    while runtime_data.poller.waiting < len(automations):
+        await asyncio.sleep(0)
+
+    stream_transformer, _fallback = await asyncio.wait_for(
+        complete(RequestOrigin.VOICE, EXECUTION_MODE_STREAMING), timeout=1)
+
+    assert stream_transformer.streamed
+    assert admission.waits[RequestOrigin.VOICE][-1] == 0
+    assert not any(automation.done() for automation in automations)
+
+    runtime_data.poller.done.set()
+    await asyncio.gather(*automations)
+    assert admission.running == 0
+
+
+async def test_displacing_cancelled_waiter() -> None:
+    """A waiter cancelled while queued is dropped instead of displaced."""
+    admission = AdmissionController(max_concurrency=1, max_queue=1)
+    slot = await admission.async_acquire(RequestOrigin.AUTOMATION, RequestOrigin.AUTOMATION.priority)
+
+    waiter = asyncio.create_task(
+        admission.async_acquire(RequestOrigin.AUTOMATION, RequestOrigin.AUTOMATION.priority))
+    await asyncio.sleep(0)
+    waiter.cancel()
+    # Started eagerly, the voice request gets to the queue before the cancelled task leaves it
+    voice = asyncio.Task(
+        admission.async_acquire(RequestOrigin.VOICE, RequestOrigin.VOICE.priority),
+        loop=asyncio.get_running_loop(),
+        eager_start=True,
+    )
+
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    slot.release()
+    (await voice).release()
+
+    assert admission.running == 0
+    assert not admission.rejected
+
+
+async def test_full_queue_rejects_less_important_requests() -> None:
+    """Without a less important waiter to displace, a request over the queue limit is rejected."""
+    admission = AdmissionController(max_concurrency=1, max_queue=1)
+    slot = await admission.async_acquire(RequestOrigin.VOICE, RequestOrigin.VOICE.priority)
+    waiter = asyncio.create_task(admission.async_acquire(RequestOrigin.VOICE, RequestOrigin.VOICE.priority))
+    await asyncio.sleep(0)
+
+    with pytest.raises(HomeAssistantError):
+        await admission.async_acquire(RequestOrigin.AUTOMATION, RequestOrigin.AUTOMATION.priority)
+
+    slot.release()
+    (await waiter).release()
+    assert admission.rejected == {RequestOrigin.AUTOMATION: 1}
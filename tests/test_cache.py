@@ -0,0 +1,54 @@
+"""Tests of the caches."""
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import pytest
+import voluptuous as vol
+from homeassistant.helpers import config_validation as cv
+
+from custom_components.yandexgpt_conversation.cache import (
+    UnsupportedSchemaError, schema_fingerprint)
+
+
+def test_fingerprint_is_stable() -> None:
+    """Schemas built twice from the same definition get the same fingerprint."""
+
+    def build() -> vol.Schema:
+        return vol.Schema({
+            vol.Required("name", description="Entity name"): cv.string,
+            vol.Optional("brightness"): vol.All(vol.Coerce(int), vol.Range(min=0, max=100)),
+            vol.Optional("domain"): vol.In(["light", "switch"]),
+        })
+
+    assert schema_fingerprint(build()) == schema_fingerprint(build())
+
+
+def test_fingerprint_includes_defaults() -> None:
+    """Tools differing only in a default get different fingerprints."""
+    fingerprints = {
+        schema_fingerprint(vol.Schema({vol.Optional("brightness", **default): int}))
+        for default in ({}, {"default": 50}, {"default": 100}, {"default": None})
+    }
+
+    assert len(fingerprints) == 4
+
+
+def test_fingerprint_rejects_unknown_defaults() -> None:
+    """Defaults without a stable fingerprint make the schema uncacheable."""
+    with pytest.raises(UnsupportedSchemaError):
+        schema_fingerprint(vol.Schema({vol.Optional("value", default=object()): object}))
+
+
+def test_fingerprint_rejects_unknown_validators() -> None:
+    """Validators without a known structure can't be fingerprinted by their repr."""
+
+    class Validator:
+        def __call__(self, value):
+            return value
+
+    with pytest.raises(UnsupportedSchemaError):
+        schema_fingerprint(vol.Schema({vol.Required("value"): Validator()}))